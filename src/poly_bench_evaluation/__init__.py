@@ -1,25 +1,33 @@
-from .docker_utils import DockerManager
-from .parsers.typescript_parsers import (
-    TypescriptBazelAngular,
-    TypescriptJest,
-    TypescriptMocha,
-    TypescriptMochaFileName,
-)
-from .polybench_data import AggregateOutput, PolyBenchInstance, PolyBenchOutput
-from .repo_utils import RepoManager
-from .scoring import aggregate_logs, instance_level_scoring, store_instance_level_output
+import importlib
 
-__all__ = [
-    "DockerManager",
-    "TypescriptBazelAngular",
-    "TypescriptJest",
-    "TypescriptMocha",
-    "TypescriptMochaFileName",
-    "RepoManager",
-    "aggregate_logs",
-    "instance_level_scoring",
-    "store_instance_level_output",
-    "PolyBenchInstance",
-    "PolyBenchOutput",
-    "AggregateOutput",
-]
+# The public names and their modules. They are imported on first access, so that importing a
+# submodule (e.g. for the CLI or a metrics-only job) doesn't pull in docker, datasets or the
+# tree-sitter parsers of the others.
+_LAZY_IMPORTS = {
+    "DockerManager": ".docker_utils",
+    "TypescriptBazelAngular": ".parsers.typescript_parsers",
+    "TypescriptJest": ".parsers.typescript_parsers",
+    "TypescriptMocha": ".parsers.typescript_parsers",
+    "TypescriptMochaFileName": ".parsers.typescript_parsers",
+    "RepoManager": ".repo_utils",
+    "aggregate_logs": ".scoring",
+    "instance_level_scoring": ".scoring",
+    "store_instance_level_output": ".scoring",
+    "PolyBenchInstance": ".polybench_data",
+    "PolyBenchOutput": ".polybench_data",
+    "AggregateOutput": ".polybench_data",
+}
+
+__all__ = list(_LAZY_IMPORTS)
+
+
+def __getattr__(name: str):
+    if name not in _LAZY_IMPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_LAZY_IMPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
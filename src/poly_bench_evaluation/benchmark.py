@@ -0,0 +1,648 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: CC-BY-NC-4.0
+"""Benchmark of the evaluation harness itself against a simulated docker daemon.
+
+Instance profiles (synthetic, or recorded in a run history) are replayed through
+evaluate_predictions with a SimulatedDockerClient that sleeps for the scaled build and run
+durations of every instance and streams test logs of the profiled size. Everything else (repo
+checkouts, scheduling, log handling, parsing, result storage, aggregation) runs for real, so the
+benchmark catches regressions of the orchestration without spending real build hours.
+
+With --imports it instead measures the import time of the entry points in fresh interpreters and
+reports the heavy dependencies they import before a code path needs them.
+
+Usage:
+    python -m poly_bench_evaluation.benchmark --sizes 100 1000 10000 --num-threads 1 4 16
+    python -m poly_bench_evaluation.benchmark --imports
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import multiprocessing
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from dataclasses import asdict, dataclass, fields, replace
+from pathlib import Path
+from queue import Empty
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+import docker
+import pandas as pd
+import requests
+from loguru import logger
+
+from poly_bench_evaluation.constants import REPO_TO_PARSER_CLASS
+from poly_bench_evaluation.history import RunHistory
+
+# Working directory of the simulated instance images
+SIMULATED_WORKDIR = "/testbed"
+# Size of the log chunks streamed by a simulated test run
+LOG_CHUNK_BYTES = 64 * 1024
+
+# Entry points and the heavy dependencies they only import when a code path needs them: datasets
+# for hub datasets, docker for container work, sklearn for the retrieval metrics and tree_sitter
+# for the node retrieval metrics
+DEFERRED_IMPORTS = {
+    "poly_bench_evaluation": ["datasets", "docker", "pandas", "sklearn", "tree_sitter"],
+    "poly_bench_evaluation.run_evaluation": ["datasets", "docker", "sklearn"],
+    "poly_bench_evaluation.scoring": ["datasets", "docker", "sklearn", "tree_sitter"],
+    "poly_bench_evaluation.metrics.metric_scoring": ["datasets", "docker", "sklearn"],
+    "poly_bench_evaluation.server": ["datasets", "docker", "sklearn"],
+}
+
+# Test logs are Maven Surefire reports, so synthetic profiles use repos with the Java parser
+_SYNTHETIC_REPOS = sorted(
+    repo for repo, parser in REPO_TO_PARSER_CLASS.items() if parser == "JavaGenericParser"
+)
+
+
+@dataclass
+class InstanceProfile:
+    """Simulated behavior of one instance evaluation."""
+
+    instance_id: str
+    repo: str
+    language: str
+    # Simulated seconds of a successful docker build and of the test run
+    build_seconds: float
+    run_seconds: float
+    # Size of the streamed test log
+    log_kb: int
+    # Number of tests in the test log, the first one is the fail-to-pass test
+    tests: int = 10
+    # Build attempts that fail before one succeeds, the instance fails after 3
+    build_failures: int = 0
+    # Whether the test run fails with a docker API error
+    run_error: bool = False
+    # Whether the fail-to-pass test passes
+    resolved: bool = True
+
+
+def synthetic_profiles(count: int, seed: int = 0) -> List[InstanceProfile]:
+    """Draw instance profiles with log-normal durations and log sizes and rare failures."""
+    rng = random.Random(seed)
+    profiles = []
+    for i in range(count):
+        build_failures = 0
+        while build_failures < 3 and rng.random() < 0.05:
+            build_failures += 1
+        profiles.append(
+            InstanceProfile(
+                instance_id=f"bench__{i:06d}",
+                repo=rng.choice(_SYNTHETIC_REPOS),
+                language="Java",
+                build_seconds=rng.lognormvariate(math.log(300), 0.5),
+                run_seconds=rng.lognormvariate(math.log(120), 0.8),
+                log_kb=max(1, int(rng.lognormvariate(math.log(64), 1.0))),
+                tests=rng.randint(2, 50),
+                build_failures=build_failures,
+                run_error=rng.random() < 0.01,
+                resolved=rng.random() < 0.5,
+            )
+        )
+    return profiles
+
+
+def load_profiles(path: str) -> List[InstanceProfile]:
+    """Load recorded instance profiles.
+
+    Args:
+        path: A JSONL file of InstanceProfile fields, or a run history whose recorded build and
+            run durations are replayed. Test logs of recorded profiles are Surefire reports, so
+            only the Java repos parse their tests.
+    """
+    if path.endswith(".jsonl"):
+        names = {f.name for f in fields(InstanceProfile)}
+        with open(path) as f:
+            return [
+                InstanceProfile(**{k: v for k, v in json.loads(line).items() if k in names})
+                for line in f
+                if line.strip()
+            ]
+
+    profiles = []
+    recorded = sorted(RunHistory(path).mean_durations().items())
+    for (instance_id, repo, language), stages in recorded:
+        if repo not in REPO_TO_PARSER_CLASS or "run" not in stages:
+            continue
+        profiles.append(
+            InstanceProfile(
+                instance_id=instance_id,
+                repo=repo,
+                language=language,
+                build_seconds=stages.get("build", 0.0),
+                run_seconds=stages["run"],
+                log_kb=64,
+            )
+        )
+    return profiles
+
+
+def replay_profiles(recorded: List[InstanceProfile], count: int) -> List[InstanceProfile]:
+    """Cycle through recorded profiles to get count instances with distinct ids."""
+    profiles = []
+    for i in range(count):
+        profile = recorded[i % len(recorded)]
+        profiles.append(replace(profile, instance_id=f"{profile.instance_id}__{i}"))
+    return profiles
+
+
+def surefire_log(profile: InstanceProfile) -> bytes:
+    """Build a Maven test log of about log_kb with a Surefire report of the profile tests."""
+    cases = []
+    for i in range(profile.tests):
+        failure = "<failure/>" if i == 0 and not profile.resolved else ""
+        cases.append(f'<testcase classname="bench.Test" name="test{i}">{failure}</testcase>')
+    report = f'<testsuite name="bench.Test">{"".join(cases)}</testsuite>\n'
+    filler_line = "[INFO] Downloaded from central: https://repo.maven.apache.org/maven2/x.jar\n"
+    filler_lines = max(0, (profile.log_kb * 1024 - len(report)) // len(filler_line))
+    return (filler_line * filler_lines + report).encode("utf-8")
+
+
+class _Image:
+    def __init__(self, tag: str):
+        self.id = "sha256:" + hashlib.sha256(tag.encode("utf-8")).hexdigest()
+        self.tags = [tag]
+        self.attrs = {"Config": {"WorkingDir": SIMULATED_WORKDIR}}
+
+
+class _ExecResult:
+    def __init__(self, exit_code: int, output: bytes = b""):
+        self.exit_code = exit_code
+        self.output = output
+
+
+class _Container:
+    def __init__(self, client: "SimulatedDockerClient", image: str, name: str):
+        self.client = client
+        self.image = image
+        self.name = name
+        self.id = hashlib.sha256(name.encode("utf-8")).hexdigest()
+        self.attrs = {"Image": _Image(image).id}
+
+    def start(self):
+        self.client._count("container_start")
+
+    def stop(self, timeout: int = 10):
+        self.client._count("container_stop")
+
+    def remove(self, force: bool = False):
+        self.client._count("container_remove")
+        with self.client._lock:
+            self.client._containers.pop(self.name, None)
+
+    def put_archive(self, path: str, data: bytes) -> bool:
+        self.client._count("put_archive")
+        return True
+
+    def exec_run(self, cmd, workdir: Optional[str] = None, user: str = "") -> _ExecResult:
+        self.client._count("exec_run")
+        return _ExecResult(exit_code=0)
+
+    def stats(self, stream: bool = False) -> Dict:
+        return {}
+
+
+class _Images:
+    def __init__(self, client: "SimulatedDockerClient"):
+        self.client = client
+
+    def get(self, name: str) -> _Image:
+        with self.client._lock:
+            if name not in self.client._images:
+                raise docker.errors.ImageNotFound(f"No such image: {name}")
+            return self.client._images[name]
+
+    def build(
+        self, tag: str, path: Optional[str] = None, fileobj=None, **kwargs
+    ) -> Tuple[_Image, Iterator[Dict]]:
+        if fileobj is not None:
+            # Read a streamed context like the daemon does
+            self.client._count("context_bytes", sum(len(chunk) for chunk in fileobj))
+        profile = self.client.profile_for_image(tag)
+        with self.client._lock:
+            attempt = self.client._build_attempts[tag]
+            self.client._build_attempts[tag] += 1
+        seconds = profile.build_seconds if profile is not None else 0.0
+        self.client._simulate("docker_build", seconds)
+        if profile is not None and attempt < profile.build_failures:
+            raise docker.errors.BuildError(
+                reason="simulated build failure", build_log=[{"error": "simulated"}]
+            )
+        image = _Image(tag)
+        with self.client._lock:
+            self.client._images[tag] = image
+        return image, iter([{"stream": f"Successfully tagged {tag}"}])
+
+    def remove(self, image: str, force: bool = False):
+        with self.client._lock:
+            self.client._images.pop(image, None)
+
+
+class _Containers:
+    def __init__(self, client: "SimulatedDockerClient"):
+        self.client = client
+
+    def get(self, name: str) -> _Container:
+        with self.client._lock:
+            if name not in self.client._containers:
+                raise docker.errors.NotFound(f"No such container: {name}")
+            return self.client._containers[name]
+
+    def create(self, image: str, name: str, **kwargs) -> _Container:
+        self.client._count("container_create")
+        container = _Container(self.client, image=image, name=name)
+        with self.client._lock:
+            if name in self.client._containers:
+                response = requests.Response()
+                response.status_code = 409
+                response.reason = "Conflict"
+                raise docker.errors.APIError(
+                    f"The container name {name} is already in use", response=response
+                )
+            self.client._containers[name] = container
+        return container
+
+
+class _Api:
+    def __init__(self, client: "SimulatedDockerClient"):
+        self.client = client
+
+    def exec_create(self, container_id: str, cmd: str, **kwargs) -> Dict[str, str]:
+        with self.client._lock:
+            container = next(c for c in self.client._containers.values() if c.id == container_id)
+            exec_id = f"exec_{len(self.client._execs)}"
+            self.client._execs[exec_id] = (container.image, cmd)
+        return {"Id": exec_id}
+
+    def exec_start(self, exec_id: str, stream: bool = False, demux: bool = False):
+        with self.client._lock:
+            image, cmd = self.client._execs[exec_id]
+        profile = self.client.profile_for_image(image)
+        if profile is None:
+            return iter([])
+        # The evaluation driver gets its marker as last argument and reports its steps
+        marker = cmd[-1] if isinstance(cmd, list) and cmd[1].endswith("driver.sh") else None
+        return self._stream(profile, marker)
+
+    def _stream(
+        self, profile: InstanceProfile, marker: Optional[str] = None
+    ) -> Iterator[Tuple[Optional[bytes], None]]:
+        if profile.run_error:
+            raise docker.errors.APIError("simulated docker daemon error")
+        if marker is not None:
+            for step in ("apply_code_patch", "reset_files", "apply_test_patch"):
+                yield f"\n{marker} {step} 0 0.0 0.0 \n".encode("utf-8"), None
+        log = surefire_log(profile)
+        chunks = max(1, math.ceil(len(log) / LOG_CHUNK_BYTES))
+        for i in range(chunks):
+            self.client._simulate("docker_run", profile.run_seconds / chunks)
+            yield log[i * LOG_CHUNK_BYTES : (i + 1) * LOG_CHUNK_BYTES], None
+        self.client._count("log_bytes", len(log))
+        if marker is not None:
+            yield f"\n{marker} run_tests 0 0.0 {profile.run_seconds} \n".encode("utf-8"), None
+
+    def exec_inspect(self, exec_id: str) -> Dict:
+        return {"ExitCode": 0}
+
+
+class SimulatedDockerClient:
+    """A stand-in for docker.DockerClient that simulates the daemon from instance profiles.
+
+    Builds and test runs sleep for their profiled durations times time_scale, so a time_scale
+    of 0 measures the orchestration alone. Images and containers only exist in memory.
+    """
+
+    def __init__(
+        self,
+        profiles: List[InstanceProfile],
+        time_scale: float = 0.001,
+        base_images: Tuple[str, ...] = ("java", "javascript", "typescript", "python"),
+    ):
+        self.time_scale = time_scale
+        self._profiles = {profile.instance_id.lower(): profile for profile in profiles}
+        self._lock = threading.Lock()
+        self._images: Dict[str, _Image] = {
+            f"polybench_{language}_base": _Image(f"polybench_{language}_base")
+            for language in base_images
+        }
+        self._containers: Dict[str, _Container] = {}
+        self._execs: Dict[str, Tuple[str, Union[str, List[str]]]] = {}
+        self._build_attempts: Dict[str, int] = defaultdict(int)
+        self.operations: Dict[str, int] = defaultdict(int)
+        # Unscaled simulated seconds per operation
+        self.simulated_seconds: Dict[str, float] = defaultdict(float)
+        self.images = _Images(self)
+        self.containers = _Containers(self)
+        self.api = _Api(self)
+
+    def profile_for_image(self, image_id: str) -> Optional[InstanceProfile]:
+        """Get the profile of an instance image named polybench_<language>_<instance id>."""
+        parts = image_id.split("_", 2)
+        return self._profiles.get(parts[2]) if len(parts) == 3 else None
+
+    def _count(self, operation: str, amount: int = 1):
+        with self._lock:
+            self.operations[operation] += amount
+
+    def _simulate(self, operation: str, seconds: float):
+        with self._lock:
+            self.operations[operation] += 1
+            self.simulated_seconds[operation] += seconds
+        if self.time_scale > 0 and seconds > 0:
+            time.sleep(seconds * self.time_scale)
+
+
+@dataclass
+class BenchmarkResult:
+    """Measurements of one benchmark scenario."""
+
+    instances: int
+    num_threads: int
+    time_scale: float
+    wall_seconds: float
+    # Instances per wall second
+    throughput: float
+    # Lower bound of the wall time: the scaled build or run time (whichever is larger) spread
+    # over num_threads workers
+    simulated_seconds: float
+    # Wall time not explained by the simulated docker work, per instance
+    overhead_ms_per_instance: float
+    resolved: int
+    failed: int
+    log_mb: float
+    # Peak resident set size of the process before and after the run
+    baseline_rss_mb: float
+    peak_rss_mb: float
+
+
+@dataclass
+class ImportResult:
+    """Import time of one entry point in a fresh interpreter."""
+
+    module: str
+    seconds: float
+    # Deferred dependencies the import loaded anyway
+    eager_imports: List[str]
+
+
+_IMPORT_PROBE = """
+import importlib, json, sys, time
+start = time.perf_counter()
+importlib.import_module(sys.argv[1])
+seconds = time.perf_counter() - start
+print(json.dumps({"seconds": seconds, "modules": sorted({m.split(".")[0] for m in sys.modules})}))
+"""
+
+
+def measure_import(module: str, deferred: Optional[List[str]] = None) -> ImportResult:
+    """Import a module in a fresh interpreter, so nothing is cached by earlier imports."""
+    output = subprocess.run(
+        [sys.executable, "-c", _IMPORT_PROBE, module],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    probe = json.loads(output.strip().splitlines()[-1])
+    deferred = DEFERRED_IMPORTS.get(module, []) if deferred is None else deferred
+    return ImportResult(
+        module=module,
+        seconds=probe["seconds"],
+        eager_imports=[name for name in deferred if name in probe["modules"]],
+    )
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024**2 if sys.platform == "darwin" else peak / 1024
+
+
+def prepare_repos(repo_path: Path, repos: List[str]) -> Dict[str, str]:
+    """Create a one-commit local base repo per repo, so checkouts need no network.
+
+    Returns:
+        The commit of every repo.
+    """
+    commits = {}
+    for repo in sorted(set(repos)):
+        repo_dir = repo_path / repo.split("/")[-1]
+        repo_dir.mkdir(parents=True, exist_ok=True)
+        (repo_dir / "Test.java").write_text("class Test {}\n")
+        git = ["git", "-C", str(repo_dir), "-c", "user.name=bench", "-c", "user.email=bench@bench"]
+        subprocess.run(git + ["init", "-q"], check=True)
+        subprocess.run(git + ["add", "."], check=True)
+        subprocess.run(git + ["commit", "-q", "-m", "base"], check=True)
+        commits[repo] = subprocess.run(
+            git + ["rev-parse", "HEAD"], check=True, capture_output=True, text=True
+        ).stdout.strip()
+    return commits
+
+
+def write_dataset(profiles: List[InstanceProfile], commits: Dict[str, str], path: Path):
+    """Write the dataset of the profiled instances as a CSV file for evaluate_predictions."""
+    patch = (
+        "diff --git a/Test.java b/Test.java\n--- a/Test.java\n+++ b/Test.java\n"
+        "@@ -1 +1 @@\n-class Test {}\n+class Test { }\n"
+    )
+    rows = [
+        {
+            "instance_id": profile.instance_id,
+            "repo": profile.repo,
+            "base_commit": commits[profile.repo],
+            "language": profile.language,
+            "task_category": "Bug Fix",
+            "patch": patch,
+            "test_patch": patch,
+            "Dockerfile": "FROM polybench_java_base",
+            "F2P": str(["bench.Test.test0"]),
+            "P2P": str([f"bench.Test.test{i}" for i in range(1, profile.tests)]),
+            "test_command": "mvn test",
+            "modified_nodes": json.dumps([]),
+        }
+        for profile in profiles
+    ]
+    pd.DataFrame(rows).to_csv(path, index=False)
+
+
+def run_scenario(
+    profiles: List[InstanceProfile], num_threads: int, time_scale: float, work_dir: str
+) -> BenchmarkResult:
+    """Evaluate the gold patches of the profiled instances against a simulated docker daemon.
+
+    Run logs and build logs are written to the current directory, as in a real run.
+    """
+    from poly_bench_evaluation.run_evaluation import evaluate_predictions
+
+    work_path = Path(work_dir)
+    repo_path = work_path / "repos"
+    result_path = work_path / "results"
+    dataset_path = work_path / "dataset.csv"
+    write_dataset(profiles, prepare_repos(repo_path, [p.repo for p in profiles]), dataset_path)
+    client = SimulatedDockerClient(profiles, time_scale=time_scale)
+
+    baseline_rss_mb = _peak_rss_mb()
+    started_at = time.perf_counter()
+    evaluate_predictions(
+        dataset_path=str(dataset_path),
+        predictions_path=None,
+        result_path=str(result_path),
+        num_threads=num_threads,
+        evaluate_gold=True,
+        repo_path=str(repo_path),
+        delete_image=True,
+        skip_existing=False,
+        history_path=str(work_path / "run_history.sqlite"),
+        result_cache_path=None,
+        client=client,
+    )
+    wall_seconds = time.perf_counter() - started_at
+
+    # The aggregate is written to the current directory
+    with open("result.json") as f:
+        aggregate = json.load(f)
+    simulated_seconds = (
+        max(client.simulated_seconds["docker_build"], client.simulated_seconds["docker_run"])
+        * time_scale
+        / num_threads
+    )
+    instances = len(profiles)
+    return BenchmarkResult(
+        instances=instances,
+        num_threads=num_threads,
+        time_scale=time_scale,
+        wall_seconds=wall_seconds,
+        throughput=instances / wall_seconds if wall_seconds else 0.0,
+        simulated_seconds=simulated_seconds,
+        overhead_ms_per_instance=max(0.0, wall_seconds - simulated_seconds) * 1000 / instances,
+        resolved=aggregate["total_resolved"],
+        failed=instances - len(list(result_path.glob("*_result.json"))),
+        log_mb=client.operations["log_bytes"] / 1024**2,
+        baseline_rss_mb=baseline_rss_mb,
+        peak_rss_mb=_peak_rss_mb(),
+    )
+
+
+def _scenario_process(profiles, num_threads, time_scale, work_dir, log_level, queue):
+    # Relative run and build log directories go to the work directory
+    os.chdir(work_dir)
+    from poly_bench_evaluation import run_evaluation  # noqa: F401 (configures the logger)
+
+    logger.remove()
+    logger.add(sink=sys.stderr, level=log_level)
+    # Leave stdout to the benchmark report instead of the per-scenario result summaries
+    sys.stdout = open(os.devnull, "w")
+    queue.put(run_scenario(profiles, num_threads, time_scale, work_dir))
+
+
+def measure_scenario(
+    profiles: List[InstanceProfile],
+    num_threads: int,
+    time_scale: float,
+    log_level: str = "WARNING",
+) -> BenchmarkResult:
+    """Run a scenario in a fresh process, so its peak RSS isn't shared with other scenarios."""
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    with tempfile.TemporaryDirectory(prefix="polybench_benchmark_") as work_dir:
+        process = context.Process(
+            target=_scenario_process,
+            args=(profiles, num_threads, time_scale, work_dir, log_level, queue),
+        )
+        process.start()
+        try:
+            while True:
+                try:
+                    return queue.get(timeout=1)
+                except Empty:
+                    if not process.is_alive():
+                        raise RuntimeError(
+                            f"Benchmark scenario failed with exit code {process.exitcode}"
+                        )
+        finally:
+            process.join()
+
+
+def _print_results(results: List[BenchmarkResult]):
+    header = (
+        f"{'instances':>9} {'threads':>7} {'wall s':>8} {'inst/s':>8} {'sim s':>8} "
+        f"{'ovh ms/inst':>11} {'failed':>6} {'log MB':>7} {'RSS MB':>7} {'peak RSS MB':>11}"
+    )
+    print(header)
+    for r in results:
+        print(
+            f"{r.instances:>9} {r.num_threads:>7} {r.wall_seconds:>8.1f} {r.throughput:>8.1f} "
+            f"{r.simulated_seconds:>8.1f} {r.overhead_ms_per_instance:>11.2f} {r.failed:>6} "
+            f"{r.log_mb:>7.1f} {r.baseline_rss_mb:>7.0f} {r.peak_rss_mb:>11.0f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[100, 1000],
+        help="Numbers of instances to evaluate, e.g. 100 1000 10000 for a scaling curve.",
+    )
+    parser.add_argument("--num-threads", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument(
+        "--time-scale",
+        type=float,
+        default=0.001,
+        help="Wall seconds per simulated docker second; 0 measures the orchestration alone.",
+    )
+    parser.add_argument(
+        "--profiles",
+        type=str,
+        default=None,
+        help="Recorded profiles: a JSONL file of InstanceProfile fields or a run history. "
+        "Sizes larger than the recording cycle through it. Default: synthetic profiles.",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=str, default=None, help="JSON file for the results.")
+    parser.add_argument("--log-level", type=str, default="WARNING")
+    parser.add_argument(
+        "--imports",
+        action="store_true",
+        help="Measure the import time of the entry points instead of evaluation scenarios.",
+    )
+    args = parser.parse_args()
+
+    if args.imports:
+        import_results = [measure_import(module) for module in DEFERRED_IMPORTS]
+        for r in import_results:
+            eager = ", ".join(r.eager_imports) or "-"
+            print(f"{r.module:<45} {r.seconds * 1000:>8.0f} ms  eager: {eager}")
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump([asdict(r) for r in import_results], f, indent=4)
+        sys.exit(1 if any(r.eager_imports for r in import_results) else 0)
+
+    recorded = load_profiles(args.profiles) if args.profiles else None
+    results = []
+    for size in args.sizes:
+        if recorded:
+            profiles = replay_profiles(recorded, size)
+        else:
+            profiles = synthetic_profiles(size, seed=args.seed)
+        for num_threads in args.num_threads:
+            result = measure_scenario(profiles, num_threads, args.time_scale, args.log_level)
+            results.append(result)
+            _print_results([result])
+
+    print()
+    _print_results(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump([asdict(r) for r in results], f, indent=4)
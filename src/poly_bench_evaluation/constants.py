@@ -1,8 +1,55 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: CC-BY-NC-4.0
+# Test run timeouts of instances without recorded gold runs
 JAVA_TIMEOUT = 1200
 DEFAULT_TIMEOUT = 340
 
+# Learned test run timeouts: the percentile of the recorded run durations of the instance (or
+# of the gold runs of its repo), times the margin plus the slack, capped at the ceiling and
+# never below the language default
+RUN_TIMEOUT_PERCENTILE = 95
+RUN_TIMEOUT_MARGIN = 1.5
+RUN_TIMEOUT_SLACK_SECONDS = 60
+RUN_TIMEOUT_CEILING_SECONDS = 3600
+# Recorded runs of an instance, or gold runs of a repo, needed before their percentile is used
+RUN_TIMEOUT_MIN_REPO_SAMPLES = 3
+
+# Expected (build_seconds, run_seconds) of an instance without recorded history
+LANGUAGE_DEFAULT_DURATIONS = {
+    "Java": (900.0, 600.0),
+    "JavaScript": (600.0, 200.0),
+    "TypeScript": (1200.0, 300.0),
+    "Python": (400.0, 150.0),
+}
+
+# Expected size in GB of an instance image of a repo without local images, from the ~5TB of
+# all instance images
+LANGUAGE_DEFAULT_IMAGE_GB = {
+    "Java": 2.5,
+    "JavaScript": 2.0,
+    "TypeScript": 3.5,
+    "Python": 2.0,
+}
+
+# Declared resource weight of one container run as (cpus, memory_gb, disk_gb)
+LANGUAGE_RESOURCE_WEIGHTS = {
+    "Java": (4.0, 8.0, 10.0),
+    "JavaScript": (2.0, 4.0, 8.0),
+    "TypeScript": (4.0, 8.0, 15.0),
+    "Python": (1.0, 3.0, 8.0),
+}
+
+# Repos that deviate strongly from their language default
+REPO_RESOURCE_WEIGHTS = {
+    "google/gson": (1.0, 2.0, 2.0),
+    "trinodb/trino": (8.0, 16.0, 25.0),
+    "apache/dubbo": (6.0, 12.0, 15.0),
+    "angular/angular": (8.0, 16.0, 30.0),
+    "microsoft/vscode": (4.0, 12.0, 20.0),
+    "huggingface/transformers": (2.0, 8.0, 20.0),
+    "tensorflow/models": (2.0, 8.0, 20.0),
+}
+
 REPO_TO_PARSER_CLASS = {
     "google/guava": "JavaGenericParser",
     "google/gson": "JavaGenericParser",
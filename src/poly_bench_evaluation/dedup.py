@@ -0,0 +1,175 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: CC-BY-NC-4.0
+import hashlib
+import re
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+from loguru import logger
+
+# Predictions column naming the model (or agent checkpoint) that generated a patch
+SUBMITTER_COLUMN = "model_name_or_path"
+# Predictions column with several candidate patches of an instance (best-of-n / pass@k)
+CANDIDATES_COLUMN = "model_patches"
+# Every candidate of a submitter is evaluated as the submitter "<submitter>__sample_<i>"
+_SAMPLE_PATTERN = re.compile(r"(.+)__sample_(\d+)")
+
+
+def sample_submitter(submitter: str, index: int) -> str:
+    """Get the submitter name of the index-th candidate of a submitter."""
+    return f"{submitter}__sample_{index}"
+
+
+def sample_family(name: str) -> Optional[str]:
+    """Get the submitter a sample submitter (or its result directory) belongs to, if any."""
+    match = _SAMPLE_PATTERN.fullmatch(name)
+    return match.group(1) if match else None
+
+
+def normalize_patch(patch: str) -> str:
+    """Normalize a patch so whitespace-equivalent patches compare equal.
+
+    Line endings, trailing whitespace, blank leading and trailing lines and git index lines
+    (blob hashes) are normalized away.
+    """
+    lines = [
+        line.rstrip()
+        for line in patch.replace("\r\n", "\n").split("\n")
+        if not line.startswith("index ")
+    ]
+    return "\n".join(lines).strip("\n")
+
+
+def patch_hash(patch: str) -> str:
+    """Get the canonical hash of a patch."""
+    return hashlib.sha256(normalize_patch(patch).encode("utf-8")).hexdigest()
+
+
+@dataclass
+class PatchGroup:
+    """Equivalent patches for one instance, evaluated once for all their submitters."""
+
+    # The first submitted patch of the group, evaluated as is
+    model_patch: str
+    submitters: List[str] = field(default_factory=list)
+
+
+@dataclass
+class DedupStats:
+    """How many evaluations the deduplication saves."""
+
+    # Non-empty (instance, submitter) predictions
+    predictions: int
+    # Distinct non-empty patches that are evaluated
+    distinct_patches: int
+
+    @property
+    def ratio(self) -> float:
+        """Fraction of the non-empty predictions that reuse another evaluation."""
+        if self.predictions == 0:
+            return 0.0
+        return 1 - self.distinct_patches / self.predictions
+
+
+def load_predictions(predictions_paths: List[str]) -> pd.DataFrame:
+    """Load one or more prediction files into one frame with a submitter per prediction.
+
+    The submitter is the model_name_or_path of a prediction, or the file name without extension
+    if the file has no such column. Predictions with a model_patches list instead of a
+    model_patch hold several candidates, which become the submitters
+    "<submitter>__sample_<i>".
+    """
+    frames = []
+    for predictions_path in predictions_paths:
+        predictions = pd.read_json(predictions_path, lines=True)
+
+        assert (
+            "model_patch" in predictions.columns or CANDIDATES_COLUMN in predictions.columns
+        ), "model_patch column not found in predictions file."
+        assert (
+            "instance_id" in predictions.columns
+        ), "instance_id column not found in predictions file."
+
+        if SUBMITTER_COLUMN not in predictions.columns:
+            predictions[SUBMITTER_COLUMN] = Path(predictions_path).stem
+        if CANDIDATES_COLUMN in predictions.columns:
+            predictions = _explode_candidates(predictions)
+        frames.append(predictions[["instance_id", "model_patch", SUBMITTER_COLUMN]])
+
+    predictions = pd.concat(frames, ignore_index=True)
+    predictions[SUBMITTER_COLUMN] = predictions[SUBMITTER_COLUMN].astype(str)
+    predictions.fillna({"model_patch": ""}, inplace=True)
+
+    duplicated = predictions.duplicated(["instance_id", SUBMITTER_COLUMN])
+    if duplicated.any():
+        logger.warning(
+            f"Ignoring {int(duplicated.sum())} repeated predictions of the same instance and "
+            "submitter, the first one is kept."
+        )
+        predictions = predictions[~duplicated]
+    return predictions
+
+
+def _explode_candidates(predictions: pd.DataFrame) -> pd.DataFrame:
+    """Turn every candidate of a model_patches list into the prediction of a sample submitter.
+
+    A prediction with a single model_patch is the first sample of its submitter.
+    """
+    rows = []
+    for row in predictions.to_dict("records"):
+        candidates = row.get(CANDIDATES_COLUMN)
+        if not isinstance(candidates, list):
+            candidates = [row.get("model_patch", "")]
+        for index, model_patch in enumerate(candidates):
+            rows.append(
+                {
+                    "instance_id": row["instance_id"],
+                    "model_patch": model_patch if isinstance(model_patch, str) else "",
+                    SUBMITTER_COLUMN: sample_submitter(str(row[SUBMITTER_COLUMN]), index),
+                }
+            )
+    return pd.DataFrame(rows, columns=["instance_id", "model_patch", SUBMITTER_COLUMN])
+
+
+def group_predictions(
+    predictions: pd.DataFrame, instance_ids: Iterable[str]
+) -> Tuple[Dict[str, List[PatchGroup]], DedupStats]:
+    """Group the equivalent predictions of every instance.
+
+    Submitters without a prediction for an instance get an empty patch, as a single
+    predictions file would.
+
+    Args:
+        predictions: Predictions loaded with load_predictions.
+        instance_ids: The instances to evaluate.
+    Returns:
+        The patch groups of every instance, in submitter order, and the dedup statistics.
+    """
+    submitters = list(dict.fromkeys(predictions[SUBMITTER_COLUMN]))
+    patches = {
+        (row.instance_id, getattr(row, SUBMITTER_COLUMN)): row.model_patch
+        for row in predictions.itertuples(index=False)
+    }
+
+    groups: Dict[str, List[PatchGroup]] = {}
+    total = 0
+    distinct = 0
+    for instance_id in instance_ids:
+        by_hash: Dict[str, PatchGroup] = {}
+        for submitter in submitters:
+            model_patch = patches.get((instance_id, submitter), "")
+            if not isinstance(model_patch, str):
+                model_patch = ""
+            key = patch_hash(model_patch)
+            if key not in by_hash:
+                by_hash[key] = PatchGroup(model_patch=model_patch)
+                if model_patch.strip():
+                    distinct += 1
+            by_hash[key].submitters.append(submitter)
+            if model_patch.strip():
+                total += 1
+        groups[instance_id] = list(by_hash.values())
+
+    return groups, DedupStats(predictions=total, distinct_patches=distinct)
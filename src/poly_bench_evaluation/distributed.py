@@ -0,0 +1,439 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: CC-BY-NC-4.0
+import argparse
+import json
+import multiprocessing
+import socket
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional
+
+from loguru import logger
+
+from poly_bench_evaluation.history import RunHistory
+from poly_bench_evaluation.polybench_data import PolyBenchInstance
+from poly_bench_evaluation.result_cache import ResultCache
+
+if TYPE_CHECKING:
+    import docker
+
+# Seconds a lease stays valid without being renewed by its worker
+DEFAULT_LEASE_SECONDS = 300
+# Number of times an instance is handed out before it is marked as failed
+DEFAULT_MAX_ATTEMPTS = 2
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS work (
+    instance_id TEXT PRIMARY KEY,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    metrics TEXT,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+@dataclass
+class WorkerOptions:
+    """Evaluation settings shared by every worker of a distributed run."""
+
+    evaluate_gold: bool
+    repo_path: str
+    delete_image: bool
+    retrieval_metrics_only: bool = False
+    node_retrieval_metrics: bool = False
+    # Result cache shared by the workers, None disables it
+    result_cache_path: Optional[str] = None
+    # Run history with the stage durations and gold baselines, None disables it
+    history_path: Optional[str] = None
+    # Whether the test run timeouts are learned from the runs in the run history
+    adaptive_timeouts: bool = False
+
+
+class WorkQueue:
+    """A SQLite backed queue of instances that workers lease, evaluate and report back.
+
+    Leases expire unless renewed, so instances held by a dead worker are handed out again.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        lease_seconds: int = DEFAULT_LEASE_SECONDS,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+    ):
+        self.db_path = str(Path(db_path).expanduser())
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=60, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @contextmanager
+    def _transaction(self):
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def set_options(self, options: WorkerOptions):
+        """Store the evaluation settings for workers attaching to this queue."""
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('options', ?)",
+                (json.dumps(asdict(options)),),
+            )
+
+    def get_options(self) -> WorkerOptions:
+        """Get the evaluation settings stored by the coordinator."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'options'").fetchone()
+        if row is None:
+            raise ValueError(f"No evaluation options found in work queue {self.db_path}.")
+        return WorkerOptions(**json.loads(row[0]))
+
+    def enqueue(self, instances: Iterable[PolyBenchInstance]) -> int:
+        """Add instances to the queue. Instances that are already queued are left untouched.
+
+        Returns:
+            The number of newly queued instances.
+        Raises:
+            ValueError: If an instance is already queued with a different payload, e.g. a changed
+                prediction, since the queue would keep evaluating the old one.
+        """
+        rows = [(instance.instance_id, instance.model_dump_json()) for instance in instances]
+        with self._transaction() as conn:
+            queued = dict(conn.execute("SELECT instance_id, payload FROM work"))
+            changed = sorted(
+                instance_id
+                for instance_id, payload in rows
+                if instance_id in queued and queued[instance_id] != payload
+            )
+            if changed:
+                raise ValueError(
+                    f"{len(changed)} instances are queued in {self.db_path} with different "
+                    f"predictions or settings: {changed[:10]}. Use a new queue database."
+                )
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO work (instance_id, payload) VALUES (?, ?)", rows
+            )
+            return conn.total_changes - before
+
+    def lease(self, worker_id: str) -> Optional[PolyBenchInstance]:
+        """Lease the next pending instance, reassigning expired leases first.
+
+        Returns:
+            The leased instance or None if nothing is pending.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            self._reap_expired(conn, now)
+            row = conn.execute(
+                "SELECT instance_id, payload FROM work WHERE status = 'pending' "
+                "ORDER BY rowid LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE work SET status = 'leased', worker = ?, lease_expires = ?, "
+                "attempts = attempts + 1 WHERE instance_id = ?",
+                (worker_id, now + self.lease_seconds, row[0]),
+            )
+        return PolyBenchInstance.model_validate_json(row[1])
+
+    def renew(self, instance_id: str, worker_id: str) -> bool:
+        """Extend the lease of an instance held by the given worker.
+
+        Returns:
+            False if the worker lost the lease.
+        """
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE work SET lease_expires = ? WHERE instance_id = ? AND worker = ? "
+                "AND status = 'leased'",
+                (time.time() + self.lease_seconds, instance_id, worker_id),
+            )
+            return cursor.rowcount == 1
+
+    def complete(
+        self, instance_id: str, worker_id: str, result: Optional[str], metrics: Optional[str]
+    ):
+        """Report the result and metrics json of an evaluated instance."""
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE work SET status = 'done', result = ?, metrics = ?, lease_expires = NULL, "
+                "error = NULL WHERE instance_id = ? AND worker = ?",
+                (result, metrics, instance_id, worker_id),
+            )
+
+    def fail(self, instance_id: str, worker_id: str, error: str):
+        """Report a failed evaluation. The instance is retried until max_attempts is reached."""
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE work SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                "lease_expires = NULL, error = ? WHERE instance_id = ? AND worker = ?",
+                (self.max_attempts, error, instance_id, worker_id),
+            )
+
+    def _reap_expired(self, conn: sqlite3.Connection, now: float):
+        cursor = conn.execute(
+            "UPDATE work SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+            "error = 'lease expired' WHERE status = 'leased' AND lease_expires < ?",
+            (self.max_attempts, now),
+        )
+        if cursor.rowcount:
+            logger.warning(f"Reassigned {cursor.rowcount} expired leases")
+
+    def counts(self) -> Dict[str, int]:
+        """Get the number of instances per status."""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT status, COUNT(*) FROM work GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+    def is_drained(self) -> bool:
+        """Whether no instance is pending or leased anymore."""
+        counts = self.counts()
+        return counts.get("pending", 0) == 0 and counts.get("leased", 0) == 0
+
+    def write_results(self, result_path: str) -> List[str]:
+        """Write the reported results of all finished instances to the result directory.
+
+        Returns:
+            The ids of the instances that failed on every attempt.
+        """
+        output_path = Path(result_path)
+        output_path.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            rows = conn.execute("SELECT instance_id, status, result, metrics FROM work").fetchall()
+
+        failed = []
+        for instance_id, status, result, metrics in rows:
+            if status == "failed":
+                failed.append(instance_id)
+            if result is not None:
+                (output_path / f"{instance_id}_result.json").write_text(result)
+            if metrics is not None:
+                (output_path / f"{instance_id}_metrics.json").write_text(metrics)
+        return failed
+
+
+def _read_if_exists(path: Path) -> Optional[str]:
+    return path.read_text() if path.exists() else None
+
+
+def _worker_thread(
+    work_queue: WorkQueue,
+    worker_id: str,
+    client: "docker.DockerClient",
+    options: WorkerOptions,
+    base_images: Dict[str, bool],
+    base_images_lock: threading.Lock,
+):
+    # Imported here since run_evaluation imports this module, and its coordinator needs neither
+    from poly_bench_evaluation.docker_utils import DockerManager
+    from poly_bench_evaluation.run_evaluation import evaluate_instance
+
+    result_cache = ResultCache(options.result_cache_path) if options.result_cache_path else None
+    history = RunHistory(options.history_path) if options.history_path else None
+    run_timeouts = history.estimates() if history and options.adaptive_timeouts else None
+    while True:
+        instance = work_queue.lease(worker_id)
+        if instance is None:
+            if work_queue.is_drained():
+                return
+            # Other workers still hold leases that may expire
+            time.sleep(10)
+            continue
+
+        stop_renewing = threading.Event()
+
+        def renew_lease(instance_id: str, stop_renewing: threading.Event):
+            while not stop_renewing.wait(work_queue.lease_seconds / 3):
+                if not work_queue.renew(instance_id, worker_id):
+                    logger.warning(f"Lost lease of {instance_id}")
+                    return
+
+        renewer = threading.Thread(
+            target=renew_lease, args=(instance.instance_id, stop_renewing), daemon=True
+        )
+        renewer.start()
+        try:
+            if instance.language != "Python" and not options.retrieval_metrics_only:
+                with base_images_lock:
+                    if not base_images.get(instance.language):
+                        DockerManager(
+                            image_id=f"polybench_{instance.language.lower()}_base",
+                            delete_image=False,
+                            client=client,
+                        ).build_base_image(language=instance.language)
+                        base_images[instance.language] = True
+
+            with tempfile.TemporaryDirectory() as tmp_result_path:
+                evaluate_instance(
+                    instance=instance,
+                    result_path=tmp_result_path,
+                    evaluate_gold=options.evaluate_gold,
+                    repo_path=options.repo_path,
+                    delete_image=options.delete_image,
+                    client=client,
+                    retrieval_metrics_only=options.retrieval_metrics_only,
+                    node_retrieval_metrics=options.node_retrieval_metrics,
+                    result_cache=result_cache,
+                    history=history,
+                    run_timeouts=run_timeouts,
+                )
+                work_queue.complete(
+                    instance_id=instance.instance_id,
+                    worker_id=worker_id,
+                    result=_read_if_exists(
+                        Path(tmp_result_path) / f"{instance.instance_id}_result.json"
+                    ),
+                    metrics=_read_if_exists(
+                        Path(tmp_result_path) / f"{instance.instance_id}_metrics.json"
+                    ),
+                )
+        except Exception as e:
+            logger.exception(f"Evaluation of {instance.instance_id} failed on {worker_id}: {e}")
+            work_queue.fail(instance.instance_id, worker_id, error=str(e))
+        finally:
+            stop_renewing.set()
+
+
+def run_worker(queue_db: str, docker_host: Optional[str] = None, num_threads: int = 1):
+    """Lease and evaluate instances from a work queue until it is drained.
+
+    Args:
+        queue_db: Path to the SQLite work queue created by the coordinator.
+        docker_host: Docker daemon to run on, e.g. "ssh://user@build-box" or "tcp://host:2375".
+            Defaults to the daemon configured in the environment.
+        num_threads: Number of instances evaluated concurrently by this worker.
+    """
+    import docker
+
+    work_queue = WorkQueue(queue_db)
+    options = work_queue.get_options()
+    if docker_host:
+        client = docker.DockerClient(base_url=docker_host, timeout=720)
+    else:
+        client = docker.from_env(timeout=720)
+
+    worker_name = f"{socket.gethostname()}:{docker_host or 'local'}:{uuid.uuid4().hex[:8]}"
+    logger.info(f"Worker {worker_name} started with {num_threads} threads")
+
+    base_images: Dict[str, bool] = {}
+    base_images_lock = threading.Lock()
+    threads = [
+        threading.Thread(
+            target=_worker_thread,
+            args=(
+                work_queue,
+                f"{worker_name}/{n}",
+                client,
+                options,
+                base_images,
+                base_images_lock,
+            ),
+        )
+        for n in range(num_threads)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    logger.info(f"Worker {worker_name} finished")
+
+
+def run_coordinator(
+    instances: Iterable[PolyBenchInstance],
+    queue_db: str,
+    docker_hosts: List[str],
+    result_path: str,
+    options: WorkerOptions,
+    threads_per_host: int = 1,
+    poll_interval: int = 30,
+):
+    """Queue instances and evaluate them with one worker process per docker host.
+
+    Workers started elsewhere with `python -m poly_bench_evaluation.distributed` on the same
+    queue database join the run as well.
+
+    Args:
+        instances: The instances to evaluate.
+        queue_db: Path to the SQLite work queue. An existing queue is resumed.
+        docker_hosts: Docker daemons to spread the evaluation over.
+        result_path: Directory where the instance level results are written.
+        options: Evaluation settings for the workers.
+        threads_per_host: Number of instances evaluated concurrently per docker host.
+        poll_interval: Seconds between two progress reports.
+    Raises:
+        RuntimeError: If all worker processes exited while work was left.
+    """
+    work_queue = WorkQueue(queue_db)
+    work_queue.set_options(options)
+    queued = work_queue.enqueue(instances)
+    logger.info(f"Queued {queued} new instances in {queue_db}: {work_queue.counts()}")
+
+    context = multiprocessing.get_context("spawn")
+    workers = [
+        context.Process(
+            target=run_worker,
+            kwargs={"queue_db": queue_db, "docker_host": host, "num_threads": threads_per_host},
+            name=f"worker-{host}",
+        )
+        for host in docker_hosts
+    ]
+    for worker in workers:
+        worker.start()
+
+    while not work_queue.is_drained():
+        if workers and not any(worker.is_alive() for worker in workers):
+            raise RuntimeError(
+                f"All workers exited before the queue was drained: {work_queue.counts()}"
+            )
+        logger.info(f"Distributed evaluation progress: {work_queue.counts()}")
+        time.sleep(poll_interval)
+
+    for worker in workers:
+        worker.join()
+
+    failed = work_queue.write_results(result_path)
+    if failed:
+        logger.error(f"{len(failed)} instances failed on every attempt: {failed}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Attach a worker to a distributed evaluation.")
+    parser.add_argument("--queue-db", type=str, required=True)
+    parser.add_argument("--docker-host", type=str, default=None, required=False)
+    parser.add_argument("--num-threads", type=int, default=1, required=False)
+    args = parser.parse_args()
+
+    run_worker(queue_db=args.queue_db, docker_host=args.docker_host, num_threads=args.num_threads)
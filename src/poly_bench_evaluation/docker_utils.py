@@ -1,32 +1,299 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: CC-BY-NC-4.0
+import base64
 import io
 import json
+import os
+import posixpath
+import re
+import shutil
+import subprocess
 import tarfile
 import tempfile
 import threading
 import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
 from pathlib import Path
-from typing import List, Literal
+from typing import (
+    IO,
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
 
-import docker
 from loguru import logger
 from .constants import LANGUAGE_TO_BASE_DOCKERFILE
+from .log_capture import LogCapture
+
+if TYPE_CHECKING:
+    import docker
+
+# Seconds between two container stats samples during a run
+STATS_INTERVAL = 15
+# Seconds a warm container is kept in a ContainerPool without being used
+WARM_CONTAINER_IDLE_SECONDS = 600
+# Backends of DockerManager.docker_build: the legacy builder of the docker API, or BuildKit
+# through the docker buildx CLI
+BUILD_BACKENDS = ("docker", "buildx")
+# Bytes of a streamed build context sent to the docker API at a time
+BUILD_CONTEXT_CHUNK_BYTES = 1 << 20
+
+# Record the working tree of a fresh container, including what the image build changed, in a
+# separate index, so the repo index and HEAD stay untouched. The ignored files (dependencies,
+# build outputs) are listed, to tell them apart from the ignored files of later runs.
+WORKTREE_SNAPSHOT_COMMAND = (
+    'cd "$(git rev-parse --show-toplevel)" && '
+    "cp .git/index /tmp/polybench_snapshot.index && "
+    "GIT_INDEX_FILE=/tmp/polybench_snapshot.index git add -A && "
+    "git ls-files -z --others --ignored --exclude-standard | LC_ALL=C sort -z "
+    "> /tmp/polybench_snapshot.ignored"
+)
+# Ignored files that are not in the snapshot, NUL separated
+_NEW_IGNORED_FILES = (
+    "git ls-files -z --others --ignored --exclude-standard | LC_ALL=C sort -z | "
+    "LC_ALL=C comm -z -23 - /tmp/polybench_snapshot.ignored"
+)
+# Restore the snapshot: rewrite the tracked files that changed or were deleted since, remove the
+# new untracked files and the new ignored files. The ignored files of the snapshot are kept warm,
+# even if a run changed them, and directories emptied by the reset are left in place.
+WORKTREE_RESET_COMMAND = (
+    'cd "$(git rev-parse --show-toplevel)" && '
+    "export GIT_INDEX_FILE=/tmp/polybench_reset.index && "
+    "cp /tmp/polybench_snapshot.index $GIT_INDEX_FILE && "
+    "git diff --name-only -z | git checkout-index -f -z --stdin && "
+    "git clean -fdq && "
+    f"{_NEW_IGNORED_FILES} | xargs -0 -r rm -f"
+)
+# Check that the working tree matches the snapshot again, with no untracked or new ignored files
+WORKTREE_CHECK_COMMAND = (
+    'cd "$(git rev-parse --show-toplevel)" && '
+    "export GIT_INDEX_FILE=/tmp/polybench_reset.index && "
+    "git diff --quiet && "
+    'test -z "$(git ls-files --others --exclude-standard)" && '
+    f"! {_NEW_IGNORED_FILES} | grep -qz ."
+)
+
+# Directory the evaluation bundle is extracted to in the container, outside of the repo
+BUNDLE_DIR = "/tmp/polybench_bundle"
+# Applies the patches of an evaluation and runs its tests in a single exec. Every step is
+# reported on stdout on a line of its own: "<marker> <step> <exit code> <start> <end> <output>",
+# with the step output base64 encoded. The test output itself is streamed as is.
+EVALUATION_DRIVER_SCRIPT = r"""#!/bin/bash
+marker="$1"
+bundle="$(dirname "$0")"
+
+now() {
+    echo "${EPOCHREALTIME:-$(date +%s.%N)}"
+}
+
+report() {
+    printf '\n%s %s %s %s %s %s\n' "$marker" "$1" "$2" "$3" "$(now)" "$4"
+}
+
+step() {
+    local name="$1" started exit_code
+    shift
+    started="$(now)"
+    "$@" > "$bundle/$name.log" 2>&1
+    exit_code=$?
+    report "$name" "$exit_code" "$started" "$(base64 -w0 < "$bundle/$name.log")"
+    return $exit_code
+}
+
+apply_patch() {
+    git apply -v --ignore-whitespace --reject "$1" && return 0
+    patch --batch --fuzz=5 -p1 -f -i "$1"
+}
+
+reset_files() {
+    local file failed=0
+    while IFS= read -r -d '' file; do
+        git checkout HEAD -- "$file" || git restore "$file" || failed=1
+    done < "$bundle/reset_files"
+    return $failed
+}
+
+step apply_code_patch apply_patch "$bundle/patch_code.diff"
+code_patch=$?
+step reset_files reset_files
+step apply_test_patch apply_patch "$bundle/patch_test.diff"
+test_patch=$?
+if [ $code_patch -ne 0 ] || [ $test_patch -ne 0 ]; then
+    exit 1
+fi
+
+started="$(now)"
+/bin/bash "$bundle/eval.sh"
+exit_code=$?
+report run_tests "$exit_code" "$started" ""
+exit $exit_code
+"""
+
+
+@dataclass
+class BundleStep:
+    """A step of the evaluation driver script, as reported in its trailer."""
+
+    exit_code: int
+    seconds: float
+    output: str = ""
+
+
+class _BundleTrailerFilter:
+    """Take the step reports of the driver script out of its stdout while it is streamed.
+
+    Everything else is passed on to write as it arrives. Only a possibly incomplete report is
+    held back between chunks.
+    """
+
+    _FIELDS = re.compile(rb"(\S+) (-?\d+) (\S+) (\S+) ?(\S*)")
+
+    def __init__(self, marker: str, write: Callable[[bytes], None]):
+        self._prefix = b"\n" + marker.encode("utf-8") + b" "
+        self._write = write
+        self._buffer = b""
+        self.steps: Dict[str, BundleStep] = {}
+
+    def feed(self, data: bytes):
+        buffer = self._buffer + data
+        while True:
+            start = buffer.find(self._prefix)
+            if start < 0:
+                # The end of the buffer may be the start of a report
+                split = max(0, len(buffer) - len(self._prefix) + 1)
+                break
+            end = buffer.find(b"\n", start + 1)
+            if end < 0:
+                split = start
+                break
+            match = self._FIELDS.fullmatch(buffer, start + len(self._prefix), end)
+            if match is None:
+                self._write(buffer[:end])
+            else:
+                self._write(buffer[:start])
+                self._add_step(*match.groups())
+                end += 1
+            buffer = buffer[end:]
+        if split:
+            self._write(buffer[:split])
+        self._buffer = buffer[split:]
+
+    def close(self):
+        if self._buffer:
+            self._write(self._buffer)
+        self._buffer = b""
+
+    def _add_step(self, name: bytes, exit_code: bytes, started: bytes, ended: bytes, output: bytes):
+        try:
+            seconds = float(ended.replace(b",", b".")) - float(started.replace(b",", b"."))
+        except ValueError:
+            seconds = 0.0
+        try:
+            decoded = base64.b64decode(output).decode("utf-8", errors="replace")
+        except ValueError:
+            decoded = ""
+        self.steps[name.decode("utf-8")] = BundleStep(
+            exit_code=int(exit_code), seconds=seconds, output=decoded
+        )
+
+
+def _parse_bundle_trailer(stdout: str, marker: str) -> Tuple[str, Dict[str, BundleStep]]:
+    """Split the step reports of the driver script from the test output on stdout."""
+    chunks: List[bytes] = []
+    trailer = _BundleTrailerFilter(marker, chunks.append)
+    trailer.feed(stdout.encode("utf-8"))
+    trailer.close()
+    return b"".join(chunks).decode("utf-8"), trailer.steps
+
+
+def prepare_dockerfile(dockerfile_content: str) -> str:
+    """Adapt the Dockerfile of an instance for the evaluation build."""
+    # updating dockerfile so it doesn't overwrite package-lock.json
+    return dockerfile_content.replace("npm install", "npm install --no-save")
+
+
+def dockerfile_context_paths(dockerfile_content: str) -> Optional[List[str]]:
+    """Get the context paths the COPY and ADD instructions of a Dockerfile read.
+
+    Copies from other stages (--from) and URL sources don't read the context.
+
+    Returns:
+        The paths relative to the context root, or None if the whole context is needed: a
+        source is the context root, has a wildcard or variable, or leaves the context.
+    """
+    paths = set()
+    # Join continuation lines
+    content = re.sub(r"\\[ \t]*\r?\n", " ", dockerfile_content)
+    for line in content.splitlines():
+        parts = line.strip().split(maxsplit=1)
+        if len(parts) < 2 or parts[0].upper() not in ("COPY", "ADD"):
+            continue
+        words = parts[1].split()
+        if any(word.startswith("--from") for word in words):
+            continue
+        words = [word for word in words if not word.startswith("--")]
+        if words and words[0].startswith("["):
+            try:
+                words = json.loads(" ".join(words))
+            except ValueError:
+                return None
+        for source in words[:-1]:
+            if "://" in source:
+                continue
+            if source.startswith("<<") or any(char in source for char in "*?[$"):
+                return None
+            path = posixpath.normpath(source.lstrip("/"))
+            if path in (".", "") or path == ".." or path.startswith("../"):
+                return None
+            paths.add(path)
+    return sorted(paths)
 
 
 class DockerManager:
     """A class for managing docker related operations."""
 
-    def __init__(self, image_id: str, delete_image: bool, client: docker.DockerClient):
+    def __init__(
+        self,
+        image_id: str,
+        delete_image: bool,
+        client: "docker.DockerClient",
+        sample_stats: bool = False,
+        build_backend: str = "docker",
+        build_cache: Optional["BuildCache"] = None,
+    ):
         self.client = client
         self.image_id = image_id
-        self.container = None
+        assert build_backend in BUILD_BACKENDS, f"Unknown build backend {build_backend}"
+        self.build_backend = build_backend
+        # Local BuildKit cache the buildx builds import from and export to
+        self.build_cache = build_cache
+        self.container: Optional["docker.models.containers.Container"] = None
         self.delete_image = delete_image
         self.build_logs: List[str] = []
+        # Status lines of the last run, written to its log after the output
         self.run_logs: List[str] = []
+        # The log of the last run, streamed to disk
+        self.run_log: Optional[LogCapture] = None
+        # Peak resource usage of the container during docker_run, if sampled
+        self.sample_stats = sample_stats
+        self.peak_cpus = 0.0
+        self.peak_memory_gb = 0.0
+        # Whether the last docker_run hit its timeout
+        self.timed_out = False
+        # Whether the working tree of the container was snapshot for reset_worktree
+        self.has_snapshot = False
+        self._workdir: Optional[str] = None
 
     def check_image_local(self, local_image_name: str) -> bool:
         """Check if image exists locally in Docker"""
+        import docker
 
         try:
             _ = self.client.images.get(local_image_name)
@@ -36,18 +303,27 @@ class DockerManager:
         except Exception as e:
             return False
 
-    def docker_build(self, repo_path: Path, dockerfile_content: str) -> int:
+    def image_digest(self) -> Optional[str]:
+        """Get the content digest of the instance image, or None if it can't be inspected."""
+        try:
+            return self.client.images.get(self.image_id).id
+        except Exception:
+            return None
+
+    def docker_build(
+        self, repo_path: Path, dockerfile_content: str, cache_key: Optional[str] = None
+    ) -> int:
         """Build docker image from dockerfile content.
 
         Args:
             repo_path: Path to the repository
             dockerfile_content: Content of the dockerfile
-            tag: The name of the docker image (optional)
+            cache_key: The build cache of the image with the buildx backend, e.g. its repo, so
+                that builds of neighbouring commits share their layers
         Returns:
             success: 0 if build was successful, 1 otherwise
         """
-        # updating dockerfile so it doesn't overwrite package-lock.json
-        dockerfile_content = dockerfile_content.replace("npm install", "npm install --no-save")
+        dockerfile_content = prepare_dockerfile(dockerfile_content)
 
         # Create a Dockerfile in the temporary directory with the dockerfile content
         (repo_path / "Dockerfile").write_text(dockerfile_content)
@@ -56,10 +332,35 @@ class DockerManager:
         if (repo_path / ".dockerignore").exists():
             (repo_path / ".dockerignore").unlink()
 
+        if self.build_backend == "buildx":
+            return self._buildx_build(str(repo_path), cache_key)
+        return self._api_build(path=str(repo_path))
+
+    def docker_build_context(self, context: IO[bytes], cache_key: Optional[str] = None) -> int:
+        """Build docker image from a tar stream of its context, holding the Dockerfile.
+
+        The context is read as it is sent, e.g. from RepoManager.open_build_context, so it is
+        never stored on disk.
+
+        Args:
+            context: The build context as a tar stream
+            cache_key: The build cache of the image with the buildx backend, as in docker_build
+        Returns:
+            success: 0 if build was successful, 1 otherwise
+        """
+        if self.build_backend == "buildx":
+            return self._buildx_build("-", cache_key, stdin=context)
+        chunks = iter(lambda: context.read(BUILD_CONTEXT_CHUNK_BYTES), b"")
+        return self._api_build(fileobj=chunks, custom_context=True)
+
+    def _api_build(self, **context) -> int:
+        """Build the image with the legacy builder of the docker API from the given context."""
+        import docker
+
         success = 1
         try:
             image, build_logs = self.client.images.build(
-                path=str(repo_path), tag=self.image_id, rm=True, platform="linux/amd64", network_mode="host"
+                tag=self.image_id, rm=True, platform="linux/amd64", network_mode="host", **context
             )
             for log in build_logs:
                 if "stream" in log:
@@ -81,249 +382,301 @@ class DockerManager:
 
         return success
 
+    def _buildx_build(
+        self, context_path: str, cache_key: Optional[str], stdin: Optional[IO[bytes]] = None
+    ) -> int:
+        """Build the image with BuildKit, importing and exporting the build cache of cache_key.
+
+        The context is a directory, or "-" to read it as a tar stream from stdin. The plain
+        progress output is streamed into build_logs line by line.
+        """
+        command = [
+            "docker",
+            "buildx",
+            "build",
+            "--progress=plain",
+            "--platform=linux/amd64",
+            "--network=host",
+            "--load",
+            f"--tag={self.image_id}",
+        ]
+        cache_from = cache_to = None
+        if self.build_cache is not None and cache_key is not None:
+            cache_from, cache_to = self.build_cache.begin(cache_key)
+            if cache_from is not None:
+                command.append(f"--cache-from=type=local,src={cache_from}")
+            command.append(f"--cache-to=type=local,dest={cache_to},mode=max")
+        command.append(context_path)
+
+        success = 1
+        try:
+            process = subprocess.Popen(
+                command,
+                stdin=stdin,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                text=True,
+                errors="replace",
+            )
+            assert process.stdout is not None
+            for line in process.stdout:
+                self.build_logs.append(line.rstrip())
+            exit_code = process.wait()
+            if exit_code == 0:
+                success = 0
+            else:
+                self.build_logs.append(f"Build Error: docker buildx build exited with {exit_code}")
+        except Exception as e:
+            self.build_logs.append(f"Unexpected Error: {str(e)}")
+        finally:
+            if self.build_cache is not None and cache_key is not None and cache_to is not None:
+                self.build_cache.end(cache_key, cache_from, cache_to, success == 0)
+
+        return success
+
+    @property
+    def container_name(self) -> str:
+        """Name of the container, or of the next container if none is created."""
+        if self.container is not None:
+            return self.container.name
+        return f"container_{self.image_id}"
+
     def create_container(self):
-        """Creates and starts a docker container from the docker image."""
-        self.container = self.client.containers.create(
+        """Creates and starts a docker container from the docker image.
+
+        A container that already has the name of the image (e.g. of another run of the same
+        instance) is left alone and the new container gets a unique name instead. Containers
+        left over by interrupted runs are removed by cleanup_orphaned_containers.
+        """
+        import docker
+
+        name = f"container_{self.image_id}"
+        try:
+            self.container = self._create_named_container(name)
+        except docker.errors.APIError as e:
+            if e.status_code != 409:
+                raise
+            unique_name = f"{name}_{uuid.uuid4().hex[:8]}"
+            logger.warning(f"Container {name} already exists, creating {unique_name} instead")
+            self.container = self._create_named_container(unique_name)
+
+        assert self.container is not None, "Container not created"
+        self.container.start()
+        self.has_snapshot = False
+
+    def _create_named_container(self, name: str) -> "docker.models.containers.Container":
+        return self.client.containers.create(
             image=self.image_id,
             detach=True,
             tty=True,
             working_dir=self._get_workdir_from_image(),
-            name=f"container_{self.image_id}",
+            name=name,
             command="tail -f /dev/null",
         )
 
-        assert self.container is not None, "Container not created"
-        self.container.start()
-
-    def copy_file_to_container(
-        self, content: str, container_filename: str, target_path: str
-    ) -> bool:
-        """Copy a file with given content to the container.
-
-        Args:
-            content: Content to write to the file
-            container_filename: Name of the file as it should appear in the container
-            target_path: Target path in the container
+    def snapshot_worktree(self) -> bool:
+        """Record the working tree of the fresh container for reset_worktree.
 
         Returns:
-            bool: True if successful, False otherwise
+            bool: True if the snapshot was recorded, False otherwise
         """
         assert self.container is not None, "Container not created"
+        exec_result = self.container.exec_run(
+            cmd=["bash", "-c", WORKTREE_SNAPSHOT_COMMAND],
+            workdir=str(self._get_workdir_from_image()),
+            user="root",
+        )
+        if exec_result.exit_code != 0:
+            logger.warning(f"Failed to snapshot the working tree: {exec_result.output.decode()}")
+            return False
+        self.has_snapshot = True
+        return True
 
-        # Create unique identifier for local files
-        unique_id = f"{int(time.time() * 1000)}_{threading.get_ident()}"
-        local_filename = f"temp_{unique_id}_{container_filename}"
-
-        # Create a temporary file locally
-        with tempfile.NamedTemporaryFile(mode="w", delete=False, suffix=local_filename) as tmp_file:
-            tmp_file.write(content)
-            tmp_file.flush()
-
-            # Copy the file into the container
-            try:
-                with open(tmp_file.name, "rb") as f:
-                    # Create tar with the desired container filename, not the local filename
-                    self.container.put_archive(
-                        target_path, self._create_tar(container_filename, f.read())
-                    )
-                return True
-            except Exception as e:
-                logger.error(f"Failed to copy file to container: {e}")
-                return False
-            finally:
-                # Clean up the temporary file
-                Path(tmp_file.name).unlink(missing_ok=True)
-
-    def apply_patch_to_container(
-        self, patch_content: str, patch_type: Literal["code", "test"]
-    ) -> int:
-        """Apply patch inside the running container
-        Args:
-            patch_content: Content of the patch file
-            patch_type: The type of patch, "code" or "test"
+    def reset_worktree(self) -> bool:
+        """Reset the working tree of the container to its snapshot, so another patch can run.
 
         Returns:
-            int: 0 if patch was applied successfully, 1 otherwise
+            bool: True if the working tree was reset, False otherwise
         """
-        success = 1
-        workdir = str(self._get_workdir_from_image())
         assert self.container is not None, "Container not created"
+        exec_result = self.container.exec_run(
+            cmd=["bash", "-c", WORKTREE_RESET_COMMAND],
+            workdir=str(self._get_workdir_from_image()),
+            user="root",
+        )
+        if exec_result.exit_code != 0:
+            logger.warning(f"Failed to reset the working tree: {exec_result.output.decode()}")
+            return False
+        return True
 
-        # The filename as it should appear inside the container
-        container_patch_filename = f"patch_{patch_type}.diff"
-
-        if not self.copy_file_to_container(patch_content, container_patch_filename, workdir):
-            raise ValueError("Failed to create patch file in container")
-
-        try:
-            # First try: git apply
-            exec_result = self.container.exec_run(
-                cmd=f"git apply -v --ignore-whitespace --reject {workdir}/{container_patch_filename}",
-                workdir=workdir,
-                user="root",
-            )
-            logger.info(f"exec_result for git apply: {exec_result.output.decode()}")
-            if exec_result.exit_code != 0:
-                # Second try: patch command
-                exec_result = self.container.exec_run(
-                    cmd=f"patch --batch --fuzz=5 -p1 -f -i {workdir}/{container_patch_filename}",
-                    workdir=workdir,
-                    user="root",
-                )
-                if exec_result.exit_code != 0:
-                    raise ValueError("Failed to apply patch.")
-                else:
-                    success = 0
-            else:
-                success = 0
-
-        finally:
-            # Clean up if patch failed
-            if success != 0:
-                self._cleanup()
-                self.container = None
-
-        return success
+    def verify_worktree(self) -> bool:
+        """Check that a reset working tree matches its snapshot.
 
-    def reset_files(self, file_paths: List[str]) -> bool:
-        """Reset files to their original state using git checkout.
-        
-        Args:
-            file_paths: List of file paths to reset
-            
         Returns:
-            bool: True if reset was successful, False otherwise
+            bool: True if the working tree matches, False otherwise
         """
-        try:
-            if not file_paths:
-                logger.debug("No files found to reset")
-                return True
-                
-            # Reset each file using git
-            workdir = str(self._get_workdir_from_image())
-            assert self.container is not None, "Container not created"
-            
-            for file_path in file_paths:
-                try:
-                    # Use git checkout to reset the file to its original state
-                    exec_result = self.container.exec_run(
-                        cmd=f"git checkout HEAD -- {file_path}",
-                        workdir=workdir,
-                        user="root",
-                    )
-                    if exec_result.exit_code != 0:
-                        logger.warning(f"Failed to reset {file_path}: {exec_result.output.decode()}")
-                        # Try alternative approach with git restore if available
-                        exec_result = self.container.exec_run(
-                            cmd=f"git restore {file_path}",
-                            workdir=workdir,
-                            user="root",
-                        )
-                        if exec_result.exit_code != 0:
-                            logger.warning(f"Failed to restore {file_path}: {exec_result.output.decode()}")
-                    else:
-                        logger.debug(f"Successfully reset file: {file_path}")
-                except Exception as e:
-                    logger.warning(f"Error resetting file {file_path}: {e}")
-                    
-            return True
-            
-        except Exception as e:
-            logger.error(f"Error in reset_files: {e}")
+        assert self.container is not None, "Container not created"
+        exec_result = self.container.exec_run(
+            cmd=["bash", "-c", WORKTREE_CHECK_COMMAND],
+            workdir=str(self._get_workdir_from_image()),
+            user="root",
+        )
+        if exec_result.exit_code != 0:
+            logger.warning("The reset working tree doesn't match its snapshot")
             return False
+        return True
+
+    def run_evaluation_bundle(
+        self,
+        code_patch: str,
+        test_patch: str,
+        files_to_reset: List[str],
+        test_command: str,
+        timeout: int,
+        keep_container: bool = False,
+        log_path: Optional[str] = None,
+    ) -> Dict[str, BundleStep]:
+        """Apply the patches and run the tests with one archive upload and one exec.
+
+        The patches, the files to reset before the test patch, eval.sh and the driver script are
+        sent in a single in-memory tar. The driver applies the code patch (git apply, falling
+        back to patch), resets the files, applies the test patch and runs eval.sh if both
+        patches applied. The test output is streamed to run_log, and the timeout covers the
+        whole driver.
 
-    def docker_run(self, test_command: str, timeout: int) -> int:
-        """Run the CMD command from dockerfile inside the running container.
         Args:
+            code_patch: Content of the code patch
+            test_patch: Content of the test patch
+            files_to_reset: Files to check out from HEAD before the test patch is applied
             test_command: The test command to run
-            timeout: The timout of the run function
+            timeout: The timeout of the driver
+            keep_container: Keep the container afterwards, to reset its working tree and run
+                another patch in it. Containers of timed out runs are never kept.
+            log_path: The file the run log is streamed to, a temporary file if None
         Returns:
-            success: 0 if run was successful, 1 otherwise
+            The steps the driver reported by name: apply_code_patch, reset_files,
+            apply_test_patch and run_tests. A timed out run has no run_tests step.
+        Raises:
+            ValueError: If the bundle could not be copied or the exec failed (other than by
+                timing out).
         """
         assert self.container is not None, "Container not created"
+        workdir = self._get_workdir_from_image()
+        bundle_name = Path(BUNDLE_DIR).name
+        eval_script = "\n".join(["#!/bin/bash", "set -uxo pipefail", test_command])
+        files = {
+            "driver.sh": EVALUATION_DRIVER_SCRIPT,
+            "eval.sh": eval_script,
+            "patch_code.diff": code_patch,
+            "patch_test.diff": test_patch,
+            "reset_files": "".join(f"{file_path}\0" for file_path in files_to_reset),
+        }
+        tar_stream = io.BytesIO()
+        with tarfile.open(fileobj=tar_stream, mode="w") as tar:
+            directory = tarfile.TarInfo(name=bundle_name)
+            directory.type = tarfile.DIRTYPE
+            directory.mode = 0o777
+            tar.addfile(directory)
+            for name, content in files.items():
+                data = content.encode("utf-8")
+                tarinfo = tarfile.TarInfo(name=f"{bundle_name}/{name}")
+                tarinfo.size = len(data)
+                tarinfo.mode = 0o777 if name.endswith(".sh") else 0o666
+                tar.addfile(tarinfo, io.BytesIO(data))
+        if not self.container.put_archive(str(Path(BUNDLE_DIR).parent), tar_stream.getvalue()):
+            raise ValueError("Failed to copy the evaluation bundle to the container")
+
+        marker = f"@@polybench_step_{uuid.uuid4().hex}@@"
+        run_log = self.run_log = LogCapture(log_path)
+        trailer = _BundleTrailerFilter(marker, run_log.write)
+
+        def write_output(data: bytes, stderr: bool = False):
+            if stderr:
+                run_log.write(data, stderr=True)
+            else:
+                trailer.feed(data)
 
-        # Local variables to store the result
-        result = None
-        timed_out = False
-        success_stream = 1
-
-        def run_container():
-            nonlocal result, success_stream
-            workdir = self._get_workdir_from_image()
-            exec_result = b""
-            eval_script_list = [test_command]
-
-            eval_script = "\n".join(["#!/bin/bash", "set -uxo pipefail"] + eval_script_list)
-            write_command = f"""cat << 'EOF' > /{workdir}/eval.sh
-{eval_script}
-EOF"""
+        errors: List[Exception] = []
+        container = self.container
 
-            eval_result = self.container.exec_run(
-                cmd=["bash", "-c", write_command], workdir=workdir
-            )
-            if eval_result.exit_code != 0:
-                raise Exception(f"Failed to create eval.sh file: {eval_result.output.decode()}")
-            chmod_result = self.container.exec_run(
-                cmd=["bash", "-c", f"chmod 777 {workdir}/eval.sh"]
-            )
-            if chmod_result.exit_code != 0:
-                raise Exception(f"Failed to chmod: {eval_result.output.decode()}")
+        def run_driver():
             try:
-                exec_id = self.container.client.api.exec_create(
-                    self.container.id, f"/bin/bash {workdir}/eval.sh", stderr=True
+                exec_id = container.client.api.exec_create(
+                    container.id,
+                    ["/bin/bash", f"{BUNDLE_DIR}/driver.sh", marker],
+                    stderr=True,
+                    workdir=workdir,
                 )["Id"]
+                exec_stream = container.client.api.exec_start(exec_id, stream=True, demux=True)
+                self._stream_exec_output(exec_stream, write_output)
+                trailer.close()
+            except Exception as e:
+                errors.append(e)
 
-                exec_stream = self.container.client.api.exec_start(exec_id, stream=True, demux=True)
-                stdout_data = b""
-                stderr_data = b""
-
-                for chunk in exec_stream:
-                    if chunk:
-                        stdout_chunk, stderr_chunk = chunk
-                        if stdout_chunk:
-                            stdout_data += stdout_chunk
-                        if stderr_chunk:
-                            stderr_data += stderr_chunk
-
-                # Combine stderr and stdout, with stderr at the beginning
-                error_output = stderr_data.decode("utf-8")
-                stdout_output = stdout_data.decode("utf-8")
-                exec_result = error_output + stdout_output
-
-                exit_code = self.container.client.api.exec_inspect(exec_id).get("ExitCode", -1)
-            except Exception:
-                pass
-
-            self.run_logs.append(exec_result)
+        thread = threading.Thread(target=run_driver)
+        thread.start()
+        timed_out = self._wait_for_exec(thread, timeout, keep_container)
+
+        steps = dict(trailer.steps)
+        for name in ("apply_code_patch", "reset_files", "apply_test_patch"):
+            if name in steps:
+                logger.info(f"{name} exited with {steps[name].exit_code}: {steps[name].output}")
+        if "run_tests" in steps:
+            exit_code = steps["run_tests"].exit_code
             self.run_logs.append(f"Container exited with status code: {exit_code}")
-            success_stream = exit_code
+        run_log.close(self.run_logs, keep_output=not timed_out)
+        if errors and not timed_out:
+            # The steps of a broken exec say nothing about the patch, don't score them
+            raise ValueError(f"Evaluation driver failed: {errors[0]}") from errors[0]
+        return steps
+
+    @staticmethod
+    def _stream_exec_output(exec_stream, write: Callable[..., None]):
+        """Pass the demuxed chunks of an exec to write as they arrive, stderr as keyword."""
+        for chunk in exec_stream:
+            if chunk:
+                stdout_chunk, stderr_chunk = chunk
+                if stdout_chunk:
+                    write(stdout_chunk)
+                if stderr_chunk:
+                    write(stderr_chunk, stderr=True)
+
+    def _wait_for_exec(self, thread: threading.Thread, timeout: int, keep_container: bool) -> bool:
+        """Wait for the thread running an exec, sampling the container stats if enabled.
+
+        The container is stopped if the exec hits the timeout, and removed afterwards unless it
+        is kept.
 
-        # Start the container operation in a separate thread
-        thread = threading.Thread(target=run_container)
-        thread.start()
-        thread.join(timeout)
+        Returns:
+            bool: True if the exec timed out, False otherwise
+        """
+        if self.sample_stats:
+            deadline = time.monotonic() + timeout
+            while thread.is_alive() and time.monotonic() < deadline:
+                thread.join(min(STATS_INTERVAL, max(0.0, deadline - time.monotonic())))
+                if thread.is_alive():
+                    self._sample_stats()
+        else:
+            thread.join(timeout)
 
         # If the thread is still alive, the operation timed out
-        if thread.is_alive():
-            timed_out = True
+        timed_out = thread.is_alive()
+        if timed_out and self.container is not None:
             # Force stop the container
             try:
                 self.container.stop(timeout=20)
                 self.run_logs.append("Container operation timed out")
             except Exception:
                 pass
-            success = 1
-        else:
-            success = success_stream
-            self.run_logs.append(f"Container exited with status code: {success}")
-
-        if timed_out:
             logger.info("docker run timed out.")
+        self.timed_out = timed_out
 
-        self._cleanup()
-        self.container = None
+        # Keep the image, further patches of the instance may run in a new container
+        if timed_out or not keep_container:
+            self._remove_container()
+            self.container = None
 
-        return success
+        return timed_out
 
     def build_base_image(self, language: str, retry: int = 3):
         """Build base images.
@@ -361,38 +714,58 @@ EOF"""
             # If we get here, all retries failed
             raise ValueError(f"Failed to build base image for {language} after {retry} attempts")
 
-    def _create_tar(self, name: str, content: bytes) -> bytes:
-        """Create a tar archive containing a single file."""
+    def _sample_stats(self):
+        """Record the CPU and memory usage peaks of the running container."""
+        if self.container is None:
+            return
+        try:
+            stats = self.container.stats(stream=False)
+        except Exception:
+            return
 
-        # Create unique identifier for tar file
-        tar_stream = io.BytesIO()
-        with tarfile.open(fileobj=tar_stream, mode="w") as tar:
-            tarinfo = tarfile.TarInfo(name=name)  # Use the container filename here
-            tarinfo.size = len(content)
-            tar.addfile(tarinfo, io.BytesIO(content))
+        memory_usage = stats.get("memory_stats", {}).get("usage", 0) or 0
+        self.peak_memory_gb = max(self.peak_memory_gb, memory_usage / 1024**3)
 
-        return tar_stream.getvalue()
+        cpu_stats = stats.get("cpu_stats", {})
+        precpu_stats = stats.get("precpu_stats", {})
+        cpu_delta = cpu_stats.get("cpu_usage", {}).get("total_usage", 0) - precpu_stats.get(
+            "cpu_usage", {}
+        ).get("total_usage", 0)
+        system_delta = cpu_stats.get("system_cpu_usage", 0) - precpu_stats.get(
+            "system_cpu_usage", 0
+        )
+        if system_delta > 0 and cpu_delta > 0:
+            online_cpus = cpu_stats.get("online_cpus") or 1
+            self.peak_cpus = max(self.peak_cpus, cpu_delta / system_delta * online_cpus)
 
     def _get_workdir_from_image(self) -> str:
-        try:
-            image = self.client.images.get(self.full_image_uri)
-        except Exception:
-            image = self.client.images.get(self.image_id)
-        workdir = str(image.attrs["Config"]["WorkingDir"])
+        # Inspected once per image instead of once per container operation
+        if self._workdir is None:
+            try:
+                image = self.client.images.get(self.full_image_uri)
+            except Exception:
+                image = self.client.images.get(self.image_id)
+            self._workdir = str(image.attrs["Config"]["WorkingDir"])
 
-        return workdir
+        return self._workdir
 
-    def _cleanup(self):
-        """Stop and remove the container, and delete the image if provided."""
-        # Stop and remove the container
+    def _remove_container(self):
+        """Stop and remove the container."""
         if self.container:
             try:
                 self.container.stop(timeout=10)
                 self.container.remove()
             except Exception:
                 pass
+
+    def _cleanup(self):
+        """Stop and remove the container, and delete the image if provided."""
+        # Stop and remove the container
+        self._remove_container()
         # Delete the image if needed
         if self.delete_image:
+            import docker
+
             try:
                 self.client.images.remove(self.image_id, force=True)
             except docker.errors.ImageNotFound:
@@ -402,3 +775,228 @@ EOF"""
         """Stop and remove the container, and delete the image if provided."""
         # Stop and remove the container, and delete the image if provided
         self._cleanup()
+
+
+class ContainerPool:
+    """Warm containers kept between evaluations of the same image.
+
+    After the last run of an evaluation its container is released to the pool instead of being
+    removed, and the next evaluation of the image resets the working tree of that container to
+    the snapshot taken when it was created instead of creating a new one. There is one warm
+    container per image at most, since containers are named after their image. Containers idle
+    for longer than idle_seconds and the least recently used ones beyond max_containers are
+    removed.
+    """
+
+    def __init__(
+        self,
+        max_containers: int,
+        idle_seconds: float = WARM_CONTAINER_IDLE_SECONDS,
+        verify: bool = False,
+    ):
+        self.max_containers = max_containers
+        self.idle_seconds = idle_seconds
+        # Check every reset working tree against its snapshot before reusing the container
+        self.verify = verify
+        # image_id -> (container, released_at), least recently released first
+        self._containers: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._containers)
+
+    def acquire(self, docker_manager: DockerManager) -> bool:
+        """Attach the warm container of the image of docker_manager, reset to its snapshot.
+
+        A warm container that was created from another build of the image, or whose working
+        tree can't be reset, is removed.
+
+        Returns:
+            bool: True if a warm container was attached, False if a new one is needed
+        """
+        with self._lock:
+            expired = self._take_expired()
+            entry = self._containers.pop(docker_manager.image_id, None)
+        self._remove(expired)
+        reused = False
+        if entry is not None:
+            container, _ = entry
+            docker_manager.container = container
+            docker_manager.has_snapshot = True
+            reused = (
+                container.attrs.get("Image") == docker_manager.image_digest()
+                and docker_manager.reset_worktree()
+                and (not self.verify or docker_manager.verify_worktree())
+            )
+            if not reused:
+                logger.warning(f"Discarding the warm container of {docker_manager.image_id}")
+                docker_manager.container = None
+                docker_manager.has_snapshot = False
+                self._remove([container])
+        with self._lock:
+            if reused:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return reused
+
+    def release(self, docker_manager: DockerManager) -> bool:
+        """Keep the container of docker_manager warm for the next evaluation of its image.
+
+        Containers without a snapshot and containers of images deleted after the evaluation
+        aren't kept.
+
+        Returns:
+            bool: True if the container was taken over by the pool, False otherwise
+        """
+        container = docker_manager.container
+        if (
+            container is None
+            or not docker_manager.has_snapshot
+            or docker_manager.delete_image
+            or self.max_containers <= 0
+        ):
+            return False
+        with self._lock:
+            evicted = self._take_expired()
+            previous = self._containers.pop(docker_manager.image_id, None)
+            if previous is not None:
+                evicted.append(previous[0])
+            self._containers[docker_manager.image_id] = (container, time.monotonic())
+            while len(self._containers) > self.max_containers:
+                _, (oldest, _) = self._containers.popitem(last=False)
+                evicted.append(oldest)
+        docker_manager.container = None
+        docker_manager.has_snapshot = False
+        self._remove(evicted)
+        return True
+
+    def evict_idle(self) -> int:
+        """Remove the containers idle for longer than idle_seconds.
+
+        Returns:
+            The number of removed containers.
+        """
+        with self._lock:
+            expired = self._take_expired()
+        self._remove(expired)
+        return len(expired)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "warm_containers": len(self._containers),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def close(self):
+        """Remove all warm containers."""
+        with self._lock:
+            containers = [container for container, _ in self._containers.values()]
+            self._containers.clear()
+        self._remove(containers)
+
+    def _take_expired(self) -> List[Any]:
+        deadline = time.monotonic() - self.idle_seconds
+        expired = [
+            image_id
+            for image_id, (_, released_at) in self._containers.items()
+            if released_at <= deadline
+        ]
+        return [self._containers.pop(image_id)[0] for image_id in expired]
+
+    def _remove(self, containers: List[Any]):
+        # Warm containers only idle in tail -f /dev/null, so they are killed without a stop
+        # timeout
+        for container in containers:
+            try:
+                container.remove(force=True)
+            except Exception as e:
+                logger.debug(f"Failed to remove warm container {container.name}: {e}")
+        if containers:
+            with self._lock:
+                self.evictions += len(containers)
+
+
+class BuildCache:
+    """Local BuildKit caches of the buildx builds, one per cache key (e.g. per repo).
+
+    A build imports the current cache directory of its key and exports its layers to a new
+    directory, which becomes the current one if the build succeeds. A local cache directory
+    can't be written by concurrent builds, so every export gets its own directory and only the
+    switch of the current link happens under the lock. Replaced directories are removed once no
+    running build imports from them. The cache lives outside of the docker daemon, so builds
+    still hit it after their images were deleted (e.g. with delete_image) or pruned.
+    """
+
+    def __init__(self, root: str):
+        self.root = Path(root).expanduser()
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        # Directories imported by running builds, with their number of builds
+        self._readers: Dict[str, int] = {}
+        # Replaced and failed directories, removed once they have no readers
+        self._stale: Set[str] = set()
+        self.hits = 0
+        self.misses = 0
+
+    def current(self, cache_key: str) -> Optional[str]:
+        """The cache directory builds of cache_key import from, or None if there is none."""
+        link = self._key_dir(cache_key) / "current"
+        if not link.is_symlink() or not link.exists():
+            return None
+        return str(link.resolve())
+
+    def begin(self, cache_key: str) -> Tuple[Optional[str], str]:
+        """Start a build of cache_key.
+
+        Returns:
+            The directory to import the cache from (None if there is no cache yet) and the new
+            directory to export the cache to.
+        """
+        key_dir = self._key_dir(cache_key)
+        key_dir.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            cache_from = self.current(cache_key)
+            if cache_from is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._readers[cache_from] = self._readers.get(cache_from, 0) + 1
+        cache_to = tempfile.mkdtemp(prefix="build-", dir=key_dir)
+        return cache_from, cache_to
+
+    def end(self, cache_key: str, cache_from: Optional[str], cache_to: str, success: bool):
+        """Finish a build started with begin, making its export current if it succeeded."""
+        link = self._key_dir(cache_key) / "current"
+        with self._lock:
+            if cache_from is not None:
+                self._readers[cache_from] -= 1
+                if self._readers[cache_from] == 0:
+                    del self._readers[cache_from]
+            if success:
+                previous = self.current(cache_key)
+                new_link = link.with_name(f"current.{uuid.uuid4().hex}")
+                new_link.symlink_to(Path(cache_to).name)
+                os.replace(new_link, link)
+                if previous is not None:
+                    self._stale.add(previous)
+            else:
+                self._stale.add(cache_to)
+            removable = [path for path in self._stale if path not in self._readers]
+            self._stale.difference_update(removable)
+        for path in removable:
+            shutil.rmtree(path, ignore_errors=True)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+    def _key_dir(self, cache_key: str) -> Path:
+        return self.root / cache_key.replace("/", "__")
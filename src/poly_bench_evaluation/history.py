@@ -0,0 +1,240 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: CC-BY-NC-4.0
+import json
+import math
+import sqlite3
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from poly_bench_evaluation.constants import (
+    DEFAULT_TIMEOUT,
+    JAVA_TIMEOUT,
+    LANGUAGE_DEFAULT_DURATIONS,
+    RUN_TIMEOUT_CEILING_SECONDS,
+    RUN_TIMEOUT_MARGIN,
+    RUN_TIMEOUT_MIN_REPO_SAMPLES,
+    RUN_TIMEOUT_PERCENTILE,
+    RUN_TIMEOUT_SLACK_SECONDS,
+)
+
+# Stages whose durations are recorded
+HISTORY_STAGES = ["build", "run"]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS durations (
+    instance_id TEXT NOT NULL,
+    repo TEXT NOT NULL,
+    language TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    seconds REAL NOT NULL,
+    recorded_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS durations_instance ON durations (instance_id, stage);
+CREATE TABLE IF NOT EXISTS gold_baselines (
+    instance_id TEXT PRIMARY KEY,
+    environment_key TEXT NOT NULL,
+    resolved INTEGER NOT NULL,
+    passed_tests TEXT NOT NULL,
+    failed_tests TEXT NOT NULL,
+    run_seconds REAL,
+    image_digest TEXT,
+    recorded_at REAL NOT NULL
+);
+"""
+
+
+@dataclass
+class GoldBaseline:
+    """The outcome of the gold patch of an instance."""
+
+    instance_id: str
+    # Result cache key of the gold patch, covering the test patch, Dockerfile and test command
+    environment_key: str
+    resolved: bool
+    passed_tests: List[str]
+    failed_tests: List[str]
+    run_seconds: Optional[float] = None
+    image_digest: Optional[str] = None
+
+
+@dataclass
+class DurationEstimates:
+    """A snapshot of the recorded durations, used to estimate the cost of instances."""
+
+    instance_durations: Dict[Tuple[str, str], List[float]] = field(default_factory=dict)
+    repo_durations: Dict[Tuple[str, str], List[float]] = field(default_factory=dict)
+    # Gold baselines by instance id; gold-equivalent patches of these instances are not run
+    gold_baselines: Dict[str, GoldBaseline] = field(default_factory=dict)
+    # Test run seconds of the gold baselines of every repo, timed out runs aren't recorded
+    gold_run_seconds: Dict[str, List[float]] = field(default_factory=dict)
+
+    def expected_duration(self, instance_id: str, repo: str, language: str, stage: str) -> float:
+        """Get the expected duration of a stage in seconds.
+
+        The mean of the previous runs of the instance is used if there are any, then the mean
+        of the runs of its repo, then the language default.
+        """
+        for durations in (
+            self.instance_durations.get((instance_id, stage)),
+            self.repo_durations.get((repo, stage)),
+        ):
+            if durations:
+                return sum(durations) / len(durations)
+        build_seconds, run_seconds = LANGUAGE_DEFAULT_DURATIONS.get(
+            language, LANGUAGE_DEFAULT_DURATIONS["Python"]
+        )
+        return build_seconds if stage == "build" else run_seconds
+
+    def expected_cost(self, instance_id: str, repo: str, language: str) -> float:
+        """Get the expected build plus run duration of an instance in seconds."""
+        return sum(
+            self.expected_duration(instance_id, repo, language, stage) for stage in HISTORY_STAGES
+        )
+
+    def run_timeout(self, instance_id: str, repo: str, language: str) -> float:
+        """Get the test run timeout of an instance in seconds.
+
+        The timeout is learned from the recorded test runs of the instance, then from the gold
+        runs of its repo, once there are enough of them. It never is less than the language
+        default, so learning only extends the timeout of slow suites and a single fast run
+        can't make a later run time out.
+        """
+        default = JAVA_TIMEOUT if language.lower() == "java" else DEFAULT_TIMEOUT
+        instance_runs = self.instance_durations.get((instance_id, "run"), [])
+        if len(instance_runs) >= RUN_TIMEOUT_MIN_REPO_SAMPLES:
+            durations = instance_runs
+        elif len(self.gold_run_seconds.get(repo, [])) >= RUN_TIMEOUT_MIN_REPO_SAMPLES:
+            durations = self.gold_run_seconds[repo]
+        else:
+            return default
+
+        timeout = _percentile(durations, RUN_TIMEOUT_PERCENTILE) * RUN_TIMEOUT_MARGIN
+        timeout = min(timeout + RUN_TIMEOUT_SLACK_SECONDS, RUN_TIMEOUT_CEILING_SECONDS)
+        return max(timeout, default)
+
+
+def _percentile(values: List[float], percentile: float) -> float:
+    """Get the nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    rank = math.ceil(percentile / 100 * len(ordered))
+    return ordered[max(rank, 1) - 1]
+
+
+_BASELINE_COLUMNS = (
+    "instance_id, environment_key, resolved, passed_tests, failed_tests, run_seconds, image_digest"
+)
+
+
+def _baseline_from_row(row: Tuple) -> GoldBaseline:
+    return GoldBaseline(
+        instance_id=row[0],
+        environment_key=row[1],
+        resolved=bool(row[2]),
+        passed_tests=json.loads(row[3]),
+        failed_tests=json.loads(row[4]),
+        run_seconds=row[5],
+        image_digest=row[6],
+    )
+
+
+class RunHistory:
+    """A local SQLite store of the stage durations and gold baselines of previous evaluations."""
+
+    def __init__(self, db_path: str):
+        self.db_path = str(Path(db_path).expanduser())
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=60)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def record_duration(
+        self, instance_id: str, repo: str, language: str, stage: str, seconds: float
+    ):
+        """Record the duration of a stage of an instance evaluation."""
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO durations VALUES (?, ?, ?, ?, ?, ?)",
+                (instance_id, repo, language, stage, seconds, time.time()),
+            )
+
+    def record_gold_baseline(self, baseline: GoldBaseline):
+        """Store the gold outcome of an instance, replacing the previous one."""
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO gold_baselines VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    baseline.instance_id,
+                    baseline.environment_key,
+                    int(baseline.resolved),
+                    json.dumps(baseline.passed_tests),
+                    json.dumps(baseline.failed_tests),
+                    baseline.run_seconds,
+                    baseline.image_digest,
+                    time.time(),
+                ),
+            )
+
+    def gold_baselines(self) -> Dict[str, GoldBaseline]:
+        """Load the gold baselines of all instances."""
+        with self._connect() as conn:
+            rows = conn.execute(f"SELECT {_BASELINE_COLUMNS} FROM gold_baselines").fetchall()
+        return {row[0]: _baseline_from_row(row) for row in rows}
+
+    def gold_baseline(self, instance_id: str) -> Optional[GoldBaseline]:
+        """Get the gold baseline of an instance, if its gold patch was evaluated."""
+        with self._connect() as conn:
+            row = conn.execute(
+                f"SELECT {_BASELINE_COLUMNS} FROM gold_baselines WHERE instance_id = ?",
+                (instance_id,),
+            ).fetchone()
+        return _baseline_from_row(row) if row else None
+
+    def mean_durations(self) -> Dict[Tuple[str, str, str], Dict[str, float]]:
+        """Get the mean duration of every recorded stage per (instance_id, repo, language)."""
+        durations: Dict[Tuple[str, str, str], Dict[str, float]] = defaultdict(dict)
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT instance_id, repo, language, stage, AVG(seconds) FROM durations "
+                "GROUP BY instance_id, repo, language, stage"
+            )
+            for instance_id, repo, language, stage, seconds in rows:
+                durations[(instance_id, repo, language)][stage] = seconds
+        return dict(durations)
+
+    def estimates(self) -> DurationEstimates:
+        """Load all recorded durations into a snapshot for cost estimation."""
+        instance_durations: Dict[Tuple[str, str], List[float]] = defaultdict(list)
+        repo_durations: Dict[Tuple[str, str], List[float]] = defaultdict(list)
+        with self._connect() as conn:
+            rows = conn.execute("SELECT instance_id, repo, stage, seconds FROM durations")
+            for instance_id, repo, stage, seconds in rows:
+                instance_durations[(instance_id, stage)].append(seconds)
+                repo_durations[(repo, stage)].append(seconds)
+            gold_rows = conn.execute(
+                "SELECT DISTINCT durations.repo, gold_baselines.instance_id, "
+                "gold_baselines.run_seconds FROM gold_baselines JOIN durations "
+                "ON durations.instance_id = gold_baselines.instance_id "
+                "WHERE gold_baselines.run_seconds IS NOT NULL"
+            )
+            gold_run_seconds: Dict[str, List[float]] = defaultdict(list)
+            for repo, _, seconds in gold_rows:
+                gold_run_seconds[repo].append(seconds)
+        return DurationEstimates(
+            instance_durations=dict(instance_durations),
+            repo_durations=dict(repo_durations),
+            gold_baselines=self.gold_baselines(),
+            gold_run_seconds=dict(gold_run_seconds),
+        )
@@ -0,0 +1,194 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: CC-BY-NC-4.0
+import json
+import sqlite3
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Set
+
+from loguru import logger
+
+if TYPE_CHECKING:
+    import docker
+
+# Stage transitions recorded per instance, in the order they happen
+JOURNAL_STAGES = [
+    "cloned",
+    "built",
+    "container_created",
+    "patched",
+    "run",
+    "parsed",
+    "scored",
+]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS transitions (
+    instance_id TEXT NOT NULL,
+    run_kind TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    finished_at REAL NOT NULL,
+    artifact TEXT,
+    detail TEXT
+);
+CREATE INDEX IF NOT EXISTS transitions_instance ON transitions (instance_id, run_kind);
+CREATE TABLE IF NOT EXISTS instances (
+    instance_id TEXT NOT NULL,
+    run_kind TEXT NOT NULL,
+    last_stage TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (instance_id, run_kind)
+);
+"""
+
+
+class RunJournal:
+    """A persistent SQLite journal of the stage transitions of every evaluated instance.
+
+    Evaluations and metrics-only runs are journaled separately (run_kind "evaluation" and
+    "metrics"), so a metrics-only run doesn't mark instances as evaluated.
+    """
+
+    def __init__(self, db_path: str, run_kind: str = "evaluation"):
+        self.db_path = str(Path(db_path).expanduser())
+        self.run_kind = run_kind
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=60)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def record(
+        self,
+        instance_id: str,
+        stage: str,
+        started_at: float,
+        artifact: Optional[str] = None,
+        **detail: Any,
+    ):
+        """Record that an instance completed a stage.
+
+        Args:
+            instance_id: The instance id.
+            stage: One of JOURNAL_STAGES.
+            started_at: Unix time the stage started.
+            artifact: Path or name of what the stage produced (repo dir, image, log file, ...).
+            detail: Extra json serializable information about the transition.
+        """
+        if stage not in JOURNAL_STAGES:
+            raise ValueError(f"Unknown journal stage: {stage}")
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO transitions VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    instance_id,
+                    self.run_kind,
+                    stage,
+                    started_at,
+                    now,
+                    artifact,
+                    json.dumps(detail) if detail else None,
+                ),
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO instances VALUES (?, ?, ?, ?)",
+                (instance_id, self.run_kind, stage, now),
+            )
+
+    def last_stage(self, instance_id: str) -> Optional[str]:
+        """Get the last stage an instance completed, or None if it was never journaled."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT last_stage FROM instances WHERE instance_id = ? AND run_kind = ?",
+                (instance_id, self.run_kind),
+            ).fetchone()
+        return row[0] if row else None
+
+    def last_transition(self, instance_id: str, stage: str) -> Optional[Dict[str, Any]]:
+        """Get the latest transition of an instance into the given stage."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT started_at, finished_at, artifact, detail FROM transitions "
+                "WHERE instance_id = ? AND run_kind = ? AND stage = ? "
+                "ORDER BY finished_at DESC LIMIT 1",
+                (instance_id, self.run_kind, stage),
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "started_at": row[0],
+            "finished_at": row[1],
+            "artifact": row[2],
+            "detail": json.loads(row[3]) if row[3] else {},
+        }
+
+    def completed_instances(self) -> Set[str]:
+        """Get the ids of all instances whose evaluation was completed."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT instance_id FROM instances WHERE run_kind = ? AND last_stage = 'scored'",
+                (self.run_kind,),
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def is_empty(self) -> bool:
+        """Whether no instance was journaled for this run kind yet."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT COUNT(*) FROM instances WHERE run_kind = ?", (self.run_kind,)
+            ).fetchone()
+        return row[0] == 0
+
+    def orphaned_containers(self) -> List[str]:
+        """Get the container names of instances that were interrupted while a container existed."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT DISTINCT t.artifact FROM transitions t JOIN instances i "
+                "ON t.instance_id = i.instance_id AND t.run_kind = i.run_kind "
+                "WHERE t.run_kind = ? AND t.stage = 'container_created' "
+                "AND i.last_stage IN ('container_created', 'patched')",
+                (self.run_kind,),
+            ).fetchall()
+        return [row[0] for row in rows if row[0]]
+
+    def stage_durations(self, instance_id: str) -> Dict[str, float]:
+        """Get the duration in seconds of the latest transition into every stage."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT stage, finished_at - started_at FROM transitions "
+                "WHERE instance_id = ? AND run_kind = ? ORDER BY finished_at",
+                (instance_id, self.run_kind),
+            ).fetchall()
+        return {stage: duration for stage, duration in rows}
+
+
+def cleanup_orphaned_containers(journal: RunJournal, client: "docker.DockerClient") -> int:
+    """Remove containers left behind by interrupted evaluations.
+
+    Returns:
+        The number of removed containers.
+    """
+    import docker
+
+    removed = 0
+    for container_name in journal.orphaned_containers():
+        try:
+            client.containers.get(container_name).remove(force=True)
+            removed += 1
+            logger.info(f"Removed orphaned container {container_name}")
+        except docker.errors.NotFound:
+            pass
+        except Exception as e:
+            logger.warning(f"Failed to remove orphaned container {container_name}: {e}")
+    return removed
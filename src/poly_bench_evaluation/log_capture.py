@@ -0,0 +1,101 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: CC-BY-NC-4.0
+import os
+import shutil
+import tempfile
+import threading
+from typing import List, Optional
+
+# Bytes kept in memory from the start and from the end of a captured output
+LOG_WINDOW_BYTES = 64 * 1024
+
+
+class LogCapture:
+    """Stream the output of a container exec to a log file with bounded memory.
+
+    Chunks are appended to spill files next to the log as they arrive, only the first and the
+    last window_bytes of the output stay in memory. close writes the log in the format the
+    parsers expect: stderr, then stdout, then the status lines. Writes after close are ignored,
+    so the thread of a timed out exec can't change a log that is already written.
+    """
+
+    def __init__(self, path: Optional[str] = None, window_bytes: int = LOG_WINDOW_BYTES):
+        """
+        Args:
+            path: The log file to write, a temporary file if None
+            window_bytes: Bytes kept in memory from the start and from the end of the output
+        """
+        if path is None:
+            fd, path = tempfile.mkstemp(prefix="polybench_run_", suffix=".log")
+            os.close(fd)
+        self.path = path
+        self.window_bytes = window_bytes
+        # Bytes of output received so far
+        self.size = 0
+        self._head = bytearray()
+        self._tail = bytearray()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._stdout = open(f"{path}.stdout", "wb")
+        self._stderr = open(f"{path}.stderr", "wb")
+
+    def write(self, data: bytes, stderr: bool = False):
+        """Append a chunk of stdout (or stderr) output."""
+        if not data:
+            return
+        with self._lock:
+            if self._closed:
+                return
+            (self._stderr if stderr else self._stdout).write(data)
+            self.size += len(data)
+            if len(self._head) < self.window_bytes:
+                self._head += data[: self.window_bytes - len(self._head)]
+            self._tail += data[-self.window_bytes :]
+            if len(self._tail) > self.window_bytes:
+                del self._tail[: len(self._tail) - self.window_bytes]
+
+    def excerpt(self) -> str:
+        """The start and the end of the output, with the size of what is left out between."""
+        with self._lock:
+            rest = self.size - len(self._head)
+            tail = bytes(self._tail[-rest:]) if rest > 0 else b""
+            skipped = rest - len(tail)
+            separator = f"\n... {skipped} bytes ...\n".encode("utf-8") if skipped else b""
+            return (bytes(self._head) + separator + tail).decode("utf-8", errors="replace")
+
+    def close(self, lines: List[str], keep_output: bool = True) -> str:
+        """Write the log file and remove the spill files.
+
+        Args:
+            lines: Status lines appended after the output, one per line
+            keep_output: Whether the log holds the output, or only the status lines
+        Returns:
+            str: The path of the log file
+        """
+        with self._lock:
+            if self._closed:
+                return self.path
+            self._closed = True
+            self._stdout.close()
+            self._stderr.close()
+        status = "\n".join(lines).encode("utf-8")
+        stdout_path, stderr_path = self._stdout.name, self._stderr.name
+        if keep_output and os.path.getsize(stderr_path) == 0:
+            # Most runs write nothing to stderr, the stdout spill file becomes the log as is
+            os.replace(stdout_path, self.path)
+            with open(self.path, "ab") as log:
+                if lines:
+                    log.write(b"\n" + status)
+        else:
+            with open(self.path, "wb") as log:
+                if keep_output:
+                    for spill_path in (stderr_path, stdout_path):
+                        with open(spill_path, "rb") as spill:
+                            shutil.copyfileobj(spill, log)
+                    if lines:
+                        log.write(b"\n")
+                log.write(status)
+        for spill_path in (stdout_path, stderr_path):
+            if os.path.exists(spill_path):
+                os.remove(spill_path)
+        return self.path
@@ -4,7 +4,6 @@ from dataclasses import asdict
 from typing import Dict, Optional, Set
 
 from loguru import logger
-from sklearn.metrics import f1_score, precision_score, recall_score
 
 from poly_bench_evaluation.polybench_data import PolyBenchInstance, PolyBenchRetrievalMetrics
 from poly_bench_evaluation.repo_utils import RepoManager
@@ -71,6 +70,8 @@ def instance_level_metric_scoring(
         elif prediction_problem:
             node_metrics = {"recall": 0.0, "precision": 0.0, "f1": 0.0}
         else:
+            from sklearn.metrics import f1_score, precision_score, recall_score
+
             node_metrics = {
                 "recall": recall_score(y_true, y_pred),
                 "precision": precision_score(y_true, y_pred),
@@ -3,8 +3,6 @@
 from dataclasses import dataclass
 from typing import List, Optional, Set, Tuple
 
-from sklearn.metrics import f1_score, precision_score, recall_score
-
 from poly_bench_evaluation.repo_utils import RepoManager
 
 from .patch_utils import Patch
@@ -54,6 +52,8 @@ def file_recall(reference_patch: Patch, predicted_patch: Patch, to_basename: boo
     Returns:
         The recall score.
     """
+    from sklearn.metrics import recall_score
+
     y_true, y_pred = _get_file_metric_inputs(reference_patch, predicted_patch, to_basename)
     return recall_score(y_true, y_pred)
 
@@ -71,6 +71,8 @@ def file_precision(
     Returns:
         The precision score.
     """
+    from sklearn.metrics import precision_score
+
     y_true, y_pred = _get_file_metric_inputs(reference_patch, predicted_patch, to_basename)
     return precision_score(y_true, y_pred)
 
@@ -88,6 +90,8 @@ def file_f1_score(
     Returns:
         The f1 score.
     """
+    from sklearn.metrics import f1_score
+
     y_true, y_pred = _get_file_metric_inputs(reference_patch, predicted_patch, to_basename)
     return f1_score(y_true, y_pred)
 
@@ -191,6 +195,8 @@ def node_retrieval_metrics(
     if not y_true:
         return None
 
+    from sklearn.metrics import f1_score, precision_score, recall_score
+
     recall = recall_score(y_true, y_pred)
     precision = precision_score(y_true, y_pred)
     f1 = f1_score(y_true, y_pred)
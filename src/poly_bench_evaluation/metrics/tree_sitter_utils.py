@@ -66,17 +66,27 @@ class LanguageTypeConfig:
 class LanguageConfig:
     # File extensions that are associated with a language
     extensions: Set[str]
-    # Tree-Sitter language object
-    tree_sitter_language_obj: Language
+    # Tree-Sitter language name, its grammar is loaded on first use
+    tree_sitter_language_name: str
     # Language type configurations
     types: Optional[LanguageTypeConfig] = None
 
+    @property
+    def tree_sitter_language_obj(self) -> Language:
+        return load_language(self.tree_sitter_language_name)
+
+
+@functools.lru_cache(maxsize=None)
+def load_language(language_name: str) -> Language:
+    """Load the tree-sitter grammar of a language, once per process."""
+    return get_language(language_name)
+
 
 # Define supported tree-sitter languages
 CODE_LANGUAGE_CONFIGS = {
     "java": LanguageConfig(
         extensions={".java"},
-        tree_sitter_language_obj=get_language("java"),
+        tree_sitter_language_name="java",
         types=LanguageTypeConfig(
             types_to_retain={
                 "class_declaration",
@@ -94,7 +104,7 @@ CODE_LANGUAGE_CONFIGS = {
     ),
     "javascript": LanguageConfig(
         extensions={".js", ".jsx", ".cjs"},
-        tree_sitter_language_obj=get_language("javascript"),
+        tree_sitter_language_name="javascript",
         types=LanguageTypeConfig(
             types_to_retain={"class_declaration", "function_declaration", "method_definition"},
             types_to_retain_if_top_level={"variable_declarator"},
@@ -103,7 +113,7 @@ CODE_LANGUAGE_CONFIGS = {
     ),
     "python": LanguageConfig(
         extensions={".py", ".py-tpl", ".pyi"},
-        tree_sitter_language_obj=get_language("python"),
+        tree_sitter_language_name="python",
         types=LanguageTypeConfig(
             types_to_retain={"class_definition", "with_statement", "function_definition"},
             types_to_retain_if_top_level={"assignment"},
@@ -112,7 +122,7 @@ CODE_LANGUAGE_CONFIGS = {
     ),
     "typescript": LanguageConfig(
         extensions={".ts"},
-        tree_sitter_language_obj=get_language("typescript"),
+        tree_sitter_language_name="typescript",
         types=LanguageTypeConfig(
             types_to_retain={
                 "class_declaration",
@@ -0,0 +1,204 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: CC-BY-NC-4.0
+import math
+import threading
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from poly_bench_evaluation.pipeline import StagedPipeline
+from poly_bench_evaluation.polybench_data import PolyBenchOutput
+from poly_bench_evaluation.tracing import Span
+
+# Upper bounds in seconds of the build and run duration histogram buckets
+DURATION_BUCKETS = (10, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200, math.inf)
+
+# Spans of the operations that talk to the docker daemon
+DOCKER_OPERATIONS = [
+    "docker_build",
+    "create_container",
+    "docker_run",
+]
+# Spans whose durations are observed in a histogram per language
+_DURATION_HISTOGRAMS = {
+    "docker_build": "polybench_build_duration_seconds",
+    "docker_run": "polybench_run_duration_seconds",
+}
+
+
+def _labels(**labels: str) -> str:
+    escaped = (
+        str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        for value in labels.values()
+    )
+    return "{" + ",".join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + "}"
+
+
+def _bound(bucket: float) -> str:
+    return "+Inf" if math.isinf(bucket) else str(bucket)
+
+
+class EvaluationMonitor:
+    """Live metrics of an evaluation run in the Prometheus text format.
+
+    Durations and docker errors are observed from the spans of a Tracer, results from the
+    stored pass rate outputs, and stage counters, queue depths and in-flight items are read
+    from the pipeline when the metrics are scraped.
+    """
+
+    def __init__(self, pipeline: Optional[StagedPipeline] = None):
+        self.pipeline = pipeline
+        self._lock = threading.Lock()
+        # Histogram name -> language -> (bucket counts, sum, count)
+        self._histograms: Dict[str, Dict[str, Tuple[List[int], float, int]]] = defaultdict(dict)
+        self._docker_errors: Dict[str, int] = defaultdict(int)
+        self._outputs = 0
+        self._resolved = 0
+        self._timed_out = 0
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    def observe_span(self, span: Span):
+        """Tracer listener that records durations and docker errors."""
+        with self._lock:
+            if span.error is not None and span.name in DOCKER_OPERATIONS:
+                self._docker_errors[span.name] += 1
+            histogram = _DURATION_HISTOGRAMS.get(span.name)
+            if histogram is None or span.error is not None:
+                return
+            language = span.attributes.get("language", "unknown")
+            buckets, total, count = self._histograms[histogram].get(
+                language, ([0] * len(DURATION_BUCKETS), 0.0, 0)
+            )
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if span.duration <= bound:
+                    buckets[i] += 1
+            self._histograms[histogram][language] = (buckets, total + span.duration, count + 1)
+
+    def observe_output(self, output: PolyBenchOutput):
+        """Record a stored pass rate output for the resolved rate."""
+        with self._lock:
+            self._outputs += 1
+            self._resolved += int(output.resolved)
+            self._timed_out += int(output.timed_out)
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text exposition format."""
+        lines: List[str] = []
+
+        def metric(name: str, kind: str, help_text: str, samples: List[Tuple[str, float]]):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(f"{name}{labels} {value}" for labels, value in samples)
+
+        if self.pipeline is not None:
+            stats = self.pipeline.stats()
+            metric(
+                "polybench_stage_completed_total",
+                "counter",
+                "Instances that completed a stage.",
+                [(_labels(stage=stage), value) for stage, value in stats["completed"].items()],
+            )
+            metric(
+                "polybench_stage_failed_total",
+                "counter",
+                "Instances that failed in a stage.",
+                [(_labels(stage=stage), value) for stage, value in stats["failed"].items()],
+            )
+            metric(
+                "polybench_queue_depth",
+                "gauge",
+                "Instances waiting in front of a stage.",
+                [(_labels(stage=stage), value) for stage, value in stats["queue_depth"].items()],
+            )
+            metric(
+                "polybench_in_flight",
+                "gauge",
+                "Instances being processed by a stage, e.g. running builds and test runs.",
+                [(_labels(stage=stage), value) for stage, value in stats["in_flight"].items()],
+            )
+
+        with self._lock:
+            docker_errors = dict(self._docker_errors)
+            histograms = {
+                name: {language: (list(b), t, c) for language, (b, t, c) in by_language.items()}
+                for name, by_language in self._histograms.items()
+            }
+            outputs, resolved, timed_out = self._outputs, self._resolved, self._timed_out
+
+        metric(
+            "polybench_docker_errors_total",
+            "counter",
+            "Docker operations that raised an error.",
+            [(_labels(operation=op), docker_errors.get(op, 0)) for op in DOCKER_OPERATIONS],
+        )
+        for name, help_text in (
+            ("polybench_build_duration_seconds", "Duration of docker image builds."),
+            ("polybench_run_duration_seconds", "Duration of test runs."),
+        ):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for language, (buckets, total, count) in sorted(histograms.get(name, {}).items()):
+                for bound, bucket_count in zip(DURATION_BUCKETS, buckets):
+                    lines.append(
+                        f"{name}_bucket{_labels(language=language, le=_bound(bound))} "
+                        f"{bucket_count}"
+                    )
+                lines.append(f"{name}_sum{_labels(language=language)} {total}")
+                lines.append(f"{name}_count{_labels(language=language)} {count}")
+
+        metric(
+            "polybench_results_total",
+            "counter",
+            "Stored pass rate results.",
+            [("", outputs)],
+        )
+        metric(
+            "polybench_resolved_rate",
+            "gauge",
+            "Fraction of the stored pass rate results that are resolved.",
+            [("", resolved / outputs if outputs else 0.0)],
+        )
+        metric(
+            "polybench_run_timeouts_total",
+            "counter",
+            "Stored pass rate results whose test run hit its timeout.",
+            [("", timed_out)],
+        )
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port: int, host: str = "127.0.0.1"):
+        """Serve the metrics on http://host:port/metrics from a background thread."""
+        monitor = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = monitor.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        thread = threading.Thread(
+            target=self._server.serve_forever, name="metrics-server", daemon=True
+        )
+        thread.start()
+        logger.info(
+            f"Serving evaluation metrics on http://{host}:{self._server.server_port}/metrics"
+        )
+
+    def shutdown(self):
+        """Stop the metrics server, if it was started."""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
@@ -0,0 +1,49 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: CC-BY-NC-4.0
+import importlib
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional
+
+
+def parse_test_log(parser_class_name: str, test_content: str) -> Dict:
+    """Parse a test run log with the parser class of its repo.
+
+    Raises:
+        ValueError: If the parsers module has no class of that name.
+    """
+    all_parsers = importlib.import_module("poly_bench_evaluation.parsers")
+    if not hasattr(all_parsers, parser_class_name):
+        raise ValueError(
+            f"Parser class {parser_class_name} not found in the parsers module. Please ensure proper paraser class name."
+        )
+    parser_class = getattr(all_parsers, parser_class_name)
+    return parser_class(test_content=test_content).parse()
+
+
+def parse_test_log_file(parser_class_name: str, log_path: str) -> Dict:
+    """Parse a stored test run log, so that only its path is sent to a worker process."""
+    # Logs are stored as the container wrote them, which needn't be valid UTF-8
+    with open(log_path, encoding="utf-8", errors="replace") as f:
+        return parse_test_log(parser_class_name, f.read())
+
+
+def default_cpu_workers(node_retrieval_metrics: bool) -> int:
+    """Get the default number of CPU workers.
+
+    Log parsing alone is cheap enough for the stage threads, the tree-sitter work of the node
+    retrieval metrics is not.
+    """
+    return (os.cpu_count() or 1) if node_retrieval_metrics else 0
+
+
+def create_cpu_pool(workers: int) -> Optional[ProcessPoolExecutor]:
+    """Create the process pool for CPU-bound work, or None to do it in the stage threads.
+
+    Workers are spawned rather than forked, forking the threaded evaluation process can copy
+    locks held by other threads.
+    """
+    if workers <= 0:
+        return None
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
@@ -0,0 +1,182 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: CC-BY-NC-4.0
+import queue
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+from loguru import logger
+
+_SENTINEL = object()
+
+
+@dataclass
+class Stage:
+    """A single pipeline stage with its own pool of worker threads."""
+
+    name: str
+    func: Callable[[Any], None]
+    num_workers: int = 1
+    # Optional affinity key of an item. Items with the same key are always processed by the
+    # same worker of this stage, in the order they arrive.
+    route: Optional[Callable[[Any], Optional[Hashable]]] = None
+
+
+class StagedPipeline:
+    """Run items through a sequence of stages, each with its own bounded queue and worker pool.
+
+    Every item visits the stages in order. A stage only blocks the items that are waiting for it,
+    so slow stages (e.g. docker builds) overlap with other stages (e.g. test runs) for different
+    items. Queues are bounded so a fast stage can't run arbitrarily far ahead of a slow one.
+
+    A stage with a route function gives every worker its own queue and pins all items with the
+    same affinity key to one worker. These per-worker queues are unbounded, so a busy pinned
+    worker doesn't block items for the other workers; a routed stage should therefore be a
+    stage whose waiting items hold no resources, such as the first one.
+    """
+
+    def __init__(
+        self,
+        stages: List[Stage],
+        queue_size: Optional[int] = None,
+        on_error: Optional[Callable[[Any, Exception], None]] = None,
+    ):
+        """
+        Args:
+            stages: The ordered list of stages.
+            queue_size: Maximum number of items waiting in front of each unrouted stage.
+                Defaults to the number of workers of that stage.
+            on_error: Callback invoked with the item and the exception when a stage fails. The
+                item is dropped from the pipeline afterwards.
+        """
+        if not stages:
+            raise ValueError("A pipeline needs at least one stage.")
+
+        self.stages = stages
+        self.on_error = on_error
+        # One shared queue per stage, or one queue per worker for routed stages
+        self.queues: List[List[queue.Queue]] = []
+        for stage in stages:
+            if stage.route is None:
+                self.queues.append([queue.Queue(maxsize=queue_size or max(1, stage.num_workers))])
+            else:
+                self.queues.append([queue.Queue() for _ in range(max(1, stage.num_workers))])
+        self.in_flight: Dict[str, int] = {stage.name: 0 for stage in stages}
+        # Items that were processed by, or failed in, each stage
+        self.stage_completed: Dict[str, int] = {stage.name: 0 for stage in stages}
+        self.stage_failed: Dict[str, int] = {stage.name: 0 for stage in stages}
+        # Items routed to every worker of a routed stage that were not processed yet
+        self._routed_pending: List[List[int]] = [[0] * len(qs) for qs in self.queues]
+        self._assignments: List[Dict[Hashable, int]] = [{} for _ in stages]
+        self.completed = 0
+        self.errors: List[Tuple[Any, Exception]] = []
+        self._lock = threading.Lock()
+
+    def queue_depths(self) -> Dict[str, int]:
+        """Return the number of items waiting in front of each stage."""
+        return {
+            stage.name: sum(q.qsize() for q in qs) for stage, qs in zip(self.stages, self.queues)
+        }
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Return a snapshot of the completed, failed, in-flight and waiting items per stage."""
+        with self._lock:
+            stats = {
+                "completed": dict(self.stage_completed),
+                "failed": dict(self.stage_failed),
+                "in_flight": dict(self.in_flight),
+            }
+        stats["queue_depth"] = self.queue_depths()
+        return stats
+
+    def _put(self, index: int, item: Any):
+        """Put an item in the queue of a stage, routing it to a worker if the stage is routed."""
+        stage = self.stages[index]
+        if stage.route is None:
+            self.queues[index][0].put(item)
+            return
+
+        key = stage.route(item)
+        with self._lock:
+            pending = self._routed_pending[index]
+            worker = self._assignments[index].get(key) if key is not None else None
+            if worker is None:
+                # New keys go to the worker with the least outstanding work
+                worker = min(range(len(pending)), key=lambda w: pending[w])
+                if key is not None:
+                    self._assignments[index][key] = worker
+            pending[worker] += 1
+        self.queues[index][worker].put(item)
+
+    def _worker(self, index: int, worker: int):
+        stage = self.stages[index]
+        routed = stage.route is not None
+        in_queue = self.queues[index][worker if routed else 0]
+        has_next = index + 1 < len(self.stages)
+
+        while True:
+            item = in_queue.get()
+            if item is _SENTINEL:
+                break
+
+            with self._lock:
+                self.in_flight[stage.name] += 1
+            try:
+                stage.func(item)
+            except Exception as e:
+                logger.exception(f"Stage {stage.name} failed: {e}")
+                with self._lock:
+                    self.errors.append((item, e))
+                    self.stage_failed[stage.name] += 1
+                if self.on_error is not None:
+                    try:
+                        self.on_error(item, e)
+                    except Exception as cleanup_error:
+                        logger.warning(
+                            f"Error handler for stage {stage.name} failed: {cleanup_error}"
+                        )
+                continue
+            finally:
+                with self._lock:
+                    self.in_flight[stage.name] -= 1
+                    if routed:
+                        self._routed_pending[index][worker] -= 1
+
+            with self._lock:
+                self.stage_completed[stage.name] += 1
+            if has_next:
+                self._put(index + 1, item)
+            else:
+                with self._lock:
+                    self.completed += 1
+
+    def run(self, items: Iterable[Any]):
+        """Feed all items through the pipeline and block until every item has left it.
+
+        Args:
+            items: The items to process, consumed lazily.
+        """
+        workers: List[List[threading.Thread]] = []
+        for index, stage in enumerate(self.stages):
+            threads = [
+                threading.Thread(
+                    target=self._worker, args=(index, n), name=f"{stage.name}-{n}", daemon=True
+                )
+                for n in range(max(1, stage.num_workers))
+            ]
+            for thread in threads:
+                thread.start()
+            workers.append(threads)
+
+        try:
+            for item in items:
+                self._put(0, item)
+        finally:
+            # Shut the stages down in order so every queued item is drained before the next
+            # stage is told to stop.
+            for index, threads in enumerate(workers):
+                for n in range(len(threads)):
+                    stage_queues = self.queues[index]
+                    stage_queues[n % len(stage_queues)].put(_SENTINEL)
+                for thread in threads:
+                    thread.join()
@@ -0,0 +1,249 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: CC-BY-NC-4.0
+import heapq
+import shutil
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Collection, Dict, List, Optional
+
+import pandas as pd
+from loguru import logger
+
+from poly_bench_evaluation.constants import LANGUAGE_DEFAULT_IMAGE_GB
+from poly_bench_evaluation.history import DurationEstimates
+from poly_bench_evaluation.scheduling import expected_costs
+
+if TYPE_CHECKING:
+    import docker
+
+_GB = 1024**3
+
+# An image is held from its build until the metrics stage releases the instance. The build and
+# run workers and the bounded queues in front of the run and parse stages hold most of them.
+IMAGES_HELD_PER_THREAD = 4
+
+
+@dataclass
+class InstancePlan:
+    """What the evaluation of one instance is expected to take."""
+
+    instance_id: str
+    repo: str
+    language: str
+    # Whether the instance was evaluated by a previous run in the result path
+    done: bool
+    # Whether the instance needs a test run at all (empty and gold-equivalent patches don't)
+    needs_run: bool
+    image_exists: bool
+    # Expected seconds of the image build (0 for existing images) and of the test run
+    build_seconds: float
+    run_seconds: float
+    # Size of the existing image, or the expected size of the image to build
+    image_gb: float
+
+    @property
+    def needs_build(self) -> bool:
+        return self.needs_run and not self.image_exists
+
+
+@dataclass
+class EvaluationPlan:
+    """A dry-run estimate of an evaluation: images to build, disk peak and wall time."""
+
+    instances: List[InstancePlan]
+    # Instances evaluated by a previous run that are skipped with --skip-existing
+    skipped: List[str]
+    build_threads: int
+    run_threads: int
+    delete_image: bool
+    missing_base_images: List[str] = field(default_factory=list)
+    base_images_gb: float = 0.0
+    # Free space of the file system of the docker root directory, if known
+    free_disk_gb: Optional[float] = None
+
+    @property
+    def to_build(self) -> List[InstancePlan]:
+        return [instance for instance in self.instances if instance.needs_build]
+
+    @property
+    def existing_images(self) -> List[InstancePlan]:
+        return [i for i in self.instances if i.needs_run and i.image_exists]
+
+    def disk_peak_gb(self, delete_image: bool) -> float:
+        """Estimate the peak of additional disk space used by new images.
+
+        Without delete_image every built image is kept. With it, an image is deleted once its
+        instance is evaluated, so only the largest images that can be held at once count. Image
+        sizes include their shared base layers, so this is an upper bound.
+        """
+        sizes = sorted((instance.image_gb for instance in self.to_build), reverse=True)
+        if delete_image:
+            sizes = sizes[: IMAGES_HELD_PER_THREAD * max(self.build_threads, self.run_threads)]
+        return self.base_images_gb + sum(sizes)
+
+    @property
+    def wall_seconds(self) -> float:
+        """Estimate the wall time of the evaluation in dataset order.
+
+        Every instance is built by the first free build worker, then run by the first free run
+        worker once its build is done.
+        """
+        build_free = [0.0] * max(1, self.build_threads)
+        run_free = [0.0] * max(1, self.run_threads)
+        finish = 0.0
+        for instance in self.instances:
+            if not instance.needs_run:
+                continue
+            built_at = heapq.heappop(build_free) + instance.build_seconds
+            heapq.heappush(build_free, built_at)
+            ran_at = max(built_at, heapq.heappop(run_free)) + instance.run_seconds
+            heapq.heappush(run_free, ran_at)
+            finish = max(finish, ran_at)
+        return finish
+
+    def render(self) -> str:
+        """Render the plan as a human readable report."""
+        done = [instance.instance_id for instance in self.instances if instance.done]
+        no_run = [instance for instance in self.instances if not instance.needs_run]
+        with_delete = self.disk_peak_gb(delete_image=True)
+        without_delete = self.disk_peak_gb(delete_image=False)
+        selected = with_delete if self.delete_image else without_delete
+        lines = [
+            f"Evaluation plan for {len(self.instances) + len(self.skipped)} instances",
+            f"  Already done: {len(self.skipped) + len(done)}"
+            + (f" ({len(self.skipped)} skipped with --skip-existing)" if self.skipped else "")
+            + (f" ({len(done)} evaluated again without --skip-existing)" if done else ""),
+            f"  To evaluate: {len(self.instances)}, of which {len(no_run)} need no test run "
+            "(empty or gold-equivalent patches)",
+            f"  Images to build: {len(self.to_build)}, existing images: "
+            f"{len(self.existing_images)}",
+        ]
+        if self.missing_base_images:
+            lines.append(f"  Base images to build: {', '.join(self.missing_base_images)}")
+        lines += [
+            f"  Estimated disk peak: {with_delete:.1f} GB with --delete-image, "
+            f"{without_delete:.1f} GB without",
+            f"  Estimated wall time: {self.wall_seconds / 3600:.1f} h with {self.build_threads} "
+            f"build and {self.run_threads} run threads",
+        ]
+        if self.free_disk_gb is not None:
+            lines.append(f"  Free disk space for docker: {self.free_disk_gb:.1f} GB")
+            if selected > self.free_disk_gb:
+                lines.append(
+                    f"  WARNING: the estimated disk peak of {selected:.1f} GB exceeds the free "
+                    "disk space" + ("" if self.delete_image else ", consider --delete-image")
+                )
+        return "\n".join(lines)
+
+
+def _local_images(client: "docker.DockerClient") -> Dict[str, float]:
+    """Get the size in GB of every local image tag, without the :latest suffix."""
+    sizes: Dict[str, float] = {}
+    for image in client.images.list():
+        for tag in image.tags:
+            sizes[tag.removesuffix(":latest")] = image.attrs.get("Size", 0) / _GB
+    return sizes
+
+
+def _free_disk_gb(client: "docker.DockerClient") -> Optional[float]:
+    try:
+        return shutil.disk_usage(client.info()["DockerRootDir"]).free / _GB
+    except Exception:
+        return None
+
+
+def plan_evaluation(
+    dataset: pd.DataFrame,
+    estimates: DurationEstimates,
+    client: Optional["docker.DockerClient"],
+    done_instances: Collection[str],
+    skipped: Collection[str],
+    build_threads: int,
+    run_threads: int,
+    delete_image: bool,
+    evaluate_gold: bool = False,
+) -> EvaluationPlan:
+    """Plan the evaluation of the dataset rows in their evaluation order.
+
+    Args:
+        dataset: The ordered dataset that would be evaluated.
+        estimates: Duration estimates of the run history.
+        client: Docker client to inspect the local images and free disk space with. Without
+            one, no image is assumed to exist.
+        done_instances: Instances whose results a previous run stored in the result path.
+        skipped: Done instances left out of the dataset by --skip-existing.
+        build_threads: Number of build workers.
+        run_threads: Number of test run workers.
+        delete_image: Whether images are deleted after their evaluation.
+        evaluate_gold: Whether the gold patches are evaluated.
+    """
+    images: Dict[str, float] = {}
+    free_disk_gb = None
+    if client is not None:
+        try:
+            images = _local_images(client)
+            free_disk_gb = _free_disk_gb(client)
+        except Exception as e:
+            logger.warning(f"Failed to inspect the local docker images, assuming none exist: {e}")
+
+    # Mean size of the existing instance images of every repo
+    repo_sizes: Dict[str, List[float]] = {}
+    for row in dataset.itertuples(index=False):
+        image_id = f"polybench_{row.language.lower()}_{row.instance_id.lower()}"
+        if image_id in images:
+            repo_sizes.setdefault(row.repo, []).append(images[image_id])
+
+    costs = expected_costs(dataset, estimates, evaluate_gold=evaluate_gold).tolist()
+    instances = []
+    for row, cost in zip(dataset.itertuples(index=False), costs):
+        image_id = f"polybench_{row.language.lower()}_{row.instance_id.lower()}"
+        image_exists = image_id in images
+        if image_exists:
+            image_gb = images[image_id]
+        elif row.repo in repo_sizes:
+            image_gb = sum(repo_sizes[row.repo]) / len(repo_sizes[row.repo])
+        else:
+            image_gb = LANGUAGE_DEFAULT_IMAGE_GB.get(
+                row.language, LANGUAGE_DEFAULT_IMAGE_GB["Python"]
+            )
+        needs_run = cost > 0
+        instances.append(
+            InstancePlan(
+                instance_id=row.instance_id,
+                repo=row.repo,
+                language=row.language,
+                done=row.instance_id in done_instances,
+                needs_run=needs_run,
+                image_exists=image_exists,
+                build_seconds=(
+                    0.0
+                    if image_exists or not needs_run
+                    else estimates.expected_duration(
+                        row.instance_id, row.repo, row.language, "build"
+                    )
+                ),
+                run_seconds=(
+                    estimates.expected_duration(row.instance_id, row.repo, row.language, "run")
+                    if needs_run
+                    else 0.0
+                ),
+                image_gb=image_gb,
+            )
+        )
+
+    languages = {i.language for i in instances if i.needs_build and i.language != "Python"}
+    missing_base_images = sorted(
+        language for language in languages if f"polybench_{language.lower()}_base" not in images
+    )
+    return EvaluationPlan(
+        instances=instances,
+        skipped=sorted(skipped),
+        build_threads=build_threads,
+        run_threads=run_threads,
+        delete_image=delete_image,
+        missing_base_images=missing_base_images,
+        base_images_gb=sum(
+            LANGUAGE_DEFAULT_IMAGE_GB.get(language, LANGUAGE_DEFAULT_IMAGE_GB["Python"])
+            for language in missing_base_images
+        ),
+        free_disk_gb=free_disk_gb,
+    )
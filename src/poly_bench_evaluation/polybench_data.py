@@ -2,7 +2,7 @@
 # SPDX-License-Identifier: CC-BY-NC-4.0
 import ast
 import json
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import Dict, List, Optional
 
 import pandas as pd
@@ -41,6 +41,11 @@ class PolyBenchOutput:
     resolved: bool
     passed_tests: List[str]
     failed_tests: List[str]
+    # Seconds spent in every operation of the evaluation (clone_repo, docker_build, ...)
+    durations: Dict[str, float] = field(default_factory=dict)
+    # Timeout of the test run in seconds, if the tests were run, and whether the run hit it
+    run_timeout: Optional[float] = None
+    timed_out: bool = False
 
 
 @dataclass
@@ -70,6 +75,29 @@ class AggregateOutput:
     total_unresolved: int
     file_retrieval: List[Dict[str, float]]
     node_retrieval: Optional[List[Dict[str, float]]]
+    # Evaluated instances whose gold baseline isn't resolved either, if baselines are known
+    gold_unresolved: Optional[List[str]] = None
+    # Evaluated instances whose test run hit its timeout
+    timed_out: List[str] = field(default_factory=list)
+
+
+def load_dataset_file(dataset_path: str) -> pd.DataFrame:
+    """Load a PolyBench dataset from a csv or json file, or the test split of a huggingface path.
+
+    Raises:
+        ValueError: If the dataset can't be loaded.
+    """
+    try:
+        if dataset_path.endswith(".csv"):
+            return pd.read_csv(dataset_path)
+        elif dataset_path.endswith(".json"):
+            return pd.read_json(dataset_path)
+        else:
+            from datasets import load_dataset
+
+            return load_dataset(dataset_path, split="test").to_pandas()
+    except Exception:
+        raise ValueError("Please provide a correct dataset file or huggingface path.")
 
 
 def dataset_generator(data: pd.DataFrame):
@@ -1,15 +1,24 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: CC-BY-NC-4.0
+import fcntl
+import io
+import os
 import shutil
 import subprocess
+import tarfile
+import tempfile
 import threading
 import time
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Optional
+from typing import BinaryIO, Dict, Iterator, List, Optional
 
 from git import Repo
 from loguru import logger
 
+# Files of the repo that the generated Dockerfile replaces or that would filter the context
+BUILD_CONTEXT_REPLACED_FILES = ("Dockerfile", ".dockerignore")
+
 
 class RepoManager:
     """A class for repo level operations."""
@@ -19,10 +28,17 @@ class RepoManager:
     _locks_lock = threading.Lock()  # Lock for accessing _repo_locks
 
     def __init__(self, repo_name: str, repo_path: str):
+        """
+        Args:
+            repo_name: The github repo name, e.g. "google/gson".
+            repo_path: The directory to store base repos.
+        """
         self.repo_name = repo_name
         self.repo_path: Path = Path(repo_path)
         self.tmp_repo_dir: Optional[Path] = None
         self.base_repo_dir: Optional[Path] = None
+        # The full hash of the commit prepared for open_build_context
+        self.commit: Optional[str] = None
 
     @classmethod
     def get_repo_lock(cls, repo_name: str) -> threading.Lock:
@@ -32,8 +48,14 @@ class RepoManager:
                 cls._repo_locks[repo_name] = threading.Lock()
             return cls._repo_locks[repo_name]
 
-    def clone_repo(self):
-        """Clone the repo to a temporary directory."""
+    def clone_repo(self, working_tree: bool = True):
+        """Clone the repo to a temporary directory.
+
+        Args:
+            working_tree: Whether to copy the base repo to a working tree of its own. Without
+                one, only the base repo is cloned and builds stream their context from it with
+                prepare_commit and open_build_context.
+        """
         # Get the lock for this specific repository
         repo_lock = self.get_repo_lock(self.repo_name)
 
@@ -47,20 +69,26 @@ class RepoManager:
             short_repo_name = self.repo_name.split("/")[-1]
             self.base_repo_dir = self.repo_path / short_repo_name
 
-            if not self.base_repo_dir.is_dir() or not (self.base_repo_dir / ".git").exists():
-                if self.base_repo_dir.exists():
-                    shutil.rmtree(self.base_repo_dir)
-                self.base_repo_dir.mkdir(parents=True, exist_ok=True)
-                try:
-                    Repo.clone_from(repo_url, self.base_repo_dir)
-                except Exception as e:
-                    # Clean up upon unsuccessful clone
-                    shutil.rmtree(self.base_repo_dir)
-                    raise ValueError(f"Git clone error: {e}")
+            # The thread lock doesn't cover the worker processes of the CPU pool
+            with open(self.repo_path / f".{short_repo_name}.lock", "w") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                if not self.base_repo_dir.is_dir() or not (self.base_repo_dir / ".git").exists():
+                    if self.base_repo_dir.exists():
+                        shutil.rmtree(self.base_repo_dir)
+                    self.base_repo_dir.mkdir(parents=True, exist_ok=True)
+                    try:
+                        Repo.clone_from(repo_url, self.base_repo_dir)
+                    except Exception as e:
+                        # Clean up upon unsuccessful clone
+                        shutil.rmtree(self.base_repo_dir)
+                        raise ValueError(f"Git clone error: {e}")
+
+        if not working_tree:
+            return
 
         # The following operations don't need the lock as they work with temporary directories
         # Copy base repo to temporary directory
-        repo_dir = Path("/tmp") / str(time.time()) / short_repo_name
+        repo_dir = Path("/tmp") / f"{time.time()}_{os.getpid()}" / short_repo_name
         if repo_dir.exists():
             shutil.rmtree(repo_dir)
         repo_dir.mkdir(parents=True, exist_ok=True)
@@ -121,6 +149,189 @@ class RepoManager:
         except Exception as e:
             raise ValueError(f"Git checkout error: {e}")
 
+    def prepare_commit(self, commit_hash: str):
+        """Make sure the base repo has a commit for open_build_context, without a checkout.
+
+        The base repo is only fetched if the commit is missing. Automatic gc is disabled for the
+        fetch, so objects never vanish while another build streams the repo.
+
+        Args:
+            commit_hash (str): The commit to build.
+        Raises:
+            ValueError: If the commit is not found in the repo.
+        """
+        assert self.base_repo_dir is not None, "Repo not cloned."
+        short_repo_name = self.base_repo_dir.name
+        with self.get_repo_lock(self.repo_name):
+            with open(self.repo_path / f".{short_repo_name}.lock", "w") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                commit = self._resolve_commit(commit_hash)
+                # sometimes git fetch gives error and retrying fixes it
+                retry_count = 0
+                while commit is None and retry_count < 5:
+                    fetch = self._git("-c", "gc.auto=0", "fetch", "--all", check=False)
+                    if fetch.returncode == 0:
+                        commit = self._resolve_commit(commit_hash)
+                        break
+                    retry_count += 1
+                    time.sleep(5)
+        if commit is None:
+            raise ValueError(f"Git checkout error: commit {commit_hash} not found")
+        self.commit = commit
+
+    @contextmanager
+    def open_build_context(
+        self, dockerfile_content: str, paths: Optional[List[str]] = None
+    ) -> Iterator[BinaryIO]:
+        """Stream the build context of the prepared commit as a tar, without a working tree.
+
+        A thread writes the context (see write_build_context) to a pipe, whose read end is
+        yielded to the build.
+
+        Args:
+            dockerfile_content: The Dockerfile added to the context
+            paths: Only put these paths of the repo in the context, all of them if None
+        Raises:
+            ValueError: If the context could not be written, unless the build stopped reading it.
+        """
+        read_fd, write_fd = os.pipe()
+        errors: List[Exception] = []
+
+        def write_context():
+            try:
+                with os.fdopen(write_fd, "wb") as pipe:
+                    self.write_build_context(pipe, dockerfile_content, paths)
+            except BrokenPipeError:
+                # The build stopped reading, e.g. because it failed
+                pass
+            except Exception as e:
+                errors.append(e)
+
+        writer = threading.Thread(target=write_context, daemon=True)
+        writer.start()
+        reader = os.fdopen(read_fd, "rb")
+        try:
+            yield reader
+        finally:
+            reader.close()
+            writer.join()
+        if errors:
+            raise ValueError(f"Error streaming the build context: {errors[0]}")
+
+    def write_build_context(
+        self, fileobj: BinaryIO, dockerfile_content: str, paths: Optional[List[str]] = None
+    ):
+        """Write the build context of the prepared commit to fileobj as a tar stream.
+
+        The context holds the files of the commit as a checkout would (read from the object
+        store, so the export-ignore attributes of git archive don't apply), the .git directory
+        of the base repo with HEAD detached at the commit and an index of it, and the
+        Dockerfile. The Dockerfile and .dockerignore of the repo are left out. With paths, only
+        these paths of the commit are added, and .git only if one of them is in it.
+        """
+        assert self.base_repo_dir is not None and self.commit is not None, "No commit prepared."
+        mtime = int(self._git("show", "-s", "--format=%ct", self.commit).stdout)
+        with tarfile.open(fileobj=fileobj, mode="w|") as tar:
+            self._add_commit_files(tar, paths, mtime)
+            if paths is None or any(path.split("/")[0] == ".git" for path in paths):
+                self._add_git_dir(tar, mtime)
+            dockerfile = dockerfile_content.encode("utf-8")
+            tar.addfile(_tar_info("Dockerfile", len(dockerfile), mtime), io.BytesIO(dockerfile))
+
+    def _add_commit_files(self, tar: tarfile.TarFile, paths: Optional[List[str]], mtime: int):
+        assert self.commit is not None, "No commit prepared."
+        ls_tree = self._git("ls-tree", "-r", "-z", "--full-tree", self.commit, "--", *(paths or []))
+        cat_file = subprocess.Popen(
+            ["git", "-C", str(self.base_repo_dir), "cat-file", "--batch"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+        )
+        assert cat_file.stdin is not None and cat_file.stdout is not None
+        try:
+            for entry in ls_tree.stdout.split(b"\0"):
+                if not entry:
+                    continue
+                meta, name = entry.split(b"\t", 1)
+                mode, object_type, object_id = meta.split()
+                arcname = name.decode("utf-8", errors="surrogateescape")
+                if arcname in BUILD_CONTEXT_REPLACED_FILES:
+                    continue
+                if object_type == b"commit":
+                    # Submodules are empty directories, as in a checkout without them
+                    info = _tar_info(arcname, 0, mtime)
+                    info.type = tarfile.DIRTYPE
+                    info.mode = 0o755
+                    tar.addfile(info)
+                    continue
+                # Objects are read one by one, so neither pipe fills up
+                cat_file.stdin.write(object_id + b"\n")
+                cat_file.stdin.flush()
+                size = int(cat_file.stdout.readline().split()[2])
+                info = _tar_info(arcname, size, mtime)
+                if mode == b"120000":
+                    info.type = tarfile.SYMTYPE
+                    info.size = 0
+                    info.linkname = cat_file.stdout.read(size).decode(
+                        "utf-8", errors="surrogateescape"
+                    )
+                    tar.addfile(info)
+                else:
+                    info.mode = 0o755 if mode == b"100755" else 0o644
+                    tar.addfile(info, cat_file.stdout)
+                cat_file.stdout.read(1)
+        finally:
+            cat_file.stdin.close()
+            cat_file.stdout.close()
+            cat_file.wait()
+
+    def _add_git_dir(self, tar: tarfile.TarFile, mtime: int):
+        assert self.base_repo_dir is not None and self.commit is not None
+        git_dir = self.base_repo_dir / ".git"
+        for root, dirs, files in os.walk(git_dir):
+            dirs.sort()
+            arcroot = Path(".git") / Path(root).relative_to(git_dir)
+            tar.addfile(tar.gettarinfo(root, arcname=str(arcroot)))
+            for name in sorted(files):
+                arcname = str(arcroot / name)
+                if arcname in (".git/HEAD", ".git/index") or name.endswith(".lock"):
+                    continue
+                path = os.path.join(root, name)
+                if os.path.islink(path):
+                    tar.add(path, arcname=arcname, recursive=False)
+                    continue
+                try:
+                    git_file = open(path, "rb")
+                except FileNotFoundError:
+                    # Temporary files of a fetch
+                    continue
+                # The size is taken from the open file, files replaced meanwhile stay consistent
+                with git_file:
+                    tar.addfile(tar.gettarinfo(arcname=arcname, fileobj=git_file), git_file)
+
+        head = f"{self.commit}\n".encode("utf-8")
+        tar.addfile(_tar_info(".git/HEAD", len(head), mtime), io.BytesIO(head))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            index_path = Path(tmp_dir) / "index"
+            # An index of the commit without stat data, git refreshes it on first use
+            self._git(
+                "read-tree", self.commit, env={**os.environ, "GIT_INDEX_FILE": str(index_path)}
+            )
+            with open(index_path, "rb") as index:
+                tar.addfile(tar.gettarinfo(arcname=".git/index", fileobj=index), index)
+
+    def _resolve_commit(self, commit_hash: str) -> Optional[str]:
+        result = self._git(
+            "rev-parse", "--verify", "--quiet", f"{commit_hash}^{{commit}}", check=False
+        )
+        return result.stdout.decode("utf-8").strip() if result.returncode == 0 else None
+
+    def _git(
+        self, *args: str, check: bool = True, env: Optional[Dict[str, str]] = None
+    ) -> subprocess.CompletedProcess:
+        return subprocess.run(
+            ["git", "-C", str(self.base_repo_dir), *args], capture_output=True, check=check, env=env
+        )
+
     def _cleanup(self):
         """Remove the temporary directory used for cloning the repo if needed."""
         if self.tmp_repo_dir and self.tmp_repo_dir.exists():
@@ -183,3 +394,11 @@ class RepoManager:
     def __del__(self):
         """Remove the temporary directory used for cloning the repo if needed."""
         self._cleanup()
+
+
+def _tar_info(name: str, size: int, mtime: int) -> tarfile.TarInfo:
+    info = tarfile.TarInfo(name=name)
+    info.size = size
+    info.mtime = mtime
+    info.mode = 0o644
+    return info
@@ -0,0 +1,227 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: CC-BY-NC-4.0
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional
+
+from loguru import logger
+
+from poly_bench_evaluation.constants import LANGUAGE_RESOURCE_WEIGHTS, REPO_RESOURCE_WEIGHTS
+
+_GB = 1024**3
+
+# Observed peaks are scaled by this margin before they are used as an admission weight
+OBSERVED_WEIGHT_MARGIN = 1.25
+
+
+@dataclass
+class ResourceWeight:
+    """Resources (CPU cores, memory and disk in GB) claimed by one container run."""
+
+    cpus: float
+    memory_gb: float
+    disk_gb: float
+
+    def __add__(self, other: "ResourceWeight") -> "ResourceWeight":
+        return ResourceWeight(
+            cpus=self.cpus + other.cpus,
+            memory_gb=self.memory_gb + other.memory_gb,
+            disk_gb=self.disk_gb + other.disk_gb,
+        )
+
+    def __sub__(self, other: "ResourceWeight") -> "ResourceWeight":
+        return ResourceWeight(
+            cpus=self.cpus - other.cpus,
+            memory_gb=self.memory_gb - other.memory_gb,
+            disk_gb=self.disk_gb - other.disk_gb,
+        )
+
+    def fits_in(self, capacity: "ResourceWeight") -> bool:
+        """Whether this weight fits in the given capacity for every resource."""
+        return (
+            self.cpus <= capacity.cpus
+            and self.memory_gb <= capacity.memory_gb
+            and self.disk_gb <= capacity.disk_gb
+        )
+
+    def clamp(self, capacity: "ResourceWeight") -> "ResourceWeight":
+        """Limit every resource to the given capacity."""
+        return ResourceWeight(
+            cpus=min(self.cpus, capacity.cpus),
+            memory_gb=min(self.memory_gb, capacity.memory_gb),
+            disk_gb=min(self.disk_gb, capacity.disk_gb),
+        )
+
+
+def _read_first_line(path: Path) -> Optional[str]:
+    try:
+        return path.read_text().splitlines()[0].strip()
+    except (OSError, IndexError):
+        return None
+
+
+def _read_cgroup_cpus(cgroup_root: Path) -> Optional[float]:
+    # cgroup v2: "<quota> <period>" or "max <period>"
+    cpu_max = _read_first_line(cgroup_root / "cpu.max")
+    if cpu_max:
+        quota, _, period = cpu_max.partition(" ")
+        if quota != "max" and period:
+            return int(quota) / int(period)
+        return None
+
+    # cgroup v1
+    quota_line = _read_first_line(cgroup_root / "cpu" / "cpu.cfs_quota_us")
+    period_line = _read_first_line(cgroup_root / "cpu" / "cpu.cfs_period_us")
+    if quota_line and period_line and int(quota_line) > 0:
+        return int(quota_line) / int(period_line)
+    return None
+
+
+def _read_cgroup_memory(cgroup_root: Path) -> Optional[int]:
+    # cgroup v2
+    memory_max = _read_first_line(cgroup_root / "memory.max")
+    if memory_max:
+        return None if memory_max == "max" else int(memory_max)
+
+    # cgroup v1, where "unlimited" is reported as a huge number
+    limit = _read_first_line(cgroup_root / "memory" / "memory.limit_in_bytes")
+    if limit and int(limit) < 2**60:
+        return int(limit)
+    return None
+
+
+def _read_meminfo_total(proc_root: Path) -> Optional[int]:
+    try:
+        for line in (proc_root / "meminfo").read_text().splitlines():
+            if line.startswith("MemTotal:"):
+                return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def read_host_capacity(
+    disk_path: str = "/var/lib/docker",
+    cgroup_root: str = "/sys/fs/cgroup",
+    proc_root: str = "/proc",
+) -> ResourceWeight:
+    """Read the resources available to this host from cgroups and /proc.
+
+    cgroup limits take precedence over the host totals when they are lower.
+
+    Args:
+        disk_path: Path whose file system holds the docker data (falls back to "/").
+        cgroup_root: Mount point of the cgroup hierarchy.
+        proc_root: Mount point of procfs.
+
+    Returns:
+        The host capacity.
+    """
+    try:
+        host_cpus = float(len(os.sched_getaffinity(0)))
+    except AttributeError:
+        host_cpus = float(os.cpu_count() or 1)
+    cgroup_cpus = _read_cgroup_cpus(Path(cgroup_root))
+    cpus = min(host_cpus, cgroup_cpus) if cgroup_cpus else host_cpus
+
+    memory_candidates = [
+        value
+        for value in (_read_meminfo_total(Path(proc_root)), _read_cgroup_memory(Path(cgroup_root)))
+        if value
+    ]
+    memory_gb = min(memory_candidates) / _GB if memory_candidates else float("inf")
+
+    path = disk_path if Path(disk_path).exists() else "/"
+    disk_gb = shutil.disk_usage(path).free / _GB
+
+    return ResourceWeight(cpus=cpus, memory_gb=memory_gb, disk_gb=disk_gb)
+
+
+def declared_weight(repo: str, language: str) -> ResourceWeight:
+    """Get the declared resource weight of a repo, falling back to its language default."""
+    if repo in REPO_RESOURCE_WEIGHTS:
+        return ResourceWeight(*REPO_RESOURCE_WEIGHTS[repo])
+    return ResourceWeight(
+        *LANGUAGE_RESOURCE_WEIGHTS.get(language, LANGUAGE_RESOURCE_WEIGHTS["Python"])
+    )
+
+
+class ResourceAdmission:
+    """Admit container runs only while their resource weights fit in the host capacity.
+
+    The weight of a run is the declared weight of its repo (or language) until a run of the
+    same repo has been observed; afterwards the observed CPU and memory peaks (with a margin)
+    are used, so light repos can fill the gaps left by heavy ones.
+    """
+
+    def __init__(self, capacity: ResourceWeight, headroom: float = 0.9):
+        """
+        Args:
+            capacity: The total host capacity.
+            headroom: Fraction of the capacity that may be handed out to container runs.
+        """
+        self.capacity = ResourceWeight(
+            cpus=capacity.cpus * headroom,
+            memory_gb=capacity.memory_gb * headroom,
+            disk_gb=capacity.disk_gb * headroom,
+        )
+        self.in_use = ResourceWeight(cpus=0.0, memory_gb=0.0, disk_gb=0.0)
+        self.running = 0
+        self._observed: Dict[str, ResourceWeight] = {}
+        self._condition = threading.Condition()
+
+    def weight_for(self, repo: str, language: str) -> ResourceWeight:
+        """Get the admission weight of a run of the given repo."""
+        declared = declared_weight(repo=repo, language=language)
+        with self._condition:
+            observed = self._observed.get(repo)
+        if observed is None:
+            return declared
+        return ResourceWeight(
+            cpus=observed.cpus * OBSERVED_WEIGHT_MARGIN,
+            memory_gb=observed.memory_gb * OBSERVED_WEIGHT_MARGIN,
+            disk_gb=declared.disk_gb,
+        )
+
+    def record_observation(self, repo: str, cpus: float, memory_gb: float):
+        """Record the observed CPU and memory peak of a finished run of the given repo."""
+        if cpus <= 0 and memory_gb <= 0:
+            return
+        with self._condition:
+            previous = self._observed.get(repo)
+            if previous is not None:
+                cpus = max(cpus, previous.cpus)
+                memory_gb = max(memory_gb, previous.memory_gb)
+            self._observed[repo] = ResourceWeight(cpus=cpus, memory_gb=memory_gb, disk_gb=0.0)
+
+    @contextmanager
+    def admit(self, weight: ResourceWeight, name: str = ""):
+        """Block until the weight fits in the free capacity and hold it for the duration.
+
+        A run that is larger than the whole capacity is admitted once nothing else runs.
+
+        Args:
+            weight: The resource weight of the run.
+            name: Name used in log messages.
+        """
+        weight = weight.clamp(self.capacity)
+        with self._condition:
+            waited = False
+            while self.running > 0 and not (self.in_use + weight).fits_in(self.capacity):
+                if not waited:
+                    logger.info(f"Waiting for free resources to run {name} ({weight})")
+                    waited = True
+                self._condition.wait()
+            self.in_use = self.in_use + weight
+            self.running += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self.in_use = self.in_use - weight
+                self.running -= 1
+                self._condition.notify_all()
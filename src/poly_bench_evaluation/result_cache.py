@@ -0,0 +1,146 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: CC-BY-NC-4.0
+import hashlib
+import json
+import sqlite3
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, replace
+from importlib.metadata import PackageNotFoundError, version
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from poly_bench_evaluation.polybench_data import (
+    PolyBenchInstance,
+    PolyBenchOutput,
+    PolyBenchRetrievalMetrics,
+)
+
+# Kinds of cached outputs
+CACHE_OUTPUT = "output"
+CACHE_METRICS = "metrics"
+# Version of the cached results, part of every cache key. Bump it whenever the stored result
+# format, the log capture or the parsing and scoring of results change, so older entries are
+# no longer used: the package version usually stays the same across such changes.
+RESULT_SCHEMA_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    value TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+
+def package_version() -> str:
+    """Get the installed version of this package, part of every cache key."""
+    try:
+        return version("poly_bench_evaluation")
+    except PackageNotFoundError:
+        return "unknown"
+
+
+def _digest(fields: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(fields, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def output_key(instance: PolyBenchInstance, model_patch: str, parser_class_name: str) -> str:
+    """Get the cache key of the pass rate output of a patch.
+
+    The key covers everything the test run and its scoring depend on, but not the instance id
+    or model name, so identical patches share one entry.
+    """
+    return _digest(
+        {
+            "kind": CACHE_OUTPUT,
+            "repo": instance.repo,
+            "base_commit": instance.base_commit,
+            "model_patch": model_patch,
+            "test_patch": instance.test_patch,
+            "dockerfile": instance.dockerfile,
+            "test_command": instance.test_command,
+            "f2p": sorted(instance.f2p),
+            "p2p": sorted(instance.p2p),
+            "parser_class": parser_class_name,
+            "version": package_version(),
+            "schema": RESULT_SCHEMA_VERSION,
+        }
+    )
+
+
+def metrics_key(instance: PolyBenchInstance, node_retrieval_metrics: bool) -> str:
+    """Get the cache key of the retrieval metrics of the model patch of an instance."""
+    return _digest(
+        {
+            "kind": CACHE_METRICS,
+            "repo": instance.repo,
+            "base_commit": instance.base_commit,
+            "model_patch": instance.model_patch,
+            "patch": instance.patch,
+            "modified_nodes": instance.modified_nodes,
+            "node_retrieval_metrics": node_retrieval_metrics,
+            "version": package_version(),
+            "schema": RESULT_SCHEMA_VERSION,
+        }
+    )
+
+
+class ResultCache:
+    """A local content-addressed SQLite cache of instance level outputs.
+
+    Outputs are stored without their instance id and handed back under the id of the instance
+    that looks them up.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = str(Path(db_path).expanduser())
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=60)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _put(self, key: str, kind: str, value: Dict[str, Any]):
+        value = {**value, "instance_id": None}
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+                (key, kind, json.dumps(value), time.time()),
+            )
+
+    def get_output(self, key: str, instance_id: str) -> Optional[PolyBenchOutput]:
+        """Get a cached pass rate output for the given instance id, if there is one."""
+        value = self._get(key)
+        if value is None:
+            return None
+        return replace(PolyBenchOutput(**value), instance_id=instance_id)
+
+    def put_output(self, key: str, output: PolyBenchOutput):
+        """Store a pass rate output."""
+        self._put(key, CACHE_OUTPUT, asdict(output))
+
+    def get_metrics(self, key: str, instance_id: str) -> Optional[PolyBenchRetrievalMetrics]:
+        """Get cached retrieval metrics for the given instance id, if there are any."""
+        value = self._get(key)
+        if value is None:
+            return None
+        return replace(PolyBenchRetrievalMetrics(**value), instance_id=instance_id)
+
+    def put_metrics(self, key: str, metrics: PolyBenchRetrievalMetrics):
+        """Store retrieval metrics."""
+        self._put(key, CACHE_METRICS, asdict(metrics))
@@ -2,13 +2,15 @@
 # SPDX-License-Identifier: CC-BY-NC-4.0
 
 import argparse
-import importlib
-from multiprocessing.pool import ThreadPool
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field, replace
+from functools import partial
 from pathlib import Path
-from typing import Union, List
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Protocol, Set, Tuple, Union
 import json
 import sys
-import docker
+import time
 import pandas as pd
 from loguru import logger
 from unidiff import PatchSet
@@ -16,8 +18,27 @@ from unidiff import PatchSet
 logger.remove()
 logger.add(sink=sys.stderr, level="DEBUG")
 
-from poly_bench_evaluation.constants import DEFAULT_TIMEOUT, JAVA_TIMEOUT, REPO_TO_PARSER_CLASS
-from poly_bench_evaluation.docker_utils import DockerManager
+from poly_bench_evaluation.constants import REPO_TO_PARSER_CLASS
+from poly_bench_evaluation.dedup import (
+    SUBMITTER_COLUMN,
+    PatchGroup,
+    group_predictions,
+    load_predictions,
+    patch_hash,
+    sample_family,
+)
+from poly_bench_evaluation.distributed import WorkerOptions, run_coordinator
+from poly_bench_evaluation.docker_utils import (
+    BUILD_BACKENDS,
+    WARM_CONTAINER_IDLE_SECONDS,
+    BuildCache,
+    ContainerPool,
+    DockerManager,
+    dockerfile_context_paths,
+    prepare_dockerfile,
+)
+from poly_bench_evaluation.history import DurationEstimates, GoldBaseline, RunHistory
+from poly_bench_evaluation.journal import RunJournal, cleanup_orphaned_containers
 from poly_bench_evaluation.metrics.metric_scoring import (
     _get_zero_result,
     instance_level_metric_scoring,
@@ -27,14 +48,44 @@ from poly_bench_evaluation.polybench_data import (
     PolyBenchOutput,
     PolyBenchRetrievalMetrics,
     dataset_generator,
+    load_dataset_file,
+)
+from poly_bench_evaluation.monitoring import EvaluationMonitor
+from poly_bench_evaluation.offload import create_cpu_pool, default_cpu_workers, parse_test_log_file
+from poly_bench_evaluation.pipeline import Stage, StagedPipeline
+from poly_bench_evaluation.planner import plan_evaluation
+from poly_bench_evaluation.scheduling import (
+    AFFINITY_GROUP_COLUMN,
+    ORDER_AFFINITY,
+    ORDER_DATASET,
+    ORDERING_POLICIES,
+    order_dataset,
 )
 from poly_bench_evaluation.repo_utils import RepoManager
+from poly_bench_evaluation.resources import ResourceAdmission, read_host_capacity
+from poly_bench_evaluation.result_cache import ResultCache, metrics_key, output_key
+from poly_bench_evaluation.sharding import merge_shards, shard_dataset, write_shard_manifest
+from poly_bench_evaluation.streaming import follow_predictions
+from poly_bench_evaluation.tracing import Tracer
 from poly_bench_evaluation.scoring import (
     aggregate_logs,
+    aggregate_pass_at_k,
     instance_level_scoring,
     store_instance_level_output,
 )
-from datasets import load_dataset
+
+if TYPE_CHECKING:
+    import docker
+
+
+# Candidate duration keys of the steps of the evaluation bundle
+BUNDLE_STEP_DURATION_KEYS = {
+    "apply_code_patch": "apply_code_patch",
+    "reset_files": "reset_files",
+    "apply_test_patch": "apply_test_patch",
+    "run_tests": "docker_run",
+}
+
 
 def _get_modified_files(patch: str) -> List[str]:
     """
@@ -47,106 +98,375 @@ def _get_modified_files(patch: str) -> List[str]:
     source_files = [x[2:] for x in source_files if x.startswith("a/")]
     return source_files
 
-def evaluate_instance(
-    instance: PolyBenchInstance,
-    result_path: str,
-    evaluate_gold: bool,
-    repo_path: str,
-    delete_image: bool,
-    client: docker.DockerClient,
-    retrieval_metrics_only: bool = False,
-    node_retrieval_metrics: bool = False,
-):
-    """Instance level evaluation function.
-    Args:
-        instance: PolyBench row instance
-        result_path: Path to store the output results.
-        evaluate_gold: whether to evaluate the gold patch
-        repo_path: Base repo close path.
-        delete_image: whether to delete the image after docker build
-        client: The docker client
-        retrieval_metrics_only: Whether to only compute retrieval metrics.
-        node_retrieval_metrics: Whether to compute compute-heavy node retrieval metrics.
-    Raises:
-        ValueError: if the docker build fails
-    """
-    instance_id = instance.instance_id
-    model_patch = instance.model_patch if instance.model_patch else ""
-    test_patch = instance.test_patch
-    repo = instance.repo
-    base_commit = instance.base_commit
-    language = instance.language
-    parser_class_name = REPO_TO_PARSER_CLASS.get(repo, None)
+@dataclass
+class EvaluationOptions:
+    """Run level settings shared by every instance evaluation."""
 
-    if not parser_class_name:
-        raise ValueError(f"Parser class not found for repo: {repo}. Please check the repo name.")
+    result_path: str
+    evaluate_gold: bool
+    repo_path: str
+    delete_image: bool
+    client: "docker.DockerClient"
+    retrieval_metrics_only: bool = False
+    node_retrieval_metrics: bool = False
+    admission: Optional[ResourceAdmission] = None
+    journal: Optional[RunJournal] = None
+    # Whether interrupted evaluations resume from their last journaled stage
+    resume: bool = False
+    history: Optional[RunHistory] = None
+    # Recorded gold runs the test run timeouts are learned from, None uses the static defaults
+    run_timeouts: Optional[DurationEstimates] = None
+    result_cache: Optional[ResultCache] = None
+    tracer: Optional[Tracer] = None
+    monitor: Optional[EvaluationMonitor] = None
+    # Skip the remaining candidates of a submitter once its pass@k of this k is decided
+    early_exit_k: Optional[int] = None
+    # Process pool the log parsing and retrieval metrics run in, None runs them in the threads
+    cpu_pool: Optional[ProcessPoolExecutor] = None
+    # Warm containers reused across evaluations of the same image, None removes them after use
+    container_pool: Optional[ContainerPool] = None
+    # Backend of the instance image builds, one of BUILD_BACKENDS
+    build_backend: str = "docker"
+    # Local BuildKit cache of the buildx builds, shared by the instances of a repo
+    build_cache: Optional[BuildCache] = None
 
-    f2p = instance.f2p
-    p2p = instance.p2p
-    test_command = instance.test_command
 
-    if evaluate_gold:
-        model_patch = instance.patch
+@dataclass
+class Candidate:
+    """A distinct patch evaluated for an instance, stored for every submitter that sent it."""
 
-    instance_output: Union[PolyBenchOutput, PolyBenchRetrievalMetrics]
-    if retrieval_metrics_only:
-        logger.info(f"Computing only retrieval metrics for {instance_id}")
-        instance_output = instance_level_metric_scoring(
-            instance=instance,
-            repo_path=repo_path,
-            node_retrieval_metrics=node_retrieval_metrics,
-            modified_nodes=instance.modified_nodes,
+    model_patch: str
+    # Result directories the outputs are stored in, one per submitter
+    result_paths: List[str]
+    # The test run log, streamed to disk during the run and parsed from there
+    run_log_file: Optional[str] = None
+    # Set once the pass rate result is stored, the remaining docker stages are skipped
+    finished: bool = False
+    # Whether zero retrieval metrics are stored instead of computing them
+    zero_metrics: bool = False
+    # Result cache key of the pass rate output, if a result cache is used
+    cache_key: Optional[str] = None
+    # Whether the test run hit its timeout, such results are not cached
+    timed_out: bool = False
+    run_timeout: Optional[float] = None
+    run_seconds: Optional[float] = None
+    # Whether the stored pass rate result is resolved
+    resolved: Optional[bool] = None
+    # Set if the early exit skipped the candidate, nothing is stored for it
+    skipped: bool = False
+    # Seconds spent in the operations of this candidate, by operation
+    durations: Dict[str, float] = field(default_factory=dict)
+
+
+@dataclass
+class InstanceState:
+    """Per instance state handed from one evaluation stage to the next."""
+
+    instance: PolyBenchInstance
+    # Distinct patches to evaluate against the instance image. Defaults to the model patch of
+    # the instance (or its gold patch) stored in the run result path.
+    candidates: List[Candidate] = field(default_factory=list)
+    image_id: str = ""
+    parser_class_name: str = ""
+    docker_manager: Optional[DockerManager] = None
+    repo_manager: Optional[RepoManager] = None
+    # Affinity group of the instance; instances of a group share a checkout worker
+    affinity_key: Optional[str] = None
+    # Whether the container of the previous candidate was kept to run the next one in
+    container_kept: bool = False
+    # Seconds spent in the operations shared by all candidates (clone, build), by operation
+    durations: Dict[str, float] = field(default_factory=dict)
+
+    @property
+    def finished(self) -> bool:
+        """Whether the pass rate results of all candidates are stored."""
+        return all(candidate.finished for candidate in self.candidates)
+
+
+def _result_file(result_path: str, instance_id: str) -> str:
+    return str(Path(result_path) / f"{instance_id}_result.json")
+
+
+def _journal(
+    options: EvaluationOptions,
+    state: InstanceState,
+    stage: str,
+    started_at: float,
+    artifact: Optional[str] = None,
+    **detail,
+):
+    """Record a stage transition of the instance if the run is journaled."""
+    if options.journal is not None:
+        options.journal.record(
+            state.instance.instance_id, stage, started_at, artifact=artifact, **detail
         )
-        store_instance_level_output(
-            instance_output=instance_output, result_path=result_path, suffix="_metrics"
+
+
+def _record_duration(
+    options: EvaluationOptions, state: InstanceState, stage: str, started_at: float
+):
+    """Record the duration of a stage in the run history, if one is kept."""
+    if options.history is not None:
+        instance = state.instance
+        options.history.record_duration(
+            instance_id=instance.instance_id,
+            repo=instance.repo,
+            language=instance.language,
+            stage=stage,
+            seconds=time.time() - started_at,
         )
+
+
+@contextmanager
+def _span(
+    options: EvaluationOptions,
+    state: InstanceState,
+    name: str,
+    candidate: Optional[Candidate] = None,
+    duration_key: Optional[str] = None,
+    **attributes,
+):
+    """Time an operation of an instance, in the trace if one is kept and in its durations.
+
+    Yields the trace span, or None without a tracer.
+    """
+    started_at = time.time()
+    try:
+        if options.tracer is None:
+            yield None
+        else:
+            instance = state.instance
+            with options.tracer.span(
+                name,
+                instance_id=instance.instance_id,
+                repo=instance.repo,
+                language=instance.language,
+                **attributes,
+            ) as span:
+                yield span
+    finally:
+        durations = candidate.durations if candidate is not None else state.durations
+        duration_key = duration_key or name
+        durations[duration_key] = durations.get(duration_key, 0.0) + time.time() - started_at
+
+
+def _store_output(
+    options: EvaluationOptions,
+    state: InstanceState,
+    candidate: Candidate,
+    instance_output: PolyBenchOutput,
+    cache: bool = True,
+):
+    """Store the pass rate output of a candidate for all its submitters and cache it.
+
+    The durations of the operations of this run are added to the stored output.
+    """
+    instance_output = replace(instance_output, durations={**state.durations, **candidate.durations})
+    candidate.resolved = instance_output.resolved
+    for result_path in candidate.result_paths:
+        store_instance_level_output(instance_output=instance_output, result_path=result_path)
+    if cache and options.result_cache is not None and candidate.cache_key is not None:
+        options.result_cache.put_output(candidate.cache_key, instance_output)
+    if options.monitor is not None:
+        options.monitor.observe_output(instance_output)
+
+
+def _finish_candidate(
+    options: EvaluationOptions,
+    state: InstanceState,
+    candidate: Candidate,
+    started_at: float,
+    zero_metrics: bool = False,
+    **detail,
+):
+    """Mark the pass rate result of a candidate as stored, journaling it with the last one."""
+    candidate.finished = True
+    candidate.zero_metrics = zero_metrics
+    if not state.finished:
         return
+    if zero_metrics:
+        detail["zero_metrics"] = True
+    _journal(
+        options,
+        state,
+        "parsed",
+        started_at,
+        _result_file(candidate.result_paths[0], state.instance.instance_id),
+        **detail,
+    )
+
+
+def _release_state(state: InstanceState):
+    """Remove the container, image and temporary repo copy held by an instance state."""
+    if state.docker_manager is not None:
+        state.docker_manager.__del__()
+        state.docker_manager = None
+    if state.repo_manager is not None:
+        state.repo_manager.__del__()
+        state.repo_manager = None
+
+
+def _resolve_without_docker(
+    state: InstanceState, candidate: Candidate, options: EvaluationOptions, started_at: float
+):
+    """Store the result of a candidate that needs no test run.
 
-    if not model_patch.strip():  # if model patch is empty
+    Empty patches, cached patches and gold-equivalent patches of instances with a gold baseline
+    need none.
+    """
+    instance = state.instance
+    instance_id = instance.instance_id
+
+    if not candidate.model_patch.strip():  # if model patch is empty
         # Store pass rate results
         instance_output = instance_level_scoring(
             instance_id=instance_id,
             result={},
-            f2p=f2p,
-            p2p=p2p,
+            f2p=instance.f2p,
+            p2p=instance.p2p,
             patch_applied=False,
             generation=False,
         )
-        store_instance_level_output(instance_output=instance_output, result_path=result_path)
+        _store_output(options, state, candidate, instance_output, cache=False)
+        _finish_candidate(options, state, candidate, started_at, zero_metrics=True)
+        return
 
-        # Store retrieval metrics
-        zero_metrics = _get_zero_result(
-            instance_id=instance_id, node_retrieval_metrics=node_retrieval_metrics
-        )
-        store_instance_level_output(
-            instance_output=zero_metrics, result_path=result_path, suffix="_metrics"
-        )
+    if options.result_cache is not None:
+        candidate.cache_key = output_key(instance, candidate.model_patch, state.parser_class_name)
+        cached_output = options.result_cache.get_output(candidate.cache_key, instance_id)
+        if cached_output is not None:
+            logger.info(f"Using the cached result of {instance_id}")
+            _store_output(options, state, candidate, cached_output, cache=False)
+            # Only results of applied patches have retrieval metrics worth computing
+            _finish_candidate(
+                options,
+                state,
+                candidate,
+                started_at,
+                zero_metrics=not cached_output.patch_applied,
+                cached=True,
+            )
+            return
+
+    if (
+        not options.evaluate_gold
+        and options.history is not None
+        and patch_hash(candidate.model_patch) == patch_hash(instance.patch)
+    ):
+        baseline = options.history.gold_baseline(instance_id)
+        gold_key = output_key(instance, instance.patch, state.parser_class_name)
+        if baseline is not None and baseline.environment_key == gold_key:
+            logger.info(f"Using the gold baseline of {instance_id} for its gold-equivalent patch")
+            instance_output = instance_level_scoring(
+                instance_id=instance_id,
+                result={
+                    "passed_tests": baseline.passed_tests,
+                    "failed_tests": baseline.failed_tests,
+                },
+                f2p=instance.f2p,
+                p2p=instance.p2p,
+                patch_applied=True,
+                generation=True,
+            )
+            _store_output(options, state, candidate, instance_output)
+            _finish_candidate(options, state, candidate, started_at, gold_equivalent=True)
+
+
+def _checkout_stage(state: InstanceState, options: EvaluationOptions):
+    """Resolve the patches to evaluate and clone the repo if the instance image must be built."""
+    started_at = time.time()
+    instance = state.instance
+    instance_id = instance.instance_id
+    repo = instance.repo
+    parser_class_name = REPO_TO_PARSER_CLASS.get(repo, None)
 
+    if not parser_class_name:
+        raise ValueError(f"Parser class not found for repo: {repo}. Please check the repo name.")
+
+    state.parser_class_name = parser_class_name
+    if not state.candidates:
+        model_patch = instance.model_patch if instance.model_patch else ""
+        if options.evaluate_gold:
+            model_patch = instance.patch
+        state.candidates = [Candidate(model_patch=model_patch, result_paths=[options.result_path])]
+
+    if options.retrieval_metrics_only:
+        for candidate in state.candidates:
+            candidate.finished = True
         return
 
-    image_id = f"polybench_{language.lower()}_{instance_id.lower()}"
+    # Resume an interrupted evaluation whose pass rate result was already stored
+    if (
+        options.resume
+        and options.journal is not None
+        and len(state.candidates) == 1
+        and options.journal.last_stage(instance_id) == "parsed"
+    ):
+        parsed = options.journal.last_transition(instance_id, "parsed")
+        if parsed is not None and parsed["artifact"] and Path(parsed["artifact"]).exists():
+            logger.info(f"Resuming {instance_id} from the parsed stage")
+            state.candidates[0].finished = True
+            state.candidates[0].zero_metrics = parsed["detail"].get("zero_metrics", False)
+            return
+
+    for candidate in state.candidates:
+        _resolve_without_docker(state, candidate, options, started_at)
+    if state.finished:
+        return
+
+    state.image_id = f"polybench_{instance.language.lower()}_{instance_id.lower()}"
 
     # build docker if image id is not available in local or public.ecr
-    docker_manager = DockerManager(image_id=image_id, delete_image=delete_image, client=client)
+    state.docker_manager = DockerManager(
+        image_id=state.image_id,
+        delete_image=options.delete_image,
+        client=options.client,
+        sample_stats=options.admission is not None,
+        build_backend=options.build_backend,
+        build_cache=options.build_cache,
+    )
 
-    repo_manager = None
-    if not docker_manager.check_image_local(local_image_name=image_id):
+    if not state.docker_manager.check_image_local(local_image_name=state.image_id):
         logger.info("Image not found locally, building docker images...")
-        # clone the repo and build docker image
-        repo_manager = RepoManager(repo_name=repo, repo_path=repo_path)
-        repo_manager.clone_repo()
-        repo_manager.checkout_commit(commit_hash=base_commit)
+        # clone the repo and build docker image, the build context is streamed from the base
+        # repo at the base commit without a working tree
+        state.repo_manager = RepoManager(repo_name=repo, repo_path=options.repo_path)
+        with _span(options, state, "clone_repo"):
+            state.repo_manager.clone_repo(working_tree=False)
+        with _span(options, state, "checkout_commit"):
+            state.repo_manager.prepare_commit(commit_hash=instance.base_commit)
+
+        assert state.repo_manager.base_repo_dir is not None, "Repo not properly cloned."
+        _journal(options, state, "cloned", started_at, str(state.repo_manager.base_repo_dir))
+
+
+def _build_stage(state: InstanceState, options: EvaluationOptions):
+    """Build the instance image from the cloned repo, if it had to be cloned."""
+    if state.repo_manager is None:
+        return
 
-        assert repo_manager.tmp_repo_dir is not None, "Repo not properly cloned."
+    instance_id = state.instance.instance_id
+    docker_manager = state.docker_manager
+    assert docker_manager is not None, "Docker manager not created."
+    assert state.repo_manager.commit is not None, "Repo not properly cloned."
 
+    dockerfile = prepare_dockerfile(state.instance.dockerfile)
+    # Only the paths the Dockerfile copies are sent, if it doesn't copy the whole repo
+    context_paths = dockerfile_context_paths(dockerfile)
+    started_at = time.time()
+    try:
         build_logs_path = Path("./build_logs")
         build_logs_path.mkdir(exist_ok=True)
         retry = 3
         for attempt in range(retry):
             logger.info(f"Docker building - Attempt {attempt + 1}/{retry}")
-            build_success = docker_manager.docker_build(
-                repo_path=repo_manager.tmp_repo_dir, dockerfile_content=instance.dockerfile
-            )
+            with _span(options, state, "docker_build", attempt=attempt + 1) as span:
+                with state.repo_manager.open_build_context(dockerfile, context_paths) as context:
+                    build_success = docker_manager.docker_build_context(
+                        context, cache_key=state.instance.repo
+                    )
+                if build_success != 0 and span is not None:
+                    span.error = "Docker build failed"
 
             # Save build logs regardless of success/failure
             build_logs_string = "\n".join(docker_manager.build_logs)
@@ -168,132 +488,464 @@ def evaluate_instance(
             raise ValueError(
                 f"Docker build failed for {instance_id} after {retry} attempts. Please check the dockerfile content and build logs."
             )
+        _journal(options, state, "built", started_at, state.image_id)
+        _record_duration(options, state, "build", started_at)
+    finally:
+        state.repo_manager.__del__()
+        state.repo_manager = None
 
-    # Create a docker container and run the image
-    docker_manager.create_container()
 
-    # Apply the code patch first
-    try:
-        patch_success = docker_manager.apply_patch_to_container(
-            patch_content=model_patch, patch_type="code"
+def _pass_at_k_decided(state: InstanceState, candidate: Candidate, k: int) -> bool:
+    """Whether the pass@k of every submitter of a candidate is 1 whatever its result.
+
+    That is the case once more than n - k of the n candidates of the submitter are resolved.
+    Result directories that aren't samples of a submitter are never decided.
+    """
+    outcomes: Dict[Tuple[str, str], List[bool]] = {}
+    for other in state.candidates:
+        for result_path in other.result_paths:
+            family = sample_family(Path(result_path).name)
+            if family is not None:
+                key = (str(Path(result_path).parent), family)
+                outcomes.setdefault(key, []).append(bool(other.resolved))
+    for result_path in candidate.result_paths:
+        family = sample_family(Path(result_path).name)
+        if family is None:
+            return False
+        resolved = outcomes[(str(Path(result_path).parent), family)]
+        if sum(resolved) <= len(resolved) - k:
+            return False
+    return True
+
+
+def _skip_candidate(state: InstanceState, candidate: Candidate, options: EvaluationOptions):
+    """Leave out a candidate whose submitters' pass@k is decided, marking it for skip_existing."""
+    logger.info(f"Skipping a candidate of {state.instance.instance_id}, pass@k is decided")
+    candidate.skipped = True
+    for result_path in candidate.result_paths:
+        with open(Path(result_path) / f"{state.instance.instance_id}_skipped.json", "w") as f:
+            json.dump({"instance_id": state.instance.instance_id, "early_exit": True}, f)
+    _finish_candidate(options, state, candidate, time.time(), zero_metrics=True, skipped=True)
+
+
+def _run_stage(state: InstanceState, options: EvaluationOptions):
+    """Run the tests of every pending candidate once its container fits in the host resources.
+
+    The candidates of an instance run one after the other in one container, whose working tree
+    is reset between them. With an early exit, every candidate is parsed right after its run,
+    and the remaining ones are skipped once their pass@k is decided.
+    """
+    pending = [candidate for candidate in state.candidates if not candidate.finished]
+    for index, candidate in enumerate(pending):
+        if options.early_exit_k is not None and _pass_at_k_decided(
+            state, candidate, options.early_exit_k
+        ):
+            _skip_candidate(state, candidate, options)
+            continue
+        _run_candidate(state, candidate, options, keep_container=index < len(pending) - 1)
+        if (
+            options.early_exit_k is not None
+            and not candidate.finished
+            and candidate.run_log_file is not None
+        ):
+            _parse_candidate(state, candidate, options)
+    if options.container_pool is not None and state.docker_manager is not None:
+        options.container_pool.release(state.docker_manager)
+        state.container_kept = False
+
+
+def _run_candidate(
+    state: InstanceState,
+    candidate: Candidate,
+    options: EvaluationOptions,
+    keep_container: bool = False,
+):
+    admission = options.admission
+    if admission is None:
+        _run_in_container(state, candidate, options, keep_container)
+        return
+
+    instance = state.instance
+    weight = admission.weight_for(repo=instance.repo, language=instance.language)
+    with admission.admit(weight, name=instance.instance_id):
+        _run_in_container(state, candidate, options, keep_container)
+
+    docker_manager = state.docker_manager
+    assert docker_manager is not None, "Docker manager not created."
+    admission.record_observation(
+        repo=instance.repo,
+        cpus=docker_manager.peak_cpus,
+        memory_gb=docker_manager.peak_memory_gb,
+    )
+
+
+def _run_in_container(
+    state: InstanceState,
+    candidate: Candidate,
+    options: EvaluationOptions,
+    keep_container: bool = False,
+):
+    """Apply the patches inside a container and run the tests.
+
+    A container kept by the previous candidate, or else a warm container of the image from the
+    container pool, is reset to its snapshot instead of creating a fresh one. With
+    keep_container, the container is kept for the next candidate. With a container pool, it is
+    kept for _run_stage to release it to the pool.
+
+    Raises:
+        ValueError: If the test run neither reported a result nor timed out, e.g. after a docker
+            error.
+    """
+    instance = state.instance
+    instance_id = instance.instance_id
+    language = instance.language
+    docker_manager = state.docker_manager
+    assert docker_manager is not None, "Docker manager not created."
+
+    container_pool = options.container_pool
+    started_at = time.time()
+    reused = False
+    if state.container_kept and docker_manager.container is not None:
+        with _span(options, state, "reset_worktree", candidate):
+            reused = docker_manager.reset_worktree()
+    elif container_pool is not None:
+        with _span(options, state, "acquire_container", candidate):
+            reused = container_pool.acquire(docker_manager)
+        if reused:
+            _journal(options, state, "container_created", started_at, docker_manager.container_name)
+    if not reused:
+        # Create a docker container and run the image
+        with _span(options, state, "create_container", candidate):
+            docker_manager.create_container()
+            needs_snapshot = keep_container or container_pool is not None
+            if needs_snapshot and not docker_manager.snapshot_worktree():
+                keep_container = False
+        _journal(options, state, "container_created", started_at, docker_manager.container_name)
+    # A candidate whose patch doesn't apply leaves the container for the next one as well
+    state.container_kept = keep_container
+    started_at = time.time()
+    logger.info(f"docker running for {instance_id}")
+    candidate.run_timeout = (options.run_timeouts or DurationEstimates()).run_timeout(
+        instance_id, instance.repo, language
+    )
+
+    # Apply the code patch, reset the files of the test patch to their original state so they
+    # don't conflict with the code patch, apply the test patch and run the tests, all in one exec
+    docker_manager.run_logs = []
+    run_logs_path = Path(f"./run_logs_{language.lower()}")
+    run_logs_path.mkdir(exist_ok=True)
+    index = state.candidates.index(candidate)
+    log_name = f"{instance_id}_run.log" if index == 0 else f"{instance_id}_{index}_run.log"
+    keep_for_pool = container_pool is not None and docker_manager.has_snapshot
+    with _span(
+        options,
+        state,
+        "docker_run",
+        candidate,
+        duration_key="evaluation_bundle",
+        timeout=candidate.run_timeout,
+    ):
+        steps = docker_manager.run_evaluation_bundle(
+            code_patch=candidate.model_patch,
+            test_patch=instance.test_patch,
+            files_to_reset=_get_modified_files(instance.test_patch),
+            test_command=instance.test_command,
+            timeout=int(candidate.run_timeout),
+            keep_container=keep_container or keep_for_pool,
+            log_path=str(run_logs_path / log_name),
         )
-    except Exception:
-        patch_success = 1
-        logger.debug(f"patch error for instance id: {instance_id}")
+    for step_name, step in steps.items():
+        candidate.durations[BUNDLE_STEP_DURATION_KEYS.get(step_name, step_name)] = step.seconds
+    candidate.timed_out = docker_manager.timed_out
+    state.container_kept = keep_container and docker_manager.container is not None
+    run_log = docker_manager.run_log
+    assert run_log is not None, "The evaluation bundle didn't open a run log"
 
-    # Reset all files from test patch to their original state before applying test patch
-    # This prevents conflicts between code patch modifications and test patch
-    try:
-        # Get all modified files from the test patch
-        files_to_reset = _get_modified_files(test_patch)
-        
-        # Reset the files using the Docker manager
-        reset_success = docker_manager.reset_files(files_to_reset)
-        if not reset_success:
-            logger.warning(f"Failed to reset files for instance id: {instance_id}")
-    except Exception as e:
-        logger.warning(f"Error resetting files for instance id: {instance_id}: {e}")
-
-    # Apply the test patch now
-    try:
-        _ = docker_manager.apply_patch_to_container(patch_content=test_patch, patch_type="test")
-    except Exception:
+    code_patch_step = steps.get("apply_code_patch")
+    test_patch_step = steps.get("apply_test_patch")
+    reset_step = steps.get("reset_files")
+    if reset_step is not None and reset_step.exit_code != 0:
+        logger.warning(f"Failed to reset files for instance id: {instance_id}")
+    if test_patch_step is not None and test_patch_step.exit_code != 0:
         logger.debug(f"test patch apply error for instance id: {instance_id}, please check.")
         instance_output = instance_level_scoring(
             instance_id=instance_id,
             result={},
-            f2p=f2p,
-            p2p=p2p,
+            f2p=instance.f2p,
+            p2p=instance.p2p,
             patch_applied=False,
             generation=False,
         )
-        store_instance_level_output(instance_output=instance_output, result_path=result_path)
-
-        # Store retrieval metrics
-        instance_metric_output = instance_level_metric_scoring(
-            instance=instance, repo_path=repo_path, node_retrieval_metrics=node_retrieval_metrics, modified_nodes=instance.modified_nodes
-        )
-        store_instance_level_output(
-            instance_output=instance_metric_output, result_path=result_path, suffix="_metrics"
-        )
-
-        docker_manager.__del__()
+        # A test patch that doesn't apply points to a broken environment, don't cache it
+        _store_output(options, state, candidate, instance_output, cache=False)
+        _finish_candidate(options, state, candidate, started_at)
         return
 
-
-    if patch_success != 0:
+    if code_patch_step is not None and code_patch_step.exit_code != 0:
         logger.info(f"patch apply error for instance id: {instance_id}")
         instance_output = instance_level_scoring(
             instance_id=instance_id,
             result={},
-            f2p=f2p,
-            p2p=p2p,
+            f2p=instance.f2p,
+            p2p=instance.p2p,
             patch_applied=False,
             generation=True,
         )
-        store_instance_level_output(instance_output=instance_output, result_path=result_path)
+        _store_output(options, state, candidate, instance_output)
+        _finish_candidate(options, state, candidate, started_at, zero_metrics=True)
+        return
 
-        # Store retrieval metrics
-        zero_metrics = _get_zero_result(
-            instance_id=instance_id, node_retrieval_metrics=node_retrieval_metrics
-        )
-        store_instance_level_output(
-            instance_output=zero_metrics, result_path=result_path, suffix="_metrics"
-        )
+    if code_patch_step is not None and test_patch_step is not None:
+        _journal(options, state, "patched", started_at)
+    if candidate.timed_out:
+        logger.warning(f"Test run of {instance_id} hit its {candidate.run_timeout:.0f}s timeout")
+        # The output of a timed out run is left out of its log, keep what fits the window
+        logger.debug(f"Output of the timed out run:\n{run_log.excerpt()}")
+    run_step = steps.get("run_tests")
+    if run_step is None and not candidate.timed_out:
+        # Nothing is stored, so the result cache and gold baseline don't keep a false result
+        raise ValueError(f"The test run of {instance_id} reported no result, please retry.")
+    candidate.run_seconds = run_step.seconds if run_step is not None else time.time() - started_at
 
-        docker_manager.__del__()
-        return
+    run_log_file = run_log.path
+    candidate.run_log_file = run_log_file
+    _journal(
+        options,
+        state,
+        "run",
+        started_at,
+        run_log_file,
+        timeout=candidate.run_timeout,
+        timed_out=candidate.timed_out,
+    )
+    _record_duration(options, state, "run", started_at)
 
-    logger.info(f"docker running for {instance_id}")
-    run_timeout = JAVA_TIMEOUT if language.lower() == "java" else DEFAULT_TIMEOUT
 
-    _ = docker_manager.docker_run(test_command=test_command, timeout=run_timeout)
+def _parse_stage(state: InstanceState, options: EvaluationOptions):
+    """Parse the test run logs and store the pass rate results."""
+    for candidate in state.candidates:
+        if not candidate.finished and candidate.run_log_file is not None:
+            _parse_candidate(state, candidate, options)
 
-    # log the run logs
-    run_logs_string = "\n".join(docker_manager.run_logs)
-    run_logs_path = Path(f"./run_logs_{language.lower()}")
-    run_logs_path.mkdir(exist_ok=True)
 
-    with open(str(run_logs_path) + f"/{instance_id}_run.log", "w") as f:
-        f.write(run_logs_string)
+def _parse_candidate(state: InstanceState, candidate: Candidate, options: EvaluationOptions):
+    started_at = time.time()
+    instance = state.instance
+    parser_class_name = state.parser_class_name
+    run_log_file = candidate.run_log_file
+    assert run_log_file is not None, "The candidate has no run log to parse"
 
     # parse the log of docker run
-    all_parsers = importlib.import_module("poly_bench_evaluation.parsers")
-    if hasattr(all_parsers, parser_class_name):
-        parser_class = getattr(all_parsers, parser_class_name)
-        log_parser = parser_class(test_content=run_logs_string)
-        result = log_parser.parse()
-    else:
-        raise ValueError(
-            f"Parser class {parser_class_name} not found in the parsers module. Please ensure proper paraser class name."
-        )
+    with _span(options, state, "parse", candidate, parser=parser_class_name):
+        if options.cpu_pool is not None:
+            result = options.cpu_pool.submit(
+                parse_test_log_file, parser_class_name, run_log_file
+            ).result()
+        else:
+            result = parse_test_log_file(parser_class_name, run_log_file)
 
     instance_output = instance_level_scoring(
-        instance_id=instance_id,
+        instance_id=instance.instance_id,
         result=result,
-        f2p=f2p,
-        p2p=p2p,
+        f2p=instance.f2p,
+        p2p=instance.p2p,
         patch_applied=True,
         generation=True,
     )
-    store_instance_level_output(instance_output=instance_output, result_path=result_path)
-
-    # Store retrieval metrics
-    instance_metric_output = instance_level_metric_scoring(
-        instance=instance, repo_path=repo_path, node_retrieval_metrics=node_retrieval_metrics, modified_nodes=instance.modified_nodes
+    instance_output = replace(
+        instance_output, run_timeout=candidate.run_timeout, timed_out=candidate.timed_out
     )
-    store_instance_level_output(
-        instance_output=instance_metric_output, result_path=result_path, suffix="_metrics"
+    _store_output(options, state, candidate, instance_output, cache=not candidate.timed_out)
+    if options.evaluate_gold and options.history is not None and not candidate.timed_out:
+        options.history.record_gold_baseline(
+            GoldBaseline(
+                instance_id=instance.instance_id,
+                environment_key=output_key(instance, candidate.model_patch, parser_class_name),
+                resolved=instance_output.resolved,
+                passed_tests=instance_output.passed_tests,
+                failed_tests=instance_output.failed_tests,
+                run_seconds=candidate.run_seconds,
+                image_digest=(
+                    state.docker_manager.image_digest() if state.docker_manager else None
+                ),
+            )
+        )
+    _finish_candidate(options, state, candidate, started_at)
+
+
+def _compute_metrics(
+    state: InstanceState, candidate: Candidate, options: EvaluationOptions
+) -> PolyBenchRetrievalMetrics:
+    """Compute the retrieval metrics of a candidate, or get them from the result cache."""
+    instance = state.instance
+    # The retrieval metrics always score the model patch, also when the gold patch is evaluated
+    if not options.evaluate_gold and candidate.model_patch != instance.model_patch:
+        instance = instance.model_copy(update={"model_patch": candidate.model_patch})
+
+    cache_key = None
+    if options.result_cache is not None:
+        cache_key = metrics_key(instance, options.node_retrieval_metrics)
+        cached_metrics = options.result_cache.get_metrics(cache_key, instance.instance_id)
+        if cached_metrics is not None:
+            return cached_metrics
+
+    with _span(options, state, "instance_level_metric_scoring", candidate):
+        scoring = partial(
+            instance_level_metric_scoring,
+            instance=instance,
+            repo_path=options.repo_path,
+            node_retrieval_metrics=options.node_retrieval_metrics,
+            modified_nodes=instance.modified_nodes,
+        )
+        if options.cpu_pool is not None:
+            instance_metric_output = options.cpu_pool.submit(scoring).result()
+        else:
+            instance_metric_output = scoring()
+    if options.result_cache is not None and cache_key is not None:
+        options.result_cache.put_metrics(cache_key, instance_metric_output)
+    return instance_metric_output
+
+
+def _metrics_stage(state: InstanceState, options: EvaluationOptions):
+    """Compute and store the retrieval metrics, then release the instance resources."""
+    started_at = time.time()
+    instance = state.instance
+    try:
+        for candidate in state.candidates:
+            if candidate.skipped:
+                continue
+            instance_metric_output: PolyBenchRetrievalMetrics
+            if candidate.zero_metrics:
+                instance_metric_output = _get_zero_result(
+                    instance_id=instance.instance_id,
+                    node_retrieval_metrics=options.node_retrieval_metrics,
+                )
+            else:
+                if options.retrieval_metrics_only:
+                    logger.info(f"Computing only retrieval metrics for {instance.instance_id}")
+                instance_metric_output = _compute_metrics(state, candidate, options)
+            for result_path in candidate.result_paths:
+                store_instance_level_output(
+                    instance_output=instance_metric_output,
+                    result_path=result_path,
+                    suffix="_metrics",
+                )
+        _journal(
+            options,
+            state,
+            "scored",
+            started_at,
+            str(Path(state.candidates[0].result_paths[0]) / f"{instance.instance_id}_metrics.json"),
+        )
+    finally:
+        _release_state(state)
+
+
+class _StageFunction(Protocol):
+    # A Protocol rather than a Callable keeps the parameter names, so options can be bound
+    def __call__(self, state: InstanceState, options: EvaluationOptions) -> None: ...
+
+
+EVALUATION_STAGES: List[Tuple[str, _StageFunction]] = [
+    ("checkout", _checkout_stage),
+    ("build", _build_stage),
+    ("run", _run_stage),
+    ("parse", _parse_stage),
+    ("metrics", _metrics_stage),
+]
+
+
+def evaluate_instance(
+    instance: PolyBenchInstance,
+    result_path: str,
+    evaluate_gold: bool,
+    repo_path: str,
+    delete_image: bool,
+    client: "docker.DockerClient",
+    retrieval_metrics_only: bool = False,
+    node_retrieval_metrics: bool = False,
+    result_cache: Optional[ResultCache] = None,
+    history: Optional[RunHistory] = None,
+    tracer: Optional[Tracer] = None,
+    run_timeouts: Optional[DurationEstimates] = None,
+    container_pool: Optional[ContainerPool] = None,
+    build_backend: str = "docker",
+    build_cache: Optional[BuildCache] = None,
+):
+    """Instance level evaluation function.
+
+    Runs all evaluation stages for a single instance in the calling thread.
+
+    Args:
+        instance: PolyBench row instance
+        result_path: Path to store the output results.
+        evaluate_gold: whether to evaluate the gold patch
+        repo_path: Base repo close path.
+        delete_image: whether to delete the image after docker build
+        client: The docker client
+        retrieval_metrics_only: Whether to only compute retrieval metrics.
+        node_retrieval_metrics: Whether to compute compute-heavy node retrieval metrics.
+        result_cache: Result cache consulted before any docker work and updated with the
+            results.
+        history: Run history that records the stage durations and gold baselines. Gold
+            evaluations update the gold baseline, and gold-equivalent model patches reuse it.
+        tracer: Tracer that records a span for every operation of the evaluation.
+        run_timeouts: Recorded gold runs to learn the test run timeout from. None uses the
+            language default.
+        container_pool: Warm containers to run in instead of creating a new container, and to
+            keep the container in afterwards.
+        build_backend: Backend of the image build, one of BUILD_BACKENDS.
+        build_cache: Local BuildKit cache the buildx backend imports from and exports to.
+    Raises:
+        ValueError: if the docker build fails, or a test run fails without a result
+    """
+    options = EvaluationOptions(
+        result_path=result_path,
+        evaluate_gold=evaluate_gold,
+        repo_path=repo_path,
+        delete_image=delete_image,
+        client=client,
+        retrieval_metrics_only=retrieval_metrics_only,
+        node_retrieval_metrics=node_retrieval_metrics,
+        result_cache=result_cache,
+        history=history,
+        run_timeouts=run_timeouts,
+        tracer=tracer,
+        container_pool=container_pool,
+        build_backend=build_backend,
+        build_cache=build_cache,
     )
+    state = InstanceState(instance=instance)
+    try:
+        for _, stage_func in EVALUATION_STAGES:
+            stage_func(state, options)
+    except Exception:
+        _release_state(state)
+        raise
+
 
-    docker_manager.__del__()
-    if repo_manager is not None:
-        repo_manager.__del__()
+def _followed_states(
+    predictions_path: str, dataset: pd.DataFrame, idle_timeout: Optional[float]
+) -> Iterator[InstanceState]:
+    """Schedule every prediction of a followed predictions file as soon as it is complete."""
+    instances = {instance.instance_id: instance for instance in dataset_generator(dataset)}
+    logger.info(f"Following {predictions_path} for predictions of {len(instances)} instances")
+    for prediction in follow_predictions(predictions_path, idle_timeout=idle_timeout):
+        instance = instances.pop(prediction["instance_id"], None)
+        if instance is None:
+            logger.warning(
+                f"Skipping the prediction of {prediction['instance_id']}: not in the dataset "
+                "or already evaluated"
+            )
+            continue
+        yield InstanceState(
+            instance=instance.model_copy(update={"model_patch": prediction["model_patch"]})
+        )
 
 
 def evaluate_predictions(
     dataset_path: str,
-    predictions_path: str,
+    predictions_path: Optional[Union[str, List[str]]],
     result_path: str,
     num_threads: int,
     evaluate_gold: bool,
@@ -302,72 +954,289 @@ def evaluate_predictions(
     skip_existing: bool,
     retrieval_metrics_only: bool = False,
     node_retrieval_metrics: bool = False,
+    stage_threads: Optional[Dict[str, Optional[int]]] = None,
+    resource_aware: bool = False,
+    docker_hosts: Optional[List[str]] = None,
+    queue_db: Optional[str] = None,
+    ordering: str = ORDER_DATASET,
+    history_path: Optional[str] = None,
+    result_cache_path: Optional[str] = None,
+    trace_dir: Optional[str] = None,
+    metrics_port: Optional[int] = None,
+    client: Optional["docker.DockerClient"] = None,
+    plan: bool = False,
+    follow: bool = False,
+    follow_idle_timeout: Optional[float] = None,
+    shard_index: int = 0,
+    num_shards: int = 1,
+    cpu_workers: Optional[int] = None,
+    adaptive_timeouts: bool = False,
+    early_exit_k: Optional[int] = None,
+    container_pool: Optional[ContainerPool] = None,
+    build_backend: str = "docker",
+    build_cache_dir: Optional[str] = "./buildkit_cache",
 ):
     """Predictions file evaluation function.
     Args:
         dataset_path: Path to the dataset file (csv) or huggingface.
-        predictions_path: Path to the predictions file.
+        predictions_path: Path to the predictions file, or a list of prediction files.
+            Equivalent patches of an instance are evaluated once for all their submitters.
+            With more than one submitter (model_name_or_path, or the file name), the results
+            of every submitter are stored in their own directory in result_path.
         result_path: Path to store the output results.
         num_threads: Number of threads to use.
         evaluate_gold: Whether to evaluate the gold patches.
         repo_path: Base repo close path.
         delete_image: Whether to delete the image after docker build/ecr pull.
-        skip_existing: Whether to skip the existing evaluations in result_path.
+        skip_existing: Whether to skip the instances whose evaluation the run journal in
+            result_path records as completed. Interrupted instances resume from the last
+            completed stage.
         retrieval_metrics_only: Whether to only compute retrieval metrics.
         node_retrieval_metrics: Whether to compute compute-heavy node retrieval metrics.
+        stage_threads: Number of worker threads per evaluation stage (checkout, build, run,
+            parse, metrics). Stages that are not set use num_threads.
+        resource_aware: Whether to delay container runs until their declared or observed
+            resource weight fits in the free host capacity.
+        docker_hosts: Docker daemons to spread the evaluation over. If set, instances are put in
+            a SQLite work queue and evaluated by one worker process per docker host, each using
+            num_threads threads.
+        queue_db: Path of the work queue (default: work_queue.sqlite in result_path).
+        ordering: Order in which instances are evaluated, one of ORDERING_POLICIES.
+        history_path: Path of the run history that stores build and run durations across runs
+            and provides the expected durations for ordering. None (the default) keeps no
+            history, and the expected durations fall back to the language defaults.
+        result_cache_path: Path of the content-addressed result cache. Instances whose patch,
+            test patch, Dockerfile and test command were evaluated before reuse that result.
+            None (the default) disables the cache.
+        trace_dir: Directory to write a span of every evaluation operation to, as a Chrome
+            trace-event file (trace.json) and a JSONL event log (events.jsonl).
+        metrics_port: Local port to serve live Prometheus metrics of the run on (/metrics).
+        client: Docker client to evaluate with (default: docker.from_env). Ignored with
+            docker_hosts.
+        plan: Only report the evaluation plan (done instances, images to build, disk peak and
+            wall time estimates) and return it, without evaluating anything or writing to
+            result_path.
+        follow: Tail the predictions file while it is still being written and evaluate every
+            prediction as soon as its line is complete, in arrival order. The results are
+            aggregated once the file ends with an END_MARKER line or stops growing.
+        follow_idle_timeout: Seconds without new predictions after which a followed file is
+            considered closed. None waits for the end marker.
+        shard_index: The shard of the dataset to evaluate, from 0 to num_shards - 1. Merge the
+            result paths of all shards with merge_shards (the aggregate subcommand).
+        num_shards: Number of machines the dataset is split across. Every machine computes the
+            same cost-balanced partition without coordination.
+        cpu_workers: Number of worker processes the test log parsing and retrieval metrics run
+            in, keeping them off the docker stage threads. 0 runs them in the stage threads.
+            None uses one per CPU with node_retrieval_metrics and 0 otherwise.
+        adaptive_timeouts: Whether the test run timeout of an instance is learned from the run
+            durations of the instance or the gold runs of its repo in the run history (a
+            percentile plus a margin, within the language default and a ceiling). Otherwise
+            every run uses the language default.
+        early_exit_k: With several candidates per instance (model_patches predictions), skip
+            the remaining candidates of a submitter once more than n - k of its n candidates
+            are resolved, since its pass@k is then decided. The candidates of an instance run
+            in one container whose working tree is reset between them either way.
+        container_pool: Warm containers kept across evaluations of the same image, e.g. of
+            followed predictions or of several runs in one process. The caller closes it.
+            Ignored with docker_hosts.
+        build_backend: Backend of the instance image builds, one of BUILD_BACKENDS: "docker"
+            (the legacy builder of the docker API) or "buildx" (BuildKit through the docker
+            buildx CLI, using the daemon of the docker CLI). Can't be combined with
+            docker_hosts.
+        build_cache_dir: Directory of the local BuildKit cache of the buildx builds, one cache
+            per repo that outlives the images. None builds without a cache.
     Raises:
         ValueError: If the predictions file is not in the correct format.
     """
-    client = docker.from_env(timeout=720)
-    try:    
-            
-        if dataset_path.endswith(".csv"): 
-            dataset = pd.read_csv(dataset_path)
-        elif dataset_path.endswith(".json"):
-            dataset = pd.read_json(dataset_path)
-        else:
-            dataset =load_dataset(dataset_path, split="test").to_pandas()
-        
-    except Exception:
-        raise ValueError("Please provide a correct dataset file or huggingface path.")
+    import docker
 
-    suffix = "_result" if not retrieval_metrics_only else "_metrics"
+    if build_backend not in BUILD_BACKENDS:
+        raise ValueError(f"Unknown build backend {build_backend}, use one of {BUILD_BACKENDS}.")
+    if build_backend == "buildx" and docker_hosts:
+        raise ValueError("The buildx build backend can't be combined with docker_hosts.")
 
-    if skip_existing:
-        dataset = dataset[
-            ~dataset["instance_id"].isin(
-                [f.stem.replace(suffix, "") for f in Path(result_path).glob(f"*{suffix}.json")]
+    followed_path = None
+    if follow:
+        paths = [predictions_path] if isinstance(predictions_path, str) else predictions_path
+        if not paths or len(paths) != 1 or evaluate_gold or docker_hosts or plan:
+            raise ValueError(
+                "Following predictions needs a single predictions file and can't be combined "
+                "with evaluate_gold, docker_hosts or plan."
             )
-        ]
+        # The predictions are read as they arrive instead of up front
+        followed_path, predictions_path = paths[0], None
 
-    logger.info(f"Remaining samples to evaluate: {len(dataset)}")
-    assert "language" in dataset.columns, "language column not found in dataset file."
+    dataset = load_dataset_file(dataset_path)
+
+    predictions = None
     if predictions_path:
         try:
-            predictions = pd.read_json(predictions_path, lines=True)
-
-            assert (
-                "model_patch" in predictions.columns
-            ), "model_patch column not found in predictions file."
-            assert (
-                "instance_id" in predictions.columns
-            ), "instance_id column not found in predictions file."
-
-            dataset = pd.merge(
-                dataset,
-                predictions[["instance_id", "model_patch"]],
-                how="left",
-                on="instance_id",
+            predictions = load_predictions(
+                [predictions_path] if isinstance(predictions_path, str) else predictions_path
             )
-            # Fill any missing model_patch values with empty string
-            dataset.fillna({"model_patch": ""}, inplace=True)
-            unique_languages = dataset.loc[dataset['model_patch'].notnull() & (dataset['model_patch'] != ''), 'language'].unique()
-
         except Exception:
             raise ValueError("Please provide a correct predictions jsonl file.")
+
+    if num_shards > 1 or shard_index:
+        predicted = None
+        if predictions is not None and not evaluate_gold:
+            non_empty = predictions["model_patch"].astype(str).str.strip() != ""
+            predicted = set(predictions.loc[non_empty, "instance_id"])
+        dataset = shard_dataset(dataset, shard_index, num_shards, predicted=predicted)
+        if not plan:
+            write_shard_manifest(result_path, shard_index, num_shards, list(dataset["instance_id"]))
+        logger.info(f"Shard {shard_index} of {num_shards}: {len(dataset)} instances")
+
+    # Every submitter gets its own result directory if there are several
+    submitters = (
+        list(dict.fromkeys(predictions[SUBMITTER_COLUMN])) if predictions is not None else []
+    )
+    if len(submitters) > 1 and not evaluate_gold:
+        result_dirs = {
+            submitter: str(Path(result_path) / submitter.replace("/", "__"))
+            for submitter in submitters
+        }
+        if docker_hosts:
+            raise ValueError("Several submitters can't be evaluated with --docker-hosts.")
+    else:
+        result_dirs = {submitter: result_path for submitter in submitters}
+    if not plan:
+        for result_dir in set(result_dirs.values()):
+            Path(result_dir).mkdir(parents=True, exist_ok=True)
+
+    suffix = "_result" if not retrieval_metrics_only else "_metrics"
+    journal_path = Path(result_path) / "journal.sqlite"
+    # A plan only reads the journal of a previous run, it doesn't start one
+    journal = (
+        RunJournal(
+            db_path=str(journal_path),
+            run_kind="metrics" if retrieval_metrics_only else "evaluation",
+        )
+        if not plan or journal_path.exists()
+        else None
+    )
+
+    completed: Set[str] = set()
+    if skip_existing or plan:
+        if journal is not None and not journal.is_empty():
+            completed = journal.completed_instances()
+        else:
+            # Result directories written before the journal existed
+            completed = {
+                f.stem.replace(suffix, "") for f in Path(result_path).glob(f"*{suffix}.json")
+            }
+    instance_ids = set(dataset["instance_id"])
+    if skip_existing and len(set(result_dirs.values())) <= 1:
+        dataset = dataset[~dataset["instance_id"].isin(completed)]
+
+    assert "language" in dataset.columns, "language column not found in dataset file."
+    patch_groups: Dict[str, List[PatchGroup]] = {}
+    if predictions is not None:
+        patch_groups, dedup_stats = group_predictions(predictions, dataset["instance_id"])
+        logger.info(
+            f"{dedup_stats.predictions} predictions of {len(submitters)} submitters contain "
+            f"{dedup_stats.distinct_patches} distinct patches, dedup ratio "
+            f"{dedup_stats.ratio:.1%}"
+        )
+        if not plan:
+            with open(Path(result_path) / "dedup.json", "w") as f:
+                json.dump(
+                    {
+                        "submitters": submitters,
+                        "predictions": dedup_stats.predictions,
+                        "distinct_patches": dedup_stats.distinct_patches,
+                        "dedup_ratio": dedup_stats.ratio,
+                    },
+                    f,
+                    indent=4,
+                )
+
+        if skip_existing and len(set(result_dirs.values())) > 1:
+            # Skip the submitters of an instance whose results are stored already
+            for instance_id, groups in patch_groups.items():
+                result_file = f"{instance_id}{suffix}.json"
+                skipped_file = f"{instance_id}_skipped.json"
+                for group in groups:
+                    group.submitters = [
+                        submitter
+                        for submitter in group.submitters
+                        if not (Path(result_dirs[submitter]) / result_file).exists()
+                        and not (Path(result_dirs[submitter]) / skipped_file).exists()
+                    ]
+                patch_groups[instance_id] = [group for group in groups if group.submitters]
+            dataset = dataset[dataset["instance_id"].map(lambda i: bool(patch_groups.get(i)))]
+
+        # The first non-empty patch of every instance decides its image and expected cost
+        dataset = dataset.assign(
+            model_patch=[
+                next(
+                    (g.model_patch for g in patch_groups[i] if g.model_patch.strip()),
+                    "",
+                )
+                for i in dataset["instance_id"]
+            ]
+        )
+        unique_languages = dataset.loc[dataset["model_patch"] != "", "language"].unique()
     else:
         unique_languages = dataset['language'].unique()
+    logger.info(f"Remaining samples to evaluate: {len(dataset)}")
+
+    history = RunHistory(history_path) if history_path else None
+    estimates = history.estimates() if history is not None else DurationEstimates()
+    dataset = order_dataset(
+        dataset, policy=ordering, estimates=estimates, evaluate_gold=evaluate_gold
+    )
+
+    if plan:
+        if client is None:
+            try:
+                client = docker.from_env(timeout=720)
+            except docker.errors.DockerException as e:
+                logger.warning(f"Docker is not available, assuming no local images: {e}")
+        threads = stage_threads or {}
+        evaluation_plan = plan_evaluation(
+            dataset,
+            estimates=estimates,
+            client=client,
+            done_instances=completed & instance_ids,
+            skipped=instance_ids - set(dataset["instance_id"]),
+            build_threads=threads.get("build") or num_threads,
+            run_threads=threads.get("run") or num_threads,
+            delete_image=delete_image,
+            evaluate_gold=evaluate_gold,
+        )
+        print(evaluation_plan.render())
+        return evaluation_plan
+    assert journal is not None
 
+    if docker_hosts:
+        run_coordinator(
+            instances=dataset_generator(dataset),
+            queue_db=queue_db or str(Path(result_path) / "work_queue.sqlite"),
+            docker_hosts=docker_hosts,
+            result_path=result_path,
+            options=WorkerOptions(
+                evaluate_gold=evaluate_gold,
+                repo_path=repo_path,
+                delete_image=delete_image,
+                retrieval_metrics_only=retrieval_metrics_only,
+                node_retrieval_metrics=node_retrieval_metrics,
+                result_cache_path=result_cache_path,
+                history_path=history_path,
+                adaptive_timeouts=adaptive_timeouts,
+            ),
+            threads_per_host=num_threads,
+        )
+        aggregate_logs(
+            result_path=result_path,
+            dataset_path=dataset_path,
+            metrics_only=retrieval_metrics_only,
+            gold_baselines=history.gold_baselines() if history is not None else None,
+        )
+        return
+
+    client = client or docker.from_env(timeout=720)
+    cleanup_orphaned_containers(journal=journal, client=client)
 
     logger.info(f"Building base images for {unique_languages}...")
     
@@ -379,35 +1248,205 @@ def evaluate_predictions(
             )
             base_docker_manager.build_base_image(language=language)
 
-    with ThreadPool(num_threads) as pool:
+    tracer = None
+    if trace_dir:
+        tracer = Tracer(jsonl_path=str(Path(trace_dir) / "events.jsonl"))
+    monitor = None
+    if metrics_port is not None:
+        monitor = EvaluationMonitor()
+        tracer = tracer or Tracer(keep_spans=False)
+        tracer.add_listener(monitor.observe_span)
 
-        def process_wrapper(instance: PolyBenchInstance):
-            return evaluate_instance(
-                instance=instance,
-                result_path=result_path,
-                evaluate_gold=evaluate_gold,
-                repo_path=repo_path,
-                delete_image=delete_image,
-                client=client,
-                retrieval_metrics_only=retrieval_metrics_only,
-                node_retrieval_metrics=node_retrieval_metrics,
+    options = EvaluationOptions(
+        result_path=result_path,
+        evaluate_gold=evaluate_gold,
+        repo_path=repo_path,
+        delete_image=delete_image,
+        client=client,
+        retrieval_metrics_only=retrieval_metrics_only,
+        node_retrieval_metrics=node_retrieval_metrics,
+        journal=journal,
+        resume=skip_existing,
+        history=history,
+        run_timeouts=estimates if adaptive_timeouts else None,
+        early_exit_k=early_exit_k,
+        container_pool=container_pool,
+        build_backend=build_backend,
+        build_cache=(
+            BuildCache(build_cache_dir) if build_backend == "buildx" and build_cache_dir else None
+        ),
+        result_cache=ResultCache(result_cache_path) if result_cache_path else None,
+        tracer=tracer,
+        monitor=monitor,
+    )
+    if cpu_workers is None:
+        cpu_workers = default_cpu_workers(node_retrieval_metrics)
+    options.cpu_pool = create_cpu_pool(cpu_workers)
+    if options.cpu_pool is not None:
+        logger.info(f"Parsing logs and computing metrics in {cpu_workers} worker processes")
+    if resource_aware:
+        capacity = read_host_capacity()
+        logger.info(f"Host capacity for container runs: {capacity}")
+        options.admission = ResourceAdmission(capacity=capacity)
+    stage_threads = stage_threads or {}
+    pipeline = StagedPipeline(
+        stages=[
+            Stage(
+                name=name,
+                func=partial(stage_func, options=options),
+                num_workers=stage_threads.get(name) or num_threads,
+                # Pin every affinity group to one checkout worker, so its instances are built
+                # one after the other
+                route=(
+                    (lambda state: state.affinity_key)
+                    if name == "checkout" and ordering == ORDER_AFFINITY
+                    else None
+                ),
+            )
+            for name, stage_func in EVALUATION_STAGES
+        ],
+        on_error=lambda state, _: _release_state(state),
+    )
+    logger.info(
+        "Stage workers: "
+        + ", ".join(f"{stage.name}={stage.num_workers}" for stage in pipeline.stages)
+    )
+
+    affinity_groups = (
+        dict(zip(dataset["instance_id"], dataset[AFFINITY_GROUP_COLUMN]))
+        if AFFINITY_GROUP_COLUMN in dataset.columns
+        else {}
+    )
+    def candidates(instance_id: str) -> List[Candidate]:
+        if evaluate_gold:
+            return []
+        return [
+            Candidate(
+                model_patch=group.model_patch,
+                result_paths=[result_dirs[submitter] for submitter in group.submitters],
             )
+            for group in patch_groups.get(instance_id, [])
+        ]
 
-        data_gen = dataset_generator(dataset)
+    data_gen: Iterator[InstanceState]
+    if followed_path is not None:
+        data_gen = _followed_states(followed_path, dataset, follow_idle_timeout)
+    else:
+        data_gen = (
+            InstanceState(
+                instance=instance,
+                candidates=candidates(instance.instance_id),
+                affinity_key=affinity_groups.get(instance.instance_id),
+            )
+            for instance in dataset_generator(dataset)
+        )
+    if monitor is not None:
+        assert metrics_port is not None, "The monitor is only created with a metrics port"
+        monitor.pipeline = pipeline
+        monitor.serve(port=metrics_port)
+    try:
+        pipeline.run(data_gen)
+    finally:
+        if tracer is not None and trace_dir:
+            tracer.export_chrome_trace(str(Path(trace_dir) / "trace.json"))
+            logger.info(f"Wrote the evaluation trace to {trace_dir}")
+        if monitor is not None:
+            monitor.shutdown()
+        if options.cpu_pool is not None:
+            options.cpu_pool.shutdown()
 
-        results = pool.imap_unordered(process_wrapper, data_gen)
-        results_list = list(results)  # noqa: F841
+    if pipeline.errors:
+        logger.error(
+            f"{len(pipeline.errors)} instances failed: "
+            f"{[state.instance.instance_id for state, _ in pipeline.errors]}"
+        )
 
+    gold_baselines = history.gold_baselines() if history is not None else None
     # aggregate the logs of all instance_ids into one json
+    if len(set(result_dirs.values())) > 1:
+        for submitter, result_dir in result_dirs.items():
+            logger.info(f"Results of {submitter}:")
+            aggregate_logs(
+                result_path=result_dir,
+                dataset_path=dataset_path,
+                output_path=result_dir,
+                metrics_only=retrieval_metrics_only,
+                gold_baselines=gold_baselines,
+            )
+        if not retrieval_metrics_only:
+            aggregate_pass_at_k(result_path)
+        return
     aggregate_logs(
-        result_path=result_path, dataset_path=dataset_path, metrics_only=retrieval_metrics_only
+        result_path=result_path,
+        dataset_path=dataset_path,
+        metrics_only=retrieval_metrics_only,
+        gold_baselines=gold_baselines,
+    )
+
+
+def _aggregate_main(argv: List[str]):
+    """Merge shard result directories into one result directory and aggregate it."""
+    parser = argparse.ArgumentParser(
+        prog="run_evaluation.py aggregate",
+        description="Merge the result directories of the shards of a run and aggregate them.",
+    )
+    parser.add_argument("--dataset-path", type=str, required=True)
+    parser.add_argument(
+        "--result-paths",
+        type=str,
+        nargs="+",
+        required=True,
+        help="The result directories of all shards.",
+    )
+    parser.add_argument(
+        "--output-path",
+        type=str,
+        required=True,
+        help="Directory to merge the instance results into and write result.json to.",
+    )
+    parser.add_argument("--retrieval-metrics-only", action="store_true", default=False)
+    parser.add_argument(
+        "--allow-gaps",
+        action="store_true",
+        default=False,
+        help="Aggregate even if instances of the shards, or whole shards, have no results.",
+    )
+    parser.add_argument(
+        "--history-path",
+        type=str,
+        default=None,
+        required=False,
+        help="Run history with the gold baselines to report gold-unresolved instances with.",
+    )
+    args = parser.parse_args(argv)
+
+    gold_baselines = None
+    if args.history_path:
+        gold_baselines = RunHistory(args.history_path).gold_baselines()
+    merge_shards(
+        shard_paths=args.result_paths,
+        output_path=args.output_path,
+        dataset_path=args.dataset_path,
+        metrics_only=args.retrieval_metrics_only,
+        allow_gaps=args.allow_gaps,
+        gold_baselines=gold_baselines,
     )
 
 
 if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "aggregate":
+        _aggregate_main(sys.argv[2:])
+        sys.exit(0)
+
     parser = argparse.ArgumentParser()
     parser.add_argument("--dataset-path", type=str, required=True)
-    parser.add_argument("--predictions-path", type=str, required=False)
+    parser.add_argument(
+        "--predictions-path",
+        type=str,
+        nargs="+",
+        required=False,
+        help="One or more predictions files. Equivalent patches are evaluated once.",
+    )
     parser.add_argument("--result-path", type=str, required=True)
     parser.add_argument("--num-threads", type=int, default=1, required=False)
     parser.add_argument("--evaluate-gold", action="store_true", default=False)
@@ -426,18 +1465,218 @@ if __name__ == "__main__":
         default=False,
         help="If set, node retrieval metrics will be computed.",
     )
+    parser.add_argument(
+        "--resource-aware",
+        action="store_true",
+        default=False,
+        help="If set, container runs are admitted by their resource weight instead of only by "
+        "the number of run threads.",
+    )
+    parser.add_argument(
+        "--docker-hosts",
+        type=str,
+        default=None,
+        required=False,
+        help="Comma separated docker hosts (e.g. ssh://user@box1,tcp://box2:2375) to spread "
+        "the evaluation over, with --num-threads concurrent instances per host.",
+    )
+    parser.add_argument(
+        "--queue-db",
+        type=str,
+        default=None,
+        required=False,
+        help="Work queue database of a distributed run (default: <result-path>/work_queue.sqlite).",
+    )
+    parser.add_argument(
+        "--ordering",
+        type=str,
+        choices=ORDERING_POLICIES,
+        default=ORDER_DATASET,
+        help="Order of evaluation. dataset keeps the dataset order, longest-first starts the instances with the longest expected "
+        "build and run durations first, repo-grouped evaluates the instances of a repo back to "
+        "back, affinity pins groups of instances of a repo with nearby base commits to one "
+        "checkout worker so they are built back to back. Expected durations come from the run history.",
+    )
+    parser.add_argument(
+        "--history-path",
+        type=str,
+        default=None,
+        required=False,
+        help="Run history with the build and run durations of previous evaluations. Disabled "
+        "unless a path is given.",
+    )
+    parser.add_argument(
+        "--result-cache",
+        type=str,
+        default=None,
+        required=False,
+        help="Content-addressed cache of instance results, reused when the patch, test patch, "
+        "Dockerfile and test command are unchanged. Disabled unless a path is given.",
+    )
+    parser.add_argument(
+        "--trace-dir",
+        type=str,
+        default=None,
+        required=False,
+        help="Directory to write a Chrome trace (trace.json) and a JSONL event log (events.jsonl) "
+        "of all evaluation operations to.",
+    )
+    parser.add_argument(
+        "--plan",
+        action="store_true",
+        default=False,
+        help="Only report the done instances, the images to build and the estimated disk peak "
+        "and wall time, without evaluating.",
+    )
+    parser.add_argument(
+        "--shard-index",
+        type=int,
+        default=0,
+        required=False,
+        help="The shard of the dataset this machine evaluates, from 0 to --num-shards - 1.",
+    )
+    parser.add_argument(
+        "--num-shards",
+        type=int,
+        default=1,
+        required=False,
+        help="Split the dataset into this many cost-balanced shards, one per machine. Merge "
+        "their result paths with the aggregate subcommand.",
+    )
+    parser.add_argument(
+        "--follow",
+        action="store_true",
+        default=False,
+        help="Tail the predictions file while an agent still appends to it and evaluate every "
+        'new prediction right away, until a {"__end__": true} line or the idle timeout.',
+    )
+    parser.add_argument(
+        "--follow-idle-timeout",
+        type=float,
+        default=600,
+        required=False,
+        help="Seconds without new predictions after which a followed file is considered "
+        "closed (default: 600).",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=None,
+        required=False,
+        help="Serve live Prometheus metrics of the run on http://127.0.0.1:<port>/metrics.",
+    )
+    parser.add_argument(
+        "--early-exit-k",
+        type=int,
+        default=None,
+        required=False,
+        help="With several candidates per instance, skip the remaining candidates of a "
+        "submitter once its pass@k for this k is decided.",
+    )
+    parser.add_argument(
+        "--warm-containers",
+        type=int,
+        default=0,
+        required=False,
+        help="Keep up to this many containers after their evaluation and reuse them, reset to "
+        "their snapshot, when the same image is evaluated again (default: 0, remove them).",
+    )
+    parser.add_argument(
+        "--warm-container-idle",
+        type=float,
+        default=WARM_CONTAINER_IDLE_SECONDS,
+        required=False,
+        help="Seconds an unused warm container is kept.",
+    )
+    parser.add_argument(
+        "--verify-warm-containers",
+        action="store_true",
+        help="Check that the working tree of a reused warm container matches its snapshot.",
+    )
+    parser.add_argument(
+        "--build-backend",
+        choices=BUILD_BACKENDS,
+        default="docker",
+        help="Build instance images with the legacy builder of the docker API (docker) or "
+        "with BuildKit through docker buildx (buildx).",
+    )
+    parser.add_argument(
+        "--build-cache-dir",
+        type=str,
+        default="./buildkit_cache",
+        required=False,
+        help="Directory of the local BuildKit cache of --build-backend buildx, one per repo.",
+    )
+    parser.add_argument(
+        "--adaptive-timeouts",
+        action="store_true",
+        help="Learn the test run timeouts from the runs in the run history, never below the "
+        "language defaults.",
+    )
+    parser.add_argument(
+        "--cpu-workers",
+        type=int,
+        default=None,
+        required=False,
+        help="Number of processes to parse test logs and compute retrieval metrics in, 0 to "
+        "use the stage threads (default: one per CPU with --node-metrics, else 0).",
+    )
+    for stage_name, _ in EVALUATION_STAGES:
+        parser.add_argument(
+            f"--{stage_name}-threads",
+            type=int,
+            default=None,
+            required=False,
+            help=f"Worker threads for the {stage_name} stage (default: --num-threads).",
+        )
 
     args = parser.parse_args()
 
-    evaluate_predictions(
-        dataset_path=args.dataset_path,
-        predictions_path=args.predictions_path,
-        result_path=args.result_path,
-        num_threads=args.num_threads,
-        evaluate_gold=args.evaluate_gold,
-        repo_path=args.repo_path,
-        delete_image=args.delete_image,
-        skip_existing=args.skip_existing,
-        retrieval_metrics_only=args.metrics_only,
-        node_retrieval_metrics=args.node_metrics,
+    container_pool = (
+        ContainerPool(
+            max_containers=args.warm_containers,
+            idle_seconds=args.warm_container_idle,
+            verify=args.verify_warm_containers,
+        )
+        if args.warm_containers > 0
+        else None
     )
+    try:
+        evaluate_predictions(
+            dataset_path=args.dataset_path,
+            predictions_path=args.predictions_path,
+            result_path=args.result_path,
+            num_threads=args.num_threads,
+            evaluate_gold=args.evaluate_gold,
+            repo_path=args.repo_path,
+            delete_image=args.delete_image,
+            skip_existing=args.skip_existing,
+            retrieval_metrics_only=args.metrics_only,
+            node_retrieval_metrics=args.node_metrics,
+            stage_threads={
+                stage_name: getattr(args, f"{stage_name}_threads")
+                for stage_name, _ in EVALUATION_STAGES
+            },
+            resource_aware=args.resource_aware,
+            docker_hosts=args.docker_hosts.split(",") if args.docker_hosts else None,
+            queue_db=args.queue_db,
+            ordering=args.ordering,
+            history_path=args.history_path,
+            result_cache_path=args.result_cache,
+            trace_dir=args.trace_dir,
+            metrics_port=args.metrics_port,
+            plan=args.plan,
+            follow=args.follow,
+            follow_idle_timeout=args.follow_idle_timeout,
+            shard_index=args.shard_index,
+            num_shards=args.num_shards,
+            cpu_workers=args.cpu_workers,
+            adaptive_timeouts=args.adaptive_timeouts,
+            early_exit_k=args.early_exit_k,
+            container_pool=container_pool,
+            build_backend=args.build_backend,
+            build_cache_dir=args.build_cache_dir,
+        )
+    finally:
+        if container_pool is not None:
+            container_pool.close()
@@ -0,0 +1,122 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: CC-BY-NC-4.0
+from itertools import zip_longest
+
+import pandas as pd
+
+from poly_bench_evaluation.dedup import patch_hash
+from poly_bench_evaluation.history import DurationEstimates
+
+# Keep the dataset row order
+ORDER_DATASET = "dataset"
+# Longest expected build plus run duration first, so long runs don't start at the tail
+ORDER_LONGEST_FIRST = "longest-first"
+# Instances of a repo back to back, repos with the largest total cost first
+ORDER_REPO_GROUPED = "repo-grouped"
+
+# Instances of a repo with nearby base commits in affinity groups, pinned to one worker each
+ORDER_AFFINITY = "affinity"
+
+ORDERING_POLICIES = [ORDER_DATASET, ORDER_LONGEST_FIRST, ORDER_REPO_GROUPED, ORDER_AFFINITY]
+
+# Column holding the affinity group of a row with the affinity policy
+AFFINITY_GROUP_COLUMN = "affinity_group"
+# Maximum number of instances in one affinity group
+AFFINITY_GROUP_SIZE = 8
+
+
+def expected_costs(
+    dataset: pd.DataFrame, estimates: DurationEstimates, evaluate_gold: bool = False
+) -> pd.Series:
+    """Get the expected build plus run duration in seconds of every dataset row.
+
+    Rows with an empty model patch are never run and cost nothing, and neither do rows with a
+    gold-equivalent patch whose gold baseline is known.
+    """
+
+    def row_cost(row) -> float:
+        model_patch = row.get("model_patch", "")
+        if not evaluate_gold:
+            if not (isinstance(model_patch, str) and model_patch.strip()):
+                return 0.0
+            if row["instance_id"] in estimates.gold_baselines and patch_hash(
+                model_patch
+            ) == patch_hash(row.get("patch", "")):
+                return 0.0
+        return estimates.expected_cost(row["instance_id"], row["repo"], row["language"])
+
+    if dataset.empty:
+        return pd.Series(dtype=float)
+    return dataset.apply(row_cost, axis=1)
+
+
+def order_dataset(
+    dataset: pd.DataFrame,
+    policy: str,
+    estimates: DurationEstimates,
+    evaluate_gold: bool = False,
+    group_size: int = AFFINITY_GROUP_SIZE,
+) -> pd.DataFrame:
+    """Order the dataset rows for evaluation.
+
+    With the affinity policy, the affinity group of every row is added in AFFINITY_GROUP_COLUMN.
+
+    Args:
+        dataset: The dataset (merged with the predictions).
+        policy: One of ORDERING_POLICIES.
+        estimates: Duration estimates used to compute the expected cost of every row.
+        evaluate_gold: Whether the gold patches are evaluated.
+        group_size: Maximum number of instances in one affinity group.
+
+    Returns:
+        The reordered dataset.
+    Raises:
+        ValueError: If the policy is unknown.
+    """
+    if policy not in ORDERING_POLICIES:
+        raise ValueError(f"Unknown ordering policy {policy}. Choose one of {ORDERING_POLICIES}.")
+    if policy == ORDER_DATASET or dataset.empty:
+        return dataset
+
+    ordered = dataset.assign(
+        _cost=expected_costs(dataset, estimates, evaluate_gold=evaluate_gold).values
+    )
+    if policy == ORDER_LONGEST_FIRST:
+        ordered = ordered.sort_values("_cost", ascending=False, kind="stable")
+    elif policy == ORDER_AFFINITY:
+        ordered = _order_by_affinity(ordered, group_size=group_size)
+    else:
+        ordered = ordered.assign(_repo_cost=ordered.groupby("repo")["_cost"].transform("sum"))
+        ordered = ordered.sort_values(
+            ["_repo_cost", "repo", "_cost"], ascending=[False, True, False], kind="stable"
+        )
+        ordered = ordered.drop(columns=["_repo_cost"])
+
+    return ordered.drop(columns=["_cost"])
+
+
+def _order_by_affinity(dataset: pd.DataFrame, group_size: int) -> pd.DataFrame:
+    """Split the instances of every repo into groups of nearby base commits.
+
+    Instances are sorted by creation date within their repo (dataset order if there is no
+    created_at column) and chunked into groups. The groups are interleaved, the most expensive
+    first, so every group can be pinned to its own worker while all workers stay busy. Within a
+    group the instances keep their commit order.
+    """
+    sort_columns = ["repo", "created_at"] if "created_at" in dataset.columns else ["repo"]
+    dataset = dataset.sort_values(sort_columns, kind="stable")
+
+    groups = []
+    for repo, repo_rows in dataset.groupby("repo", sort=False):
+        for start in range(0, len(repo_rows), group_size):
+            group = repo_rows.iloc[start : start + group_size]
+            groups.append(group.assign(**{AFFINITY_GROUP_COLUMN: f"{repo}#{start // group_size}"}))
+    groups.sort(key=lambda group: group["_cost"].sum(), reverse=True)
+
+    interleaved = [
+        row_index
+        for rows in zip_longest(*(group.index for group in groups))
+        for row_index in rows
+        if row_index is not None
+    ]
+    return pd.concat(groups).loc[interleaved]
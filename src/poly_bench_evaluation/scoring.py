@@ -1,15 +1,17 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: CC-BY-NC-4.0
 import json
+import math
 from dataclasses import asdict
 from pathlib import Path
 from typing import Any, Dict, List, Optional, Tuple, Union
 
 import pandas as pd
 
-from datasets import load_dataset
 from loguru import logger
 
+from poly_bench_evaluation.dedup import sample_family
+from poly_bench_evaluation.history import GoldBaseline
 from poly_bench_evaluation.polybench_data import (
     AggregateOutput,
     PolyBenchOutput,
@@ -24,7 +26,7 @@ def instance_level_scoring(
     p2p: List[str],
     patch_applied: bool,
     generation: bool,
-) -> Union[PolyBenchOutput, PolyBenchRetrievalMetrics]:
+) -> PolyBenchOutput:
     """Logging and storing function (instance level).
 
     This function returns a PolyBenchOutput json.
@@ -189,7 +191,11 @@ def _get_retrieval_metrics_for_agg(
 
 
 def aggregate_logs(
-    result_path: str, dataset_path: str, output_path: str = "./", metrics_only: bool = False
+    result_path: str,
+    dataset_path: str,
+    output_path: str = "./",
+    metrics_only: bool = False,
+    gold_baselines: Optional[Dict[str, GoldBaseline]] = None,
 ):
     """Aggregate all the logs into a single json file.
     Args:
@@ -197,6 +203,8 @@ def aggregate_logs(
         dataset_path: The polybench dataset path
         output_path: The path where aggregated results are stored (default: current working directory)
         metrics_only: Whether to only aggregate and store metrics
+        gold_baselines: Known gold baselines by instance id, used to report the evaluated
+            instances that the gold patch doesn't resolve either
     """
 
     result = AggregateOutput(
@@ -238,9 +246,29 @@ def aggregate_logs(
             if not data.get("generation") and not data.get("patch_applied"):
                 result.total_empty_patch_instances += 1
 
+            if data.get("timed_out"):
+                result.timed_out.append(data["instance_id"])
+
         result.total_resolved = len(result.resolved)
         result.total_unresolved = len(result.not_resolved)
         result.total_instances = result.total_resolved + result.total_unresolved
+        if result.timed_out:
+            logger.warning(
+                f"{len(result.timed_out)} test runs hit their timeout: {result.timed_out}"
+            )
+
+        if gold_baselines is not None:
+            result.gold_unresolved = sorted(
+                data["instance_id"]
+                for data in all_jsons
+                if data["instance_id"] in gold_baselines
+                and not gold_baselines[data["instance_id"]].resolved
+            )
+            if result.gold_unresolved:
+                logger.warning(
+                    f"{len(result.gold_unresolved)} evaluated instances are not resolved by "
+                    f"their gold patch either: {result.gold_unresolved}"
+                )
 
     file_ret_metrics, node_ret_metrics, file_re_df, node_re_df = _get_retrieval_metrics_for_agg(
         result_path
@@ -259,11 +287,12 @@ def aggregate_logs(
 
     # Print results
     try:
-        dataset = (
-            pd.read_csv(dataset_path)
-            if dataset_path.endswith(".csv")
-            else load_dataset(dataset_path, split="test").to_pandas()
-        )
+        if dataset_path.endswith(".csv"):
+            dataset = pd.read_csv(dataset_path)
+        else:
+            from datasets import load_dataset
+
+            dataset = load_dataset(dataset_path, split="test").to_pandas()
     except Exception:
         raise ValueError("Please provide a correct dataset file or huggingface path.")
 
@@ -344,3 +373,81 @@ def _print_detailed_results(
         )
         rate = resolved_category / total
         print(f"{category}: {resolved_category}/{total} ({rate:.1%})")
+
+
+def pass_at_k(n: int, c: int, k: int) -> float:
+    """Get the unbiased pass@k estimate of an instance with c of n candidates resolved."""
+    if n - c < k:
+        return 1.0
+    return 1.0 - math.comb(n - c, k) / math.comb(n, k)
+
+
+def aggregate_pass_at_k(result_path: str, output_path: Optional[str] = None) -> Dict[str, Any]:
+    """Aggregate the pass@k of every submitter that sent several candidates per instance.
+
+    The candidates of a submitter are stored in its sample result directories
+    (<submitter>__sample_<i>) in result_path. An instance whose candidates were not all
+    evaluated (e.g. skipped by the early exit) only has a known pass@k if more than n - k of
+    the evaluated ones are resolved. pass@k is None if it is unknown for any instance, and
+    those instances are listed as undecided.
+
+    Args:
+        result_path: The directory with the sample result directories.
+        output_path: Directory to write pass_at_k.json to (default: result_path).
+    Returns:
+        The pass@k report of every submitter, empty if there are no sample directories.
+    """
+    samples: Dict[str, List[Path]] = {}
+    if not Path(result_path).is_dir():
+        return {}
+    for result_dir in sorted(Path(result_path).iterdir()):
+        family = sample_family(result_dir.name) if result_dir.is_dir() else None
+        if family is not None:
+            samples.setdefault(family, []).append(result_dir)
+
+    report: Dict[str, Any] = {}
+    for family, result_dirs in samples.items():
+        n = len(result_dirs)
+        resolved: Dict[str, int] = {}
+        evaluated: Dict[str, int] = {}
+        for result_dir in result_dirs:
+            for data in _get_all_instance_results(result_dir):
+                instance_id = data["instance_id"]
+                evaluated[instance_id] = evaluated.get(instance_id, 0) + 1
+                resolved[instance_id] = resolved.get(instance_id, 0) + int(bool(data["resolved"]))
+
+        family_report: Dict[str, Any] = {
+            "candidates": n,
+            "instances": len(evaluated),
+            "early_exit_instances": sorted(i for i, e in evaluated.items() if e < n),
+        }
+        for k in range(1, n + 1):
+            estimates = []
+            undecided = []
+            for instance_id, count in evaluated.items():
+                c = resolved[instance_id]
+                if count == n or c > n - k:
+                    estimates.append(pass_at_k(n, c, k))
+                else:
+                    undecided.append(instance_id)
+            family_report[f"pass@{k}"] = (
+                sum(estimates) / len(estimates) if estimates and not undecided else None
+            )
+            if undecided:
+                family_report[f"undecided@{k}"] = sorted(undecided)
+        report[family] = family_report
+        logger.info(
+            f"{family}: "
+            + ", ".join(
+                f"pass@{k}={family_report[f'pass@{k}']:.2%}"
+                for k in range(1, n + 1)
+                if family_report[f"pass@{k}"] is not None
+            )
+        )
+
+    if report:
+        output_file = Path(output_path or result_path) / "pass_at_k.json"
+        logger.info(f"Writing pass@k results to {output_file}")
+        with open(output_file, "w") as f:
+            json.dump(report, f, indent=4)
+    return report
@@ -0,0 +1,398 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: CC-BY-NC-4.0
+import argparse
+import json
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict, defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Deque, Dict, Optional
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+from loguru import logger
+
+from poly_bench_evaluation.docker_utils import (
+    BUILD_BACKENDS,
+    WARM_CONTAINER_IDLE_SECONDS,
+    BuildCache,
+    ContainerPool,
+    DockerManager,
+)
+from poly_bench_evaluation.history import RunHistory
+from poly_bench_evaluation.polybench_data import (
+    PolyBenchInstance,
+    dataset_generator,
+    load_dataset_file,
+)
+from poly_bench_evaluation.result_cache import ResultCache
+from poly_bench_evaluation.run_evaluation import evaluate_instance
+
+if TYPE_CHECKING:
+    import docker
+
+# Finished jobs kept for polling, older ones are forgotten
+DEFAULT_MAX_FINISHED_JOBS = 10000
+# Containers kept warm for further jobs of their instance
+DEFAULT_WARM_CONTAINERS = 16
+
+
+@dataclass
+class EvaluationJob:
+    """An (instance_id, model_patch) evaluation submitted to the service."""
+
+    job_id: str
+    instance_id: str
+    model_patch: str
+    # One of queued, running, done, failed
+    status: str = "queued"
+    # The stored PolyBenchOutput and PolyBenchRetrievalMetrics of the patch, as dicts
+    result: Optional[Dict[str, Any]] = None
+    metrics: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    submitted_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    done: threading.Event = field(default_factory=threading.Event, repr=False)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "instance_id": self.instance_id,
+            "status": self.status,
+            "result": self.result,
+            "metrics": self.metrics,
+            "error": self.error,
+            "submitted_at": self.submitted_at,
+            "finished_at": self.finished_at,
+        }
+
+
+def _read_json(path: Path) -> Optional[Dict[str, Any]]:
+    if not path.exists():
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+class EvaluationService:
+    """A long-running evaluator that scores single patches without paying the startup cost.
+
+    The dataset index, docker client, base images, result cache and run history stay resident,
+    and instance images are kept between jobs unless delete_image is set. Up to warm_containers
+    containers are kept as well and reset to their snapshot for the next job of their instance.
+    Jobs run on a thread pool through evaluate_instance; jobs of the same instance run one after
+    the other since they share the image, container name and run log. They wait in a queue per
+    instance, so only the job at its head holds a pool thread.
+    """
+
+    def __init__(
+        self,
+        dataset: pd.DataFrame,
+        repo_path: str,
+        client: "docker.DockerClient",
+        num_threads: int = 1,
+        delete_image: bool = False,
+        retrieval_metrics_only: bool = False,
+        node_retrieval_metrics: bool = False,
+        result_cache_path: Optional[str] = None,
+        history_path: Optional[str] = None,
+        adaptive_timeouts: bool = False,
+        max_finished_jobs: int = DEFAULT_MAX_FINISHED_JOBS,
+        warm_containers: int = DEFAULT_WARM_CONTAINERS,
+        warm_container_idle_seconds: float = WARM_CONTAINER_IDLE_SECONDS,
+        verify_warm_containers: bool = False,
+        build_backend: str = "docker",
+        build_cache_dir: Optional[str] = None,
+    ):
+        self.instances: Dict[str, PolyBenchInstance] = {
+            instance.instance_id: instance for instance in dataset_generator(dataset)
+        }
+        self.repo_path = repo_path
+        self.client = client
+        self.delete_image = delete_image
+        self.retrieval_metrics_only = retrieval_metrics_only
+        self.node_retrieval_metrics = node_retrieval_metrics
+        self.result_cache = ResultCache(result_cache_path) if result_cache_path else None
+        self.history = RunHistory(history_path) if history_path else None
+        self.run_timeouts = (
+            self.history.estimates() if self.history is not None and adaptive_timeouts else None
+        )
+        self.max_finished_jobs = max_finished_jobs
+        self.build_backend = build_backend
+        self.build_cache = (
+            BuildCache(build_cache_dir) if build_backend == "buildx" and build_cache_dir else None
+        )
+        # Deleted images leave nothing to keep a container of
+        self.container_pool = (
+            ContainerPool(
+                max_containers=warm_containers,
+                idle_seconds=warm_container_idle_seconds,
+                verify=verify_warm_containers,
+            )
+            if warm_containers > 0 and not delete_image
+            else None
+        )
+
+        self._executor = ThreadPoolExecutor(max_workers=num_threads, thread_name_prefix="eval")
+        self._jobs: "OrderedDict[str, EvaluationJob]" = OrderedDict()
+        self._jobs_lock = threading.Lock()
+        # Unfinished jobs per instance, the first one is running or about to run
+        self._instance_queues: Dict[str, Deque[EvaluationJob]] = defaultdict(deque)
+        self._base_images: Dict[str, bool] = {}
+        self._base_images_lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._stopped = threading.Event()
+        if self.container_pool is not None:
+            threading.Thread(
+                target=self._evict_idle_containers, name="warm-container-eviction", daemon=True
+            ).start()
+
+    def submit(self, instance_id: str, model_patch: str) -> EvaluationJob:
+        """Queue the evaluation of a patch.
+
+        Raises:
+            KeyError: If the instance is not in the dataset.
+        """
+        if instance_id not in self.instances:
+            raise KeyError(f"Instance {instance_id} is not in the dataset")
+        job = EvaluationJob(
+            job_id=uuid.uuid4().hex, instance_id=instance_id, model_patch=model_patch
+        )
+        with self._jobs_lock:
+            self._jobs[job.job_id] = job
+            self._forget_finished_jobs()
+            instance_queue = self._instance_queues[instance_id]
+            instance_queue.append(job)
+            idle = len(instance_queue) == 1
+        if idle:
+            self._executor.submit(self._run_next_job, instance_id)
+        return job
+
+    def job(self, job_id: str) -> Optional[EvaluationJob]:
+        with self._jobs_lock:
+            return self._jobs.get(job_id)
+
+    def counts(self) -> Dict[str, int]:
+        """Get the number of known jobs per status."""
+        counts: Dict[str, int] = defaultdict(int)
+        with self._jobs_lock:
+            for job in self._jobs.values():
+                counts[job.status] += 1
+        return dict(counts)
+
+    def _evict_idle_containers(self):
+        container_pool = self.container_pool
+        assert container_pool is not None, "No container pool to evict from"
+        interval = max(1.0, container_pool.idle_seconds / 4)
+        while not self._stopped.wait(interval):
+            container_pool.evict_idle()
+
+    def _forget_finished_jobs(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.done.is_set()]
+        for job_id in finished[: max(0, len(finished) - self.max_finished_jobs)]:
+            del self._jobs[job_id]
+
+    def _ensure_base_image(self, language: str):
+        if language == "Python" or self.retrieval_metrics_only:
+            return
+        with self._base_images_lock:
+            if not self._base_images.get(language):
+                DockerManager(
+                    image_id=f"polybench_{language.lower()}_base",
+                    delete_image=False,
+                    client=self.client,
+                ).build_base_image(language=language)
+                self._base_images[language] = True
+
+    def _run_next_job(self, instance_id: str):
+        """Evaluate the job at the head of the queue of an instance, then submit the next one."""
+        with self._jobs_lock:
+            job = self._instance_queues[instance_id][0]
+        self._evaluate(job)
+        with self._jobs_lock:
+            instance_queue = self._instance_queues[instance_id]
+            instance_queue.popleft()
+            if not instance_queue:
+                del self._instance_queues[instance_id]
+                return
+        if not self._stopped.is_set():
+            self._executor.submit(self._run_next_job, instance_id)
+
+    def _evaluate(self, job: EvaluationJob):
+        instance = self.instances[job.instance_id].model_copy(
+            update={"model_patch": job.model_patch}
+        )
+        try:
+            job.status = "running"
+            self._ensure_base_image(instance.language)
+            with tempfile.TemporaryDirectory() as tmp_result_path:
+                evaluate_instance(
+                    instance=instance,
+                    result_path=tmp_result_path,
+                    evaluate_gold=False,
+                    repo_path=self.repo_path,
+                    delete_image=self.delete_image,
+                    client=self.client,
+                    retrieval_metrics_only=self.retrieval_metrics_only,
+                    node_retrieval_metrics=self.node_retrieval_metrics,
+                    result_cache=self.result_cache,
+                    history=self.history,
+                    run_timeouts=self.run_timeouts,
+                    container_pool=self.container_pool,
+                    build_backend=self.build_backend,
+                    build_cache=self.build_cache,
+                )
+                job.result = _read_json(Path(tmp_result_path) / f"{job.instance_id}_result.json")
+                job.metrics = _read_json(Path(tmp_result_path) / f"{job.instance_id}_metrics.json")
+            job.status = "done"
+        except Exception as e:
+            logger.exception(f"Evaluation job {job.job_id} of {job.instance_id} failed: {e}")
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            job.finished_at = time.time()
+            job.done.set()
+
+    def serve(self, port: int, host: str = "127.0.0.1"):
+        """Serve the job API on http://host:port from a background thread.
+
+        POST /jobs with {"instance_id": ..., "model_patch": ...} queues a job and returns its
+        job_id. GET /jobs/<job_id>?wait=<seconds> returns the job, waiting up to that long for
+        it to finish. GET /health returns the number of instances, the jobs per status and the
+        warm container counters.
+        """
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _send_json(self, status: int, body: Dict[str, Any]):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                if urlparse(self.path).path != "/jobs":
+                    self._send_json(404, {"error": "Not found"})
+                    return
+                try:
+                    length = int(self.headers.get("Content-Length", 0))
+                    request = json.loads(self.rfile.read(length))
+                    instance_id = request["instance_id"]
+                    model_patch = request["model_patch"]
+                    if not isinstance(instance_id, str) or not isinstance(model_patch, str):
+                        raise TypeError("instance_id and model_patch must be strings")
+                except (ValueError, KeyError, TypeError) as e:
+                    self._send_json(400, {"error": f"Invalid job: {e}"})
+                    return
+                try:
+                    job = service.submit(instance_id, model_patch)
+                except KeyError as e:
+                    self._send_json(404, {"error": str(e.args[0])})
+                    return
+                self._send_json(202, job.to_dict())
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path == "/health":
+                    health = {"instances": len(service.instances), "jobs": service.counts()}
+                    if service.container_pool is not None:
+                        health["containers"] = service.container_pool.stats()
+                    self._send_json(200, health)
+                    return
+                if not url.path.startswith("/jobs/"):
+                    self._send_json(404, {"error": "Not found"})
+                    return
+                job = service.job(url.path[len("/jobs/") :])
+                if job is None:
+                    self._send_json(404, {"error": "Unknown job"})
+                    return
+                try:
+                    wait = float(parse_qs(url.query).get("wait", ["0"])[0])
+                except ValueError:
+                    self._send_json(400, {"error": "wait must be a number of seconds"})
+                    return
+                if wait > 0:
+                    job.done.wait(wait)
+                self._send_json(200, job.to_dict())
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        thread = threading.Thread(
+            target=self._server.serve_forever, name="evaluation-server", daemon=True
+        )
+        thread.start()
+        logger.info(
+            f"Serving evaluations of {len(self.instances)} instances on "
+            f"http://{host}:{self._server.server_port}"
+        )
+
+    def shutdown(self, wait: bool = True):
+        """Stop the server, if it was started, and the evaluation threads.
+
+        The warm containers are removed once the evaluation threads are done, or right away
+        without wait.
+        """
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        self._stopped.set()
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+        if self.container_pool is not None:
+            self.container_pool.close()
+
+
+if __name__ == "__main__":
+    import docker
+
+    parser = argparse.ArgumentParser(description="Serve single patch evaluations over HTTP.")
+    parser.add_argument("--dataset-path", type=str, required=True)
+    parser.add_argument("--repo-path", type=str, default="~/polybench_repos", required=False)
+    parser.add_argument("--port", type=int, default=8642, required=False)
+    parser.add_argument("--host", type=str, default="127.0.0.1", required=False)
+    parser.add_argument("--num-threads", type=int, default=1, required=False)
+    parser.add_argument("--delete-image", action="store_true")
+    parser.add_argument("--metrics-only", action="store_true")
+    parser.add_argument("--node-metrics", action="store_true")
+    parser.add_argument("--result-cache", type=str, default=None)
+    parser.add_argument("--history-path", type=str, default=None)
+    parser.add_argument("--adaptive-timeouts", action="store_true")
+    parser.add_argument("--warm-containers", type=int, default=DEFAULT_WARM_CONTAINERS)
+    parser.add_argument("--warm-container-idle", type=float, default=WARM_CONTAINER_IDLE_SECONDS)
+    parser.add_argument("--verify-warm-containers", action="store_true")
+    parser.add_argument("--build-backend", choices=BUILD_BACKENDS, default="docker")
+    parser.add_argument("--build-cache-dir", type=str, default="./buildkit_cache")
+    args = parser.parse_args()
+
+    service = EvaluationService(
+        dataset=load_dataset_file(args.dataset_path),
+        repo_path=args.repo_path,
+        client=docker.from_env(timeout=720),
+        num_threads=args.num_threads,
+        delete_image=args.delete_image,
+        retrieval_metrics_only=args.metrics_only,
+        node_retrieval_metrics=args.node_metrics,
+        result_cache_path=args.result_cache,
+        history_path=args.history_path,
+        adaptive_timeouts=args.adaptive_timeouts,
+        warm_containers=args.warm_containers,
+        warm_container_idle_seconds=args.warm_container_idle,
+        verify_warm_containers=args.verify_warm_containers,
+        build_backend=args.build_backend,
+        build_cache_dir=args.build_cache_dir,
+    )
+    service.serve(port=args.port, host=args.host)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        logger.info("Shutting down the evaluation server")
+        service.shutdown(wait=False)
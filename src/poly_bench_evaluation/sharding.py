@@ -0,0 +1,192 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: CC-BY-NC-4.0
+import hashlib
+import heapq
+import json
+import shutil
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+import pandas as pd
+from loguru import logger
+
+from poly_bench_evaluation.history import DurationEstimates, GoldBaseline
+from poly_bench_evaluation.scoring import aggregate_logs, aggregate_pass_at_k
+
+# File in a shard result directory recording the partition it evaluates
+SHARD_MANIFEST = "shard.json"
+# Suffix of the marker stored instead of a result for a candidate skipped by the early exit
+SKIPPED_SUFFIX = "_skipped.json"
+
+
+def _stable_hash(instance_id: str) -> int:
+    return int.from_bytes(hashlib.sha256(instance_id.encode("utf-8")).digest()[:8], "big")
+
+
+def shard_dataset(
+    dataset: pd.DataFrame,
+    shard_index: int,
+    num_shards: int,
+    predicted: Optional[Set[str]] = None,
+) -> pd.DataFrame:
+    """Get the rows of one shard of a deterministic, cost-balanced partition of the dataset.
+
+    Instances are assigned longest expected cost first to the least loaded shard, ties broken
+    by a stable hash of the instance_id. The costs are the language defaults, not the local run
+    history, so every machine computes the same partition from the same dataset and predictions.
+    Instances without a prediction cost nothing and are spread by their hash alone.
+
+    Args:
+        dataset: The full dataset, before instances are skipped for any machine-local reason.
+        shard_index: The shard to return, from 0 to num_shards - 1.
+        num_shards: The number of shards.
+        predicted: Instances with a non-empty predicted patch, or None if all are evaluated.
+    Returns:
+        The rows of the shard, in dataset order.
+    Raises:
+        ValueError: If the shard index is out of range.
+    """
+    if num_shards < 1 or not 0 <= shard_index < num_shards:
+        raise ValueError(f"Shard index {shard_index} is not in [0, {num_shards}).")
+
+    estimates = DurationEstimates()
+    costs = {}
+    for row in dataset.itertuples(index=False):
+        if predicted is not None and row.instance_id not in predicted:
+            costs[row.instance_id] = 0.0
+        else:
+            costs[row.instance_id] = estimates.expected_cost(
+                row.instance_id, row.repo, row.language
+            )
+
+    loads = [(0.0, shard) for shard in range(num_shards)]
+    shards: Dict[str, int] = {}
+    for instance_id in sorted(costs, key=lambda i: (-costs[i], _stable_hash(i), i)):
+        if costs[instance_id] == 0:
+            shards[instance_id] = _stable_hash(instance_id) % num_shards
+            continue
+        load, shard = heapq.heappop(loads)
+        shards[instance_id] = shard
+        heapq.heappush(loads, (load + costs[instance_id], shard))
+
+    return dataset[dataset["instance_id"].map(shards) == shard_index]
+
+
+def write_shard_manifest(
+    result_path: str, shard_index: int, num_shards: int, instance_ids: List[str]
+):
+    """Record the partition a shard result directory evaluates, for merge_shards."""
+    Path(result_path).mkdir(parents=True, exist_ok=True)
+    with open(Path(result_path) / SHARD_MANIFEST, "w") as f:
+        json.dump(
+            {"shard_index": shard_index, "num_shards": num_shards, "instance_ids": instance_ids},
+            f,
+            indent=4,
+        )
+
+
+def merge_shards(
+    shard_paths: List[str],
+    output_path: str,
+    dataset_path: str,
+    metrics_only: bool = False,
+    allow_gaps: bool = False,
+    gold_baselines: Optional[Dict[str, GoldBaseline]] = None,
+) -> List[str]:
+    """Merge the instance results of several shard result directories and aggregate them.
+
+    Results of several submitters, stored in submitter subdirectories, stay in the same
+    subdirectory of output_path and are aggregated per submitter, and the pass@k of submitters
+    with several candidates per instance is aggregated as well. The skip markers of candidates
+    left out by the early exit count as results and are copied along, as in an unsharded run.
+
+    Args:
+        shard_paths: The result directories of the shards.
+        output_path: Directory to copy the merged instance results to and write the
+            aggregated results (result.json or metrics.json) in.
+        dataset_path: The polybench dataset path.
+        metrics_only: Whether the shards only computed retrieval metrics.
+        allow_gaps: Whether to aggregate even if instances of the shards have no results.
+        gold_baselines: Known gold baselines by instance id, passed to aggregate_logs.
+    Returns:
+        The instance ids without a result (empty unless allow_gaps is set).
+    Raises:
+        ValueError: If an instance result is found in several shards, the shard manifests
+            don't describe one partition, or instances lack results and allow_gaps isn't set.
+    """
+    suffix = "_metrics.json" if metrics_only else "_result.json"
+    manifests = []
+    for shard_path in shard_paths:
+        manifest_file = Path(shard_path) / SHARD_MANIFEST
+        if manifest_file.exists():
+            with open(manifest_file) as f:
+                manifests.append(json.load(f))
+
+    expected: Set[str] = set()
+    if manifests:
+        num_shards = {manifest["num_shards"] for manifest in manifests}
+        if len(num_shards) != 1:
+            raise ValueError(f"The shards were split into different numbers: {num_shards}")
+        indices = [manifest["shard_index"] for manifest in manifests]
+        if len(indices) != len(set(indices)):
+            raise ValueError(f"Shard indices are repeated: {sorted(indices)}")
+        missing_shards = sorted(set(range(num_shards.pop())) - set(indices))
+        if missing_shards:
+            message = f"Result directories of shards {missing_shards} are missing"
+            if not allow_gaps:
+                raise ValueError(message)
+            logger.warning(message)
+        for manifest in manifests:
+            expected.update(manifest["instance_ids"])
+
+    # Instance result files by path relative to their shard directory
+    sources: Dict[Path, Path] = {}
+    duplicates = []
+    for shard_path in shard_paths:
+        for result_file in sorted(Path(shard_path).rglob("*_*.json")):
+            if not result_file.name.endswith(("_result.json", "_metrics.json", SKIPPED_SUFFIX)):
+                continue
+            relative = result_file.relative_to(shard_path)
+            if relative in sources:
+                duplicates.append(str(relative))
+                continue
+            sources[relative] = result_file
+    if duplicates:
+        raise ValueError(f"Instance results found in several shards: {sorted(duplicates)}")
+
+    result_dirs = sorted({relative.parent for relative in sources} or {Path(".")})
+    gaps = []
+    for result_dir in result_dirs:
+        found = {
+            relative.name[: -len(end)]
+            for relative in sources
+            for end in (suffix, SKIPPED_SUFFIX)
+            if relative.parent == result_dir and relative.name.endswith(end)
+        }
+        gaps += [str(result_dir / instance_id) for instance_id in sorted(expected - found)]
+    if gaps:
+        message = f"{len(gaps)} instances of the shards have no results: {gaps}"
+        if not allow_gaps:
+            raise ValueError(message)
+        logger.warning(message)
+
+    for relative, source in sources.items():
+        target = Path(output_path) / relative
+        if target.exists() and target.samefile(source):
+            continue
+        target.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copy2(source, target)
+    logger.info(f"Merged {len(sources)} instance results of {len(shard_paths)} shards")
+
+    for result_dir in result_dirs:
+        merged_dir = str(Path(output_path) / result_dir)
+        aggregate_logs(
+            result_path=merged_dir,
+            dataset_path=dataset_path,
+            output_path=merged_dir,
+            metrics_only=metrics_only,
+            gold_baselines=gold_baselines,
+        )
+    if not metrics_only:
+        aggregate_pass_at_k(output_path)
+    return gaps
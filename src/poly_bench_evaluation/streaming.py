@@ -0,0 +1,97 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: CC-BY-NC-4.0
+import json
+import time
+from pathlib import Path
+from typing import Dict, Iterator, Optional, TextIO
+
+from loguru import logger
+
+# Key of the JSONL line that ends a followed predictions file, e.g. {"__end__": true}
+END_MARKER = "__end__"
+
+
+def _follow_lines(f: TextIO, poll_interval: float, idle_timeout: Optional[float]) -> Iterator[str]:
+    """Yield the complete lines of a file as they are appended to it.
+
+    A line without its newline is held back until the writer finishes it, or until the file
+    stops growing for idle_timeout seconds, which is taken as the file being closed.
+    """
+    pending = ""
+    last_growth = time.monotonic()
+    while True:
+        chunk = f.readline()
+        if chunk:
+            last_growth = time.monotonic()
+            pending += chunk
+            if pending.endswith("\n"):
+                yield pending
+                pending = ""
+            continue
+        if idle_timeout is not None and time.monotonic() - last_growth > idle_timeout:
+            if pending:
+                yield pending
+            return
+        time.sleep(poll_interval)
+
+
+def follow_predictions(
+    predictions_path: str, poll_interval: float = 1.0, idle_timeout: Optional[float] = None
+) -> Iterator[Dict[str, str]]:
+    """Yield the predictions of a JSONL file while an agent is still appending to it.
+
+    Every line is validated when it is complete. Lines that aren't JSON or lack instance_id or
+    model_patch are skipped with a warning, and so are repeated predictions of an instance (the
+    first one is kept, as with load_predictions).
+
+    Args:
+        predictions_path: The predictions file, which may not exist yet.
+        poll_interval: Seconds to wait for new lines.
+        idle_timeout: Seconds without new lines after which the file is considered closed.
+            None waits for the end marker.
+    Yields:
+        Dicts with the instance_id and model_patch of every new prediction, until a line with
+        a true END_MARKER key or the idle timeout.
+    """
+    waiting_since = time.monotonic()
+    while not Path(predictions_path).exists():
+        if idle_timeout is not None and time.monotonic() - waiting_since > idle_timeout:
+            logger.warning(f"Predictions file {predictions_path} was never created")
+            return
+        time.sleep(poll_interval)
+
+    seen = set()
+    with open(predictions_path) as f:
+        for number, line in enumerate(_follow_lines(f, poll_interval, idle_timeout), start=1):
+            if not line.strip():
+                continue
+            try:
+                prediction = json.loads(line)
+            except json.JSONDecodeError:
+                logger.warning(f"Skipping line {number} of {predictions_path}: not valid JSON")
+                continue
+            if not isinstance(prediction, dict):
+                logger.warning(f"Skipping line {number} of {predictions_path}: not an object")
+                continue
+            if prediction.get(END_MARKER):
+                logger.info(f"Reached the end marker of {predictions_path}")
+                return
+            instance_id = prediction.get("instance_id")
+            model_patch = prediction.get("model_patch")
+            if not isinstance(instance_id, str) or "model_patch" not in prediction:
+                logger.warning(
+                    f"Skipping line {number} of {predictions_path}: instance_id or "
+                    "model_patch not found"
+                )
+                continue
+            if instance_id in seen:
+                logger.warning(
+                    f"Ignoring the repeated prediction of {instance_id}, the first one is kept."
+                )
+                continue
+            seen.add(instance_id)
+            yield {
+                "instance_id": instance_id,
+                "model_patch": model_patch if isinstance(model_patch, str) else "",
+            }
+    logger.info(f"{predictions_path} stopped growing, finalizing its evaluation")
@@ -0,0 +1,120 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: CC-BY-NC-4.0
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+
+@dataclass
+class Span:
+    """A timed operation of an instance evaluation."""
+
+    name: str
+    # Unix times in seconds
+    start: float
+    end: float
+    thread_id: int
+    thread_name: str
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    # Set if the operation raised
+    error: Optional[str] = None
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+
+class Tracer:
+    """Collect spans from all evaluation threads and export them.
+
+    Every finished span is appended to the JSONL event log right away, so the log survives an
+    interrupted run. The Chrome trace-event file (viewable in chrome://tracing or Perfetto) is
+    written by export_chrome_trace.
+    """
+
+    def __init__(self, jsonl_path: Optional[str] = None, keep_spans: bool = True):
+        """
+        Args:
+            jsonl_path: Path of the JSONL event log, or None to keep the spans in memory only.
+            keep_spans: Whether to keep the finished spans for export_chrome_trace. Tracers
+                that only feed listeners don't need to.
+        """
+        self.jsonl_path = jsonl_path
+        self.keep_spans = keep_spans
+        if jsonl_path is not None:
+            Path(jsonl_path).parent.mkdir(parents=True, exist_ok=True)
+        self.spans: List[Span] = []
+        self._listeners: List[Callable[[Span], None]] = []
+        self._lock = threading.Lock()
+
+    def add_listener(self, listener: Callable[[Span], None]):
+        """Call the listener with every finished span, in the thread that finished it."""
+        self._listeners.append(listener)
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any):
+        """Time the enclosed block as a span with the given attributes."""
+        thread = threading.current_thread()
+        span = Span(
+            name=name,
+            start=time.time(),
+            end=0.0,
+            thread_id=thread.ident or 0,
+            thread_name=thread.name,
+            attributes=attributes,
+        )
+        try:
+            yield span
+        except Exception as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span.end = time.time()
+            self._finish(span)
+
+    def _finish(self, span: Span):
+        with self._lock:
+            if self.keep_spans:
+                self.spans.append(span)
+            if self.jsonl_path is not None:
+                with open(self.jsonl_path, "a") as f:
+                    f.write(json.dumps({**asdict(span), "duration": span.duration}) + "\n")
+        for listener in self._listeners:
+            listener(span)
+
+    def export_chrome_trace(self, path: str):
+        """Write all spans as complete events of the Chrome trace-event format."""
+        with self._lock:
+            spans = list(self.spans)
+        pid = os.getpid()
+        events: List[Dict[str, Any]] = [
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": pid,
+                "tid": thread_id,
+                "args": {"name": thread_name},
+            }
+            for thread_id, thread_name in {(s.thread_id, s.thread_name) for s in spans}
+        ]
+        for span in spans:
+            events.append(
+                {
+                    "name": span.name,
+                    "cat": span.attributes.get("language", "evaluation"),
+                    "ph": "X",
+                    "ts": span.start * 1e6,
+                    "dur": span.duration * 1e6,
+                    "pid": pid,
+                    "tid": span.thread_id,
+                    "args": {**span.attributes, **({"error": span.error} if span.error else {})},
+                }
+            )
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
@@ -0,0 +1,109 @@
+import json
+import subprocess
+import sys
+
+import docker
+import pytest
+
+from poly_bench_evaluation.benchmark import (
+    DEFERRED_IMPORTS,
+    InstanceProfile,
+    SimulatedDockerClient,
+    load_profiles,
+    measure_import,
+    replay_profiles,
+    run_scenario,
+    synthetic_profiles,
+)
+from poly_bench_evaluation.history import RunHistory
+from poly_bench_evaluation.parsers import JavaGenericParser
+
+
+def test_simulated_client_builds_and_streams_profiled_logs():
+    profile = InstanceProfile(
+        instance_id="Bench__1",
+        repo="google/gson",
+        language="Java",
+        build_seconds=10,
+        run_seconds=5,
+        log_kb=200,
+        tests=3,
+        build_failures=1,
+        resolved=False,
+    )
+    client = SimulatedDockerClient([profile], time_scale=0)
+    image_id = "polybench_java_bench__1"
+
+    with pytest.raises(docker.errors.ImageNotFound):
+        client.images.get(image_id)
+    with pytest.raises(docker.errors.BuildError):
+        client.images.build(path=".", tag=image_id)
+    client.images.build(path=".", tag=image_id)
+    assert client.images.get(image_id).attrs["Config"]["WorkingDir"]
+
+    container = client.containers.create(image=image_id, name="container_bench")
+    exec_id = client.api.exec_create(container.id, "/bin/bash eval.sh")["Id"]
+    log = b"".join(stdout for stdout, _ in client.api.exec_start(exec_id, stream=True))
+
+    assert len(log) > 190 * 1024
+    result = JavaGenericParser(test_content=log.decode()).parse()
+    assert result["failed_tests"] == ["bench.Test.test0"]
+    assert result["passed_tests"] == ["bench.Test.test1", "bench.Test.test2"]
+    assert client.simulated_seconds == {"docker_build": 20, "docker_run": 5}
+
+
+def test_run_scenario(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    profiles = synthetic_profiles(6, seed=1)
+
+    result = run_scenario(profiles, num_threads=2, time_scale=0, work_dir=str(tmp_path))
+
+    expected_failed = sum(p.build_failures >= 3 for p in profiles)
+    assert result.instances == 6
+    assert result.failed == expected_failed
+    assert result.resolved == sum(
+        p.resolved and not p.run_error and p.build_failures < 3 for p in profiles
+    )
+    assert result.throughput > 0
+    assert result.peak_rss_mb >= result.baseline_rss_mb > 0
+    assert len(json.load(open("result.json"))["resolved"]) == result.resolved
+
+
+def test_load_profiles_from_history(tmp_path):
+    history = RunHistory(str(tmp_path / "history.sqlite"))
+    history.record_duration("google__gson-1", "google/gson", "Java", "build", 100)
+    history.record_duration("google__gson-1", "google/gson", "Java", "run", 10)
+    history.record_duration("google__gson-1", "google/gson", "Java", "run", 20)
+
+    profiles = load_profiles(str(tmp_path / "history.sqlite"))
+
+    assert [(p.instance_id, p.build_seconds, p.run_seconds) for p in profiles] == [
+        ("google__gson-1", 100, 15)
+    ]
+    assert [p.instance_id for p in replay_profiles(profiles, 2)] == [
+        "google__gson-1__0",
+        "google__gson-1__1",
+    ]
+
+
+@pytest.mark.parametrize("module", sorted(DEFERRED_IMPORTS))
+def test_entry_points_defer_heavy_imports(module):
+    result = measure_import(module)
+
+    assert result.eager_imports == []
+    assert result.seconds > 0
+
+
+def test_grammars_are_loaded_on_first_use():
+    probe = (
+        "from poly_bench_evaluation.metrics.tree_sitter_utils import get_code_cst, load_language\n"
+        "print(load_language.cache_info().currsize)\n"
+        "get_code_cst('x = 1', 'a.py')\n"
+        "get_code_cst('y = 2', 'b.py')\n"
+        "print(load_language.cache_info().currsize)\n"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", probe], check=True, capture_output=True, text=True
+    ).stdout
+
+    assert output.split() == ["0", "1"]
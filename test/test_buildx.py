@@ -0,0 +1,104 @@
+import os
+from pathlib import Path
+
+from poly_bench_evaluation.docker_utils import BuildCache, DockerManager
+
+
+def test_build_cache_switches_to_successful_exports(tmp_path):
+    cache = BuildCache(str(tmp_path / "cache"))
+    cache_from, first = cache.begin("google/gson")
+    assert cache_from is None
+    cache.end("google/gson", cache_from, first, success=True)
+    assert cache.current("google/gson") == first
+
+    # Two concurrent builds import the same cache, each exports to its own directory
+    cache_from, second = cache.begin("google/gson")
+    other_from, third = cache.begin("google/gson")
+    assert cache_from == other_from == first
+    assert second != third
+    cache.end("google/gson", cache_from, second, success=True)
+    assert cache.current("google/gson") == second
+    # The replaced cache is kept while the other build still imports it
+    assert Path(first).exists()
+    cache.end("google/gson", other_from, third, success=False)
+    assert not Path(first).exists()
+    assert not Path(third).exists()
+    assert cache.current("google/gson") == second
+    assert cache.stats() == {"hits": 2, "misses": 1}
+
+    # The cache outlives the process
+    assert BuildCache(str(tmp_path / "cache")).current("google/gson") == second
+    assert BuildCache(str(tmp_path / "cache")).current("other/repo") is None
+
+
+FAKE_DOCKER = """#!/bin/bash
+echo "$@" >> "{calls}"
+echo "#1 [internal] load build definition from Dockerfile"
+echo "#2 DONE 0.1s" >&2
+exit {exit_code}
+"""
+
+
+def _fake_docker(tmp_path, monkeypatch, exit_code=0) -> Path:
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    calls = tmp_path / "calls.txt"
+    docker = bin_dir / "docker"
+    docker.write_text(FAKE_DOCKER.format(calls=calls, exit_code=exit_code))
+    docker.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    return calls
+
+
+def test_buildx_build_streams_logs_and_uses_the_cache(tmp_path, monkeypatch):
+    calls = _fake_docker(tmp_path, monkeypatch)
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    (repo / ".dockerignore").write_text("*\n")
+    cache = BuildCache(str(tmp_path / "cache"))
+    manager = DockerManager(
+        "polybench_java_a",
+        delete_image=False,
+        client=None,
+        build_backend="buildx",
+        build_cache=cache,
+    )
+
+    assert manager.docker_build(repo, "FROM polybench_java_base", cache_key="google/gson") == 0
+    first_cache = cache.current("google/gson")
+    assert manager.docker_build(repo, "FROM polybench_java_base", cache_key="google/gson") == 0
+
+    first, second = calls.read_text().splitlines()
+    assert first.startswith("buildx build --progress=plain")
+    assert "--tag=polybench_java_a" in first
+    assert "--cache-from" not in first
+    assert "--cache-to=type=local" in first
+    assert f"--cache-from=type=local,src={first_cache}" in second
+    # The export of the second build replaced the first one
+    assert cache.current("google/gson") != first_cache
+    assert not Path(first_cache).exists()
+    assert second.endswith(str(repo))
+    assert manager.build_logs[:2] == [
+        "#1 [internal] load build definition from Dockerfile",
+        "#2 DONE 0.1s",
+    ]
+    assert not (repo / ".dockerignore").exists()
+
+
+def test_buildx_build_failure(tmp_path, monkeypatch):
+    _fake_docker(tmp_path, monkeypatch, exit_code=1)
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    cache = BuildCache(str(tmp_path / "cache"))
+    manager = DockerManager(
+        "polybench_java_a",
+        delete_image=False,
+        client=None,
+        build_backend="buildx",
+        build_cache=cache,
+    )
+
+    assert manager.docker_build(repo, "FROM polybench_java_base", cache_key="google/gson") == 1
+    assert manager.build_logs[-1] == "Build Error: docker buildx build exited with 1"
+    assert cache.current("google/gson") is None
+    assert list((tmp_path / "cache" / "google__gson").iterdir()) == []
@@ -0,0 +1,144 @@
+import json
+import subprocess
+
+import pytest
+
+from poly_bench_evaluation.benchmark import (
+    InstanceProfile,
+    SimulatedDockerClient,
+    prepare_repos,
+    write_dataset,
+)
+from poly_bench_evaluation.docker_utils import (
+    EVALUATION_DRIVER_SCRIPT,
+    WORKTREE_RESET_COMMAND,
+    WORKTREE_SNAPSHOT_COMMAND,
+    _parse_bundle_trailer,
+)
+from poly_bench_evaluation.run_evaluation import evaluate_predictions
+
+
+def _git(repo, *args):
+    subprocess.run(["git", "-C", str(repo), *args], check=True, capture_output=True)
+
+
+def test_worktree_reset_restores_the_snapshot(tmp_path):
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    (repo / "a.txt").write_text("a\n")
+    (repo / "b.txt").write_text("b\n")
+    (repo / ".gitignore").write_text("build/\n")
+    _git(repo, "init", "-q")
+    _git(repo, "add", "-A")
+    _git(repo, "-c", "user.name=t", "-c", "user.email=t@t", "commit", "-qm", "base")
+    # Changes of the image build are part of the snapshot
+    (repo / "a.txt").write_text("a\nbuilt\n")
+    (repo / "generated.txt").write_text("g\n")
+    (repo / "build").mkdir()
+    (repo / "build" / "dependency.jar").write_text("d\n")
+    subprocess.run(["bash", "-c", WORKTREE_SNAPSHOT_COMMAND], cwd=repo, check=True)
+
+    (repo / "a.txt").write_text("candidate\n")
+    (repo / "b.txt").unlink()
+    (repo / "new.txt").write_text("n\n")
+    (repo / "build" / "out.class").write_text("o\n")
+    (repo / "build" / "classes").mkdir()
+    (repo / "build" / "classes" / "New.class").write_text("n\n")
+    subprocess.run(["bash", "-c", WORKTREE_RESET_COMMAND], cwd=repo, check=True)
+
+    assert (repo / "a.txt").read_text() == "a\nbuilt\n"
+    assert (repo / "b.txt").read_text() == "b\n"
+    assert (repo / "generated.txt").exists()
+    assert not (repo / "new.txt").exists()
+    # Ignored files of the snapshot stay warm, the build outputs of the candidate are removed
+    assert (repo / "build" / "dependency.jar").exists()
+    assert not (repo / "build" / "out.class").exists()
+    assert not (repo / "build" / "classes" / "New.class").exists()
+
+
+@pytest.mark.parametrize("code_patch_applies", [True, False])
+def test_evaluation_driver_reports_its_steps(tmp_path, code_patch_applies):
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    (repo / "src.txt").write_text("old\n")
+    (repo / "test.txt").write_text("test\n")
+    _git(repo, "init", "-q")
+    _git(repo, "add", "-A")
+    _git(repo, "-c", "user.name=t", "-c", "user.email=t@t", "commit", "-qm", "base")
+    bundle = tmp_path / "bundle"
+    bundle.mkdir()
+    (bundle / "driver.sh").write_text(EVALUATION_DRIVER_SCRIPT)
+    (bundle / "eval.sh").write_text("cat src.txt test.txt\nexit 3\n")
+    context = "old" if code_patch_applies else "missing"
+    (bundle / "patch_code.diff").write_text(
+        f"--- a/src.txt\n+++ b/src.txt\n@@ -1 +1 @@\n-{context}\n+new\n"
+    )
+    (bundle / "patch_test.diff").write_text(
+        "--- a/test.txt\n+++ b/test.txt\n@@ -1 +1 @@\n-test\n+patched test\n"
+    )
+    (bundle / "reset_files").write_text("test.txt\0")
+    (repo / "test.txt").write_text("changed by the candidate\n")
+
+    marker = "@@step@@"
+    result = subprocess.run(
+        ["/bin/bash", str(bundle / "driver.sh"), marker], cwd=repo, capture_output=True, text=True
+    )
+    stdout, steps = _parse_bundle_trailer(result.stdout, marker)
+
+    assert steps["reset_files"].exit_code == 0
+    assert steps["apply_test_patch"].exit_code == 0
+    if code_patch_applies:
+        assert result.returncode == 3
+        assert steps["apply_code_patch"].exit_code == 0
+        assert steps["run_tests"].exit_code == 3
+        assert stdout.strip() == "new\npatched test"
+    else:
+        assert result.returncode == 1
+        assert steps["apply_code_patch"].exit_code != 0
+        assert steps["apply_code_patch"].output
+        assert "run_tests" not in steps
+    assert marker not in stdout
+
+
+def test_candidates_share_a_container_and_exit_early(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    profiles = [
+        InstanceProfile("bench__1", "google/gson", "Java", 1, 1, log_kb=1, resolved=True),
+        InstanceProfile("bench__2", "google/gson", "Java", 1, 1, log_kb=1, resolved=False),
+    ]
+    write_dataset(profiles, prepare_repos(tmp_path / "repos", ["google/gson"]), tmp_path / "d.csv")
+    candidates = [
+        "diff --git a/Test.java b/Test.java\n--- a/Test.java\n+++ b/Test.java\n"
+        f"@@ -1 +1 @@\n-class Test {{}}\n+class Test {{ int x{i}; }}\n"
+        for i in range(3)
+    ]
+    with open(tmp_path / "agent.jsonl", "w") as f:
+        for profile in profiles:
+            f.write(json.dumps({"instance_id": profile.instance_id, "model_patches": candidates}))
+            f.write("\n")
+    client = SimulatedDockerClient(profiles, time_scale=0)
+
+    evaluate_predictions(
+        dataset_path=str(tmp_path / "d.csv"),
+        predictions_path=str(tmp_path / "agent.jsonl"),
+        result_path=str(tmp_path / "results"),
+        num_threads=1,
+        evaluate_gold=False,
+        repo_path=str(tmp_path / "repos"),
+        delete_image=False,
+        skip_existing=False,
+        history_path=str(tmp_path / "history.sqlite"),
+        result_cache_path=None,
+        client=client,
+        early_exit_k=3,
+    )
+
+    # One container per instance, the resolved instance stops after its first candidate
+    assert client.operations["container_create"] == 2
+    # The build context is streamed from the base repo
+    assert client.operations["context_bytes"] > 0
+    assert client.operations["docker_run"] == 4
+    report = json.load(open(tmp_path / "results" / "pass_at_k.json"))["agent"]
+    assert report["early_exit_instances"] == ["bench__1"]
+    assert report["pass@3"] == 0.5
+    assert (tmp_path / "results" / "agent__sample_1" / "bench__1_skipped.json").exists()
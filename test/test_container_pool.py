@@ -0,0 +1,152 @@
+import json
+import subprocess
+
+from poly_bench_evaluation.benchmark import (
+    InstanceProfile,
+    SimulatedDockerClient,
+    prepare_repos,
+    write_dataset,
+)
+from poly_bench_evaluation.docker_utils import (
+    WORKTREE_CHECK_COMMAND,
+    WORKTREE_RESET_COMMAND,
+    WORKTREE_SNAPSHOT_COMMAND,
+    ContainerPool,
+    DockerManager,
+)
+from poly_bench_evaluation.run_evaluation import evaluate_predictions
+
+
+def _bash(repo, command):
+    return subprocess.run(["bash", "-c", command], cwd=repo, capture_output=True).returncode
+
+
+def test_worktree_check_detects_leftovers(tmp_path):
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    (repo / "a.txt").write_text("a\n")
+    for args in (["init", "-q"], ["add", "-A"]):
+        subprocess.run(["git", "-C", str(repo), *args], check=True)
+    subprocess.run(
+        ["git", "-C", str(repo), "-c", "user.name=t", "-c", "user.email=t@t", "commit", "-qm", "x"],
+        check=True,
+    )
+    assert _bash(repo, WORKTREE_SNAPSHOT_COMMAND) == 0
+    assert _bash(repo, WORKTREE_RESET_COMMAND) == 0
+    assert _bash(repo, WORKTREE_CHECK_COMMAND) == 0
+
+    (repo / "a.txt").write_text("changed\n")
+    assert _bash(repo, WORKTREE_CHECK_COMMAND) != 0
+    assert _bash(repo, WORKTREE_RESET_COMMAND) == 0
+    (repo / "new.txt").write_text("n\n")
+    assert _bash(repo, WORKTREE_CHECK_COMMAND) != 0
+    assert _bash(repo, WORKTREE_RESET_COMMAND) == 0
+    assert _bash(repo, WORKTREE_CHECK_COMMAND) == 0
+    # An ignored build output of a run is a leftover as well
+    (repo / ".git" / "info" / "exclude").write_text("*.class\n")
+    (repo / "Out.class").write_text("o\n")
+    assert _bash(repo, WORKTREE_CHECK_COMMAND) != 0
+    assert _bash(repo, WORKTREE_RESET_COMMAND) == 0
+    assert _bash(repo, WORKTREE_CHECK_COMMAND) == 0
+
+
+def _warm_manager(client, image_id):
+    client.images.build(path=".", tag=image_id)
+    docker_manager = DockerManager(image_id=image_id, delete_image=False, client=client)
+    docker_manager.create_container()
+    assert docker_manager.snapshot_worktree()
+    return docker_manager
+
+
+def test_create_container_keeps_existing_container():
+    client = SimulatedDockerClient([], time_scale=0)
+    first = _warm_manager(client, "polybench_java_a")
+    second = DockerManager("polybench_java_a", delete_image=False, client=client)
+    second.create_container()
+
+    # The container of the other run is neither removed nor replaced
+    assert client.operations["container_remove"] == 0
+    assert first.container_name == "container_polybench_java_a"
+    assert client.containers.get(first.container_name) is first.container
+    assert second.container_name.startswith("container_polybench_java_a_")
+    assert client.containers.get(second.container_name) is second.container
+
+
+def test_pool_limits_and_eviction():
+    client = SimulatedDockerClient([], time_scale=0)
+    pool = ContainerPool(max_containers=1, verify=True)
+    first = _warm_manager(client, "polybench_java_a")
+    second = _warm_manager(client, "polybench_java_b")
+
+    assert pool.release(first)
+    assert first.container is None
+    # The least recently released container makes room for the new one
+    assert pool.release(second)
+    assert client.operations["container_remove"] == 1
+
+    assert not pool.acquire(DockerManager("polybench_java_a", delete_image=False, client=client))
+    reused = DockerManager("polybench_java_b", delete_image=False, client=client)
+    assert pool.acquire(reused)
+    assert reused.container is not None and reused.has_snapshot
+
+    # Containers of another build of the image are not reused
+    reused.container.attrs["Image"] = "sha256:previous"
+    assert pool.release(reused)
+    assert not pool.acquire(DockerManager("polybench_java_b", delete_image=False, client=client))
+    assert pool.stats() == {"warm_containers": 0, "hits": 1, "misses": 2, "evictions": 2}
+
+    # Neither containers without snapshot nor containers of deleted images are kept
+    fresh = DockerManager("polybench_java_a", delete_image=False, client=client)
+    fresh.create_container()
+    assert not pool.release(fresh)
+    deleted = _warm_manager(client, "polybench_java_c")
+    deleted.delete_image = True
+    assert not pool.release(deleted)
+
+    idle_pool = ContainerPool(max_containers=4, idle_seconds=0)
+    assert idle_pool.release(_warm_manager(client, "polybench_java_d"))
+    assert idle_pool.evict_idle() == 1
+    assert len(idle_pool) == 0
+
+
+def test_evaluations_reuse_warm_containers(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    profiles = [
+        InstanceProfile("bench__1", "google/gson", "Java", 1, 1, log_kb=1, resolved=True),
+        InstanceProfile("bench__2", "google/gson", "Java", 1, 1, log_kb=1, resolved=False),
+    ]
+    write_dataset(profiles, prepare_repos(tmp_path / "repos", ["google/gson"]), tmp_path / "d.csv")
+    client = SimulatedDockerClient(profiles, time_scale=0)
+    pool = ContainerPool(max_containers=4)
+
+    for model in ("model_a", "model_b"):
+        with open(tmp_path / f"{model}.jsonl", "w") as f:
+            for i, profile in enumerate(profiles):
+                patch = (
+                    "diff --git a/Test.java b/Test.java\n--- a/Test.java\n+++ b/Test.java\n"
+                    f"@@ -1 +1 @@\n-class Test {{}}\n+class Test {{ int {model}; }}\n"
+                )
+                f.write(json.dumps({"instance_id": profile.instance_id, "model_patch": patch}))
+                f.write("\n")
+        evaluate_predictions(
+            dataset_path=str(tmp_path / "d.csv"),
+            predictions_path=str(tmp_path / f"{model}.jsonl"),
+            result_path=str(tmp_path / model),
+            num_threads=2,
+            evaluate_gold=False,
+            repo_path=str(tmp_path / "repos"),
+            delete_image=False,
+            skip_existing=False,
+            history_path=str(tmp_path / "history.sqlite"),
+            result_cache_path=None,
+            client=client,
+            container_pool=pool,
+        )
+
+    # The second run resets the containers of the first instead of creating new ones
+    assert client.operations["container_create"] == 2
+    assert client.operations["docker_run"] == 4
+    assert pool.stats()["hits"] == 2
+    assert json.load(open(tmp_path / "model_b" / "bench__1_result.json"))["resolved"]
+    pool.close()
+    assert client.operations["container_remove"] == 2
@@ -0,0 +1,72 @@
+import json
+
+import pandas as pd
+
+from poly_bench_evaluation.dedup import (
+    SUBMITTER_COLUMN,
+    group_predictions,
+    load_predictions,
+    normalize_patch,
+    patch_hash,
+    sample_family,
+)
+
+PATCH = "diff --git a/x.py b/x.py\nindex 1234..5678 100644\n--- a/x.py\n+++ b/x.py\n+fix\n"
+
+
+def test_whitespace_equivalent_patches_share_a_hash():
+    crlf = PATCH.replace("\n", "\r\n").replace("+fix", "+fix  ")
+    other_index = PATCH.replace("1234..5678", "abcd..ef01")
+    assert patch_hash(crlf) == patch_hash(PATCH)
+    assert patch_hash(other_index) == patch_hash(PATCH)
+    assert patch_hash(PATCH.replace("+fix", "+other")) != patch_hash(PATCH)
+    assert normalize_patch("\n\n") == ""
+
+
+def test_load_predictions_names_submitters_after_files(tmp_path):
+    for name, patch in [("model-a", PATCH), ("model-b", PATCH)]:
+        with open(tmp_path / f"{name}.jsonl", "w") as f:
+            f.write(json.dumps({"instance_id": "i-1", "model_patch": patch}) + "\n")
+
+    predictions = load_predictions(
+        [str(tmp_path / "model-a.jsonl"), str(tmp_path / "model-b.jsonl")]
+    )
+    assert list(predictions[SUBMITTER_COLUMN]) == ["model-a", "model-b"]
+
+
+def test_load_predictions_splits_candidates_into_samples(tmp_path):
+    with open(tmp_path / "agent.jsonl", "w") as f:
+        f.write(json.dumps({"instance_id": "i-1", "model_patches": [PATCH, "", PATCH]}) + "\n")
+        f.write(json.dumps({"instance_id": "i-2", "model_patch": PATCH}) + "\n")
+
+    predictions = load_predictions([str(tmp_path / "agent.jsonl")])
+
+    assert list(predictions[SUBMITTER_COLUMN]) == [
+        "agent__sample_0",
+        "agent__sample_1",
+        "agent__sample_2",
+        "agent__sample_0",
+    ]
+    assert list(predictions["model_patch"]) == [PATCH, "", PATCH, PATCH]
+    assert sample_family("org__agent__sample_12") == "org__agent"
+    assert sample_family("agent") is None
+
+
+def test_group_predictions():
+    predictions = pd.DataFrame(
+        {
+            "instance_id": ["i-1", "i-1", "i-1", "i-2"],
+            "model_patch": [PATCH, PATCH + "\n", PATCH.replace("+fix", "+other"), PATCH],
+            SUBMITTER_COLUMN: ["a", "b", "c", "a"],
+        }
+    )
+    groups, stats = group_predictions(predictions, ["i-1", "i-2"])
+
+    assert [group.submitters for group in groups["i-1"]] == [["a", "b"], ["c"]]
+    assert groups["i-1"][0].model_patch == PATCH
+    # b and c have no prediction for i-2 and get an empty patch
+    assert [group.submitters for group in groups["i-2"]] == [["a"], ["b", "c"]]
+    assert groups["i-2"][1].model_patch == ""
+    assert stats.predictions == 4
+    assert stats.distinct_patches == 3
+    assert stats.ratio == 0.25
@@ -0,0 +1,86 @@
+import json
+import time
+
+import pytest
+
+from poly_bench_evaluation.distributed import WorkerOptions, WorkQueue
+from poly_bench_evaluation.polybench_data import PolyBenchInstance
+
+
+def _instance(instance_id):
+    return PolyBenchInstance(
+        instance_id=instance_id,
+        model_patch="mock_model_patch",
+        patch="mock_gold_patch",
+        test_patch="mock_test_patch",
+        repo="google/gson",
+        base_commit="abc123",
+        language="Java",
+        dockerfile="FROM polybench_java_base",
+        f2p=["test1"],
+        p2p=["test2"],
+        test_command="mvn test",
+        modified_nodes=[],
+    )
+
+
+@pytest.fixture
+def work_queue(tmp_path):
+    queue = WorkQueue(str(tmp_path / "queue.sqlite"), lease_seconds=60, max_attempts=2)
+    queue.enqueue([_instance("a"), _instance("b")])
+    return queue
+
+
+def test_enqueue_is_idempotent(work_queue):
+    assert work_queue.enqueue([_instance("a"), _instance("c")]) == 1
+    assert work_queue.counts() == {"pending": 3}
+
+
+def test_enqueue_rejects_changed_instances(work_queue):
+    changed = _instance("b").model_copy(update={"model_patch": "another patch"})
+    with pytest.raises(ValueError, match="\\['b'\\]"):
+        work_queue.enqueue([_instance("c"), changed])
+    # Nothing of the rejected batch is queued
+    assert work_queue.counts() == {"pending": 2}
+
+
+def test_lease_and_complete(work_queue, tmp_path):
+    instance = work_queue.lease("worker-1")
+    assert instance.instance_id == "a"
+    assert instance.f2p == ["test1"]
+    assert work_queue.renew("a", "worker-1")
+    assert not work_queue.renew("a", "worker-2")
+
+    work_queue.complete("a", "worker-1", result=json.dumps({"instance_id": "a"}), metrics=None)
+    assert work_queue.counts() == {"done": 1, "pending": 1}
+
+    failed = work_queue.write_results(str(tmp_path / "results"))
+    assert failed == []
+    assert (tmp_path / "results" / "a_result.json").exists()
+    assert not (tmp_path / "results" / "a_metrics.json").exists()
+
+
+def test_failed_instance_is_retried_then_marked_failed(work_queue):
+    assert work_queue.lease("worker-1").instance_id == "a"
+    work_queue.fail("a", "worker-1", error="build failed")
+    assert work_queue.counts() == {"pending": 2}
+
+    assert work_queue.lease("worker-1").instance_id == "a"
+    work_queue.fail("a", "worker-1", error="build failed")
+    assert work_queue.counts() == {"failed": 1, "pending": 1}
+
+
+def test_expired_lease_is_reassigned(tmp_path):
+    queue = WorkQueue(str(tmp_path / "queue.sqlite"), lease_seconds=0, max_attempts=3)
+    queue.enqueue([_instance("a")])
+
+    assert queue.lease("dead-worker").instance_id == "a"
+    time.sleep(0.01)
+    assert queue.lease("worker-2").instance_id == "a"
+    assert not queue.is_drained()
+
+
+def test_options_roundtrip(work_queue):
+    options = WorkerOptions(evaluate_gold=True, repo_path="~/repos", delete_image=True)
+    work_queue.set_options(options)
+    assert work_queue.get_options() == options
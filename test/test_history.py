@@ -0,0 +1,86 @@
+from poly_bench_evaluation.constants import (
+    DEFAULT_TIMEOUT,
+    JAVA_TIMEOUT,
+    LANGUAGE_DEFAULT_DURATIONS,
+    RUN_TIMEOUT_CEILING_SECONDS,
+)
+from poly_bench_evaluation.history import GoldBaseline, RunHistory
+
+
+def test_expected_duration_fallbacks(tmp_path):
+    history = RunHistory(str(tmp_path / "history.sqlite"))
+    history.record_duration("gson-1", "google/gson", "Java", "build", 100.0)
+    history.record_duration("gson-1", "google/gson", "Java", "build", 200.0)
+    history.record_duration("gson-2", "google/gson", "Java", "build", 600.0)
+
+    estimates = history.estimates()
+
+    # Instance history first
+    assert estimates.expected_duration("gson-1", "google/gson", "Java", "build") == 150.0
+    # Then the repo history
+    assert estimates.expected_duration("gson-3", "google/gson", "Java", "build") == 300.0
+    # Then the language default
+    assert (
+        estimates.expected_duration("trino-1", "trinodb/trino", "Java", "run")
+        == LANGUAGE_DEFAULT_DURATIONS["Java"][1]
+    )
+
+
+def test_expected_cost_sums_build_and_run(tmp_path):
+    history = RunHistory(str(tmp_path / "history.sqlite"))
+    history.record_duration("a", "yt-dlp/yt-dlp", "Python", "build", 10.0)
+    history.record_duration("a", "yt-dlp/yt-dlp", "Python", "run", 5.0)
+
+    assert history.estimates().expected_cost("a", "yt-dlp/yt-dlp", "Python") == 15.0
+
+
+def test_gold_baselines(tmp_path):
+    history = RunHistory(str(tmp_path / "history.sqlite"))
+    assert history.gold_baseline("gson-1") is None
+
+    history.record_gold_baseline(
+        GoldBaseline("gson-1", "key", False, ["t1"], ["t2"], run_seconds=12.0, image_digest="sha")
+    )
+    history.record_gold_baseline(GoldBaseline("gson-1", "key", True, ["t1", "t2"], []))
+
+    baseline = history.gold_baseline("gson-1")
+    assert baseline is not None
+    assert baseline.resolved
+    assert baseline.passed_tests == ["t1", "t2"]
+    assert set(history.estimates().gold_baselines) == {"gson-1"}
+
+
+def test_run_timeout_learned_from_run_history(tmp_path):
+    history = RunHistory(str(tmp_path / "history.sqlite"))
+    for i, seconds in enumerate([300.0, 400.0, 500.0]):
+        history.record_duration(f"ytdlp-{i}", "yt-dlp/yt-dlp", "Python", "run", seconds)
+        history.record_gold_baseline(
+            GoldBaseline(f"ytdlp-{i}", "key", True, [], [], run_seconds=seconds)
+        )
+    for _ in range(3):
+        history.record_duration("ytdlp-9", "yt-dlp/yt-dlp", "Python", "run", 600.0)
+        history.record_duration("trino-0", "trinodb/trino", "Java", "run", 3000.0)
+    history.record_duration("black-0", "psf/black", "Python", "run", 10.0)
+    history.record_gold_baseline(GoldBaseline("black-0", "key", True, [], [], run_seconds=10.0))
+
+    estimates = history.estimates()
+    # The runs of the instance, then the gold runs of the repo, once there are enough of them
+    assert estimates.run_timeout("ytdlp-9", "yt-dlp/yt-dlp", "Python") == 600.0 * 1.5 + 60
+    assert estimates.run_timeout("ytdlp-0", "yt-dlp/yt-dlp", "Python") == 500.0 * 1.5 + 60
+    assert estimates.run_timeout("trino-0", "trinodb/trino", "Java") == RUN_TIMEOUT_CEILING_SECONDS
+    # A single fast gold run keeps the language default
+    assert estimates.run_timeout("black-0", "psf/black", "Python") == DEFAULT_TIMEOUT
+    assert estimates.run_timeout("trino-1", "trinodb/trino", "Java") == JAVA_TIMEOUT
+
+
+def test_run_timeout_never_below_default(tmp_path):
+    history = RunHistory(str(tmp_path / "history.sqlite"))
+    for i in range(3):
+        history.record_duration(f"gson-{i}", "google/gson", "Java", "run", 20.0)
+        history.record_gold_baseline(
+            GoldBaseline(f"gson-{i}", "key", True, [], [], run_seconds=20.0)
+        )
+
+    estimates = history.estimates()
+    assert estimates.run_timeout("gson-0", "google/gson", "Java") == JAVA_TIMEOUT
+    assert estimates.run_timeout("gson-9", "google/gson", "Java") == JAVA_TIMEOUT
@@ -0,0 +1,57 @@
+import time
+from unittest.mock import Mock
+
+import docker
+import pytest
+
+from poly_bench_evaluation.journal import RunJournal, cleanup_orphaned_containers
+
+
+@pytest.fixture
+def journal(tmp_path):
+    return RunJournal(str(tmp_path / "journal.sqlite"))
+
+
+def test_record_and_last_stage(journal):
+    started_at = time.time()
+    journal.record("a", "cloned", started_at, artifact="/tmp/repo")
+    journal.record("a", "built", started_at, artifact="polybench_java_a")
+
+    assert journal.last_stage("a") == "built"
+    assert journal.last_stage("b") is None
+    assert journal.last_transition("a", "cloned")["artifact"] == "/tmp/repo"
+    assert set(journal.stage_durations("a")) == {"cloned", "built"}
+
+
+def test_unknown_stage_is_rejected(journal):
+    with pytest.raises(ValueError):
+        journal.record("a", "deployed", time.time())
+
+
+def test_completed_instances_are_per_run_kind(tmp_path):
+    db_path = str(tmp_path / "journal.sqlite")
+    evaluation_journal = RunJournal(db_path)
+    metrics_journal = RunJournal(db_path, run_kind="metrics")
+
+    evaluation_journal.record("a", "scored", time.time())
+    evaluation_journal.record("b", "parsed", time.time(), zero_metrics=True)
+
+    assert evaluation_journal.completed_instances() == {"a"}
+    assert evaluation_journal.last_transition("b", "parsed")["detail"] == {"zero_metrics": True}
+    assert metrics_journal.is_empty()
+
+
+def test_cleanup_orphaned_containers(journal):
+    journal.record("a", "container_created", time.time(), artifact="container_a")
+    journal.record("b", "container_created", time.time(), artifact="container_b")
+    journal.record("b", "patched", time.time())
+    journal.record("b", "run", time.time())
+    journal.record("c", "container_created", time.time(), artifact="container_c")
+
+    client = Mock()
+    client.containers.get.side_effect = lambda name: (
+        (_ for _ in ()).throw(docker.errors.NotFound("gone")) if name == "container_c" else Mock()
+    )
+
+    assert sorted(journal.orphaned_containers()) == ["container_a", "container_c"]
+    assert cleanup_orphaned_containers(journal, client) == 1
@@ -0,0 +1,55 @@
+from poly_bench_evaluation.docker_utils import _BundleTrailerFilter, _parse_bundle_trailer
+from poly_bench_evaluation.log_capture import LogCapture
+
+
+def test_log_capture_writes_the_run_log_format(tmp_path):
+    path = tmp_path / "a_run.log"
+    capture = LogCapture(str(path), window_bytes=8)
+    for i in range(100):
+        capture.write(f"line {i}\n".encode("utf-8"))
+    capture.write(b"warning\n", stderr=True)
+
+    assert capture.close(["Container exited with status code: 0"]) == str(path)
+    stdout = "".join(f"line {i}\n" for i in range(100))
+    assert path.read_text() == "warning\n" + stdout + "\nContainer exited with status code: 0"
+    assert capture.size == len(stdout) + len("warning\n")
+    assert capture.excerpt().startswith("line 0\nl\n... ")
+    assert capture.excerpt().endswith("warning\n")
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["a_run.log"]
+
+    # Late writes of a timed out exec don't change the log
+    capture.write(b"late\n")
+    assert "late" not in path.read_text()
+
+
+def test_log_capture_without_output(tmp_path):
+    path = tmp_path / "a_run.log"
+    capture = LogCapture(str(path))
+    capture.write(b"partial output")
+    capture.close(["Container operation timed out"], keep_output=False)
+    assert path.read_text() == "Container operation timed out"
+    assert capture.excerpt() == "partial output"
+
+
+def test_bundle_trailer_is_filtered_across_chunks():
+    marker = "@@step@@"
+    stdout = (
+        "\n@@step@@ apply_code_patch 0 1.0 1.5 aGk=\n"
+        "\n@@step@@ apply_test_patch 1 2,0 2,5 \n"
+        "test output @@step@@ not a report\n"
+        "last line\n@@step@@ run_tests 3 3.0 5.0 \n"
+    )
+    chunks = []
+    trailer = _BundleTrailerFilter(marker, chunks.append)
+    for i in range(len(stdout)):
+        trailer.feed(stdout[i : i + 1].encode("utf-8"))
+    trailer.close()
+
+    output, steps = _parse_bundle_trailer(stdout, marker)
+    assert b"".join(chunks).decode("utf-8") == output
+    assert output == "test output @@step@@ not a report\nlast line"
+    assert trailer.steps == steps
+    assert steps["apply_code_patch"].output == "hi"
+    assert steps["apply_test_patch"].exit_code == 1
+    assert steps["apply_test_patch"].seconds == 0.5
+    assert steps["run_tests"].exit_code == 3
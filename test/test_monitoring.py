@@ -0,0 +1,39 @@
+import urllib.request
+
+from poly_bench_evaluation.monitoring import EvaluationMonitor
+from poly_bench_evaluation.pipeline import Stage, StagedPipeline
+from poly_bench_evaluation.polybench_data import PolyBenchOutput
+from poly_bench_evaluation.tracing import Tracer
+
+
+def test_metrics_are_rendered_and_served():
+    pipeline = StagedPipeline(stages=[Stage(name="build", func=lambda item: None)])
+    pipeline.run(range(3))
+    monitor = EvaluationMonitor(pipeline=pipeline)
+    tracer = Tracer(keep_spans=False)
+    tracer.add_listener(monitor.observe_span)
+
+    with tracer.span("docker_run", language="Java"):
+        pass
+    try:
+        with tracer.span("create_container", language="Java"):
+            raise RuntimeError("daemon unavailable")
+    except RuntimeError:
+        pass
+    monitor.observe_output(PolyBenchOutput("a", True, True, True, True, True, True, [], []))
+    monitor.observe_output(PolyBenchOutput("b", True, True, True, False, True, False, [], []))
+
+    monitor.serve(port=0)
+    try:
+        port = monitor._server.server_port
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as response:
+            body = response.read().decode()
+    finally:
+        monitor.shutdown()
+
+    assert 'polybench_stage_completed_total{stage="build"} 3' in body
+    assert 'polybench_queue_depth{stage="build"} 0' in body
+    assert 'polybench_docker_errors_total{operation="create_container"} 1' in body
+    assert 'polybench_run_duration_seconds_bucket{language="Java",le="10"} 1' in body
+    assert 'polybench_run_duration_seconds_count{language="Java"} 1' in body
+    assert "polybench_resolved_rate 0.5" in body
@@ -0,0 +1,35 @@
+import pytest
+
+from poly_bench_evaluation.benchmark import InstanceProfile, surefire_log
+from poly_bench_evaluation.offload import (
+    create_cpu_pool,
+    default_cpu_workers,
+    parse_test_log,
+    parse_test_log_file,
+)
+
+
+def test_parse_test_log_file_in_pool(tmp_path):
+    profile = InstanceProfile("a", "google/gson", "Java", 1, 1, log_kb=64, resolved=False)
+    log = surefire_log(profile).decode("utf-8")
+    log_path = tmp_path / "a_run.log"
+    log_path.write_text(log)
+
+    pool = create_cpu_pool(2)
+    try:
+        result = pool.submit(parse_test_log_file, "JavaGenericParser", str(log_path)).result()
+    finally:
+        pool.shutdown()
+    assert result == parse_test_log("JavaGenericParser", log)
+    assert result["failed_tests"] == ["bench.Test.test0"]
+
+
+def test_parse_test_log_unknown_parser():
+    with pytest.raises(ValueError, match="NoSuchParser"):
+        parse_test_log("NoSuchParser", "")
+
+
+def test_cpu_pool_defaults():
+    assert create_cpu_pool(0) is None
+    assert default_cpu_workers(node_retrieval_metrics=False) == 0
+    assert default_cpu_workers(node_retrieval_metrics=True) >= 1
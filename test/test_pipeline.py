@@ -0,0 +1,92 @@
+import threading
+import time
+
+import pytest
+
+from poly_bench_evaluation.pipeline import Stage, StagedPipeline
+
+
+def test_items_visit_every_stage_in_order():
+    visits = []
+    lock = threading.Lock()
+
+    def make_stage(name):
+        def func(item):
+            with lock:
+                visits.append((item, name))
+
+        return Stage(name=name, func=func, num_workers=2)
+
+    pipeline = StagedPipeline(stages=[make_stage("a"), make_stage("b"), make_stage("c")])
+    pipeline.run(range(10))
+
+    assert pipeline.completed == 10
+    for item in range(10):
+        assert [name for i, name in visits if i == item] == ["a", "b", "c"]
+
+
+def test_stages_overlap():
+    # With one worker per stage, the second stage of item 0 should run while
+    # the first stage of item 1 is running.
+    running = set()
+    overlapped = threading.Event()
+    lock = threading.Lock()
+
+    def make_stage(name):
+        def func(item):
+            with lock:
+                running.add(name)
+                if len(running) > 1:
+                    overlapped.set()
+            time.sleep(0.05)
+            with lock:
+                running.discard(name)
+
+        return Stage(name=name, func=func, num_workers=1)
+
+    pipeline = StagedPipeline(stages=[make_stage("build"), make_stage("run")])
+    pipeline.run(range(4))
+
+    assert overlapped.is_set()
+    assert pipeline.completed == 4
+
+
+def test_failed_item_is_dropped_and_reported():
+    errors = []
+
+    def fail_on_two(item):
+        if item == 2:
+            raise ValueError("boom")
+
+    pipeline = StagedPipeline(
+        stages=[Stage(name="a", func=fail_on_two), Stage(name="b", func=lambda item: None)],
+        on_error=lambda item, e: errors.append(item),
+    )
+    pipeline.run(range(5))
+
+    assert pipeline.completed == 4
+    assert errors == [2]
+    assert [item for item, _ in pipeline.errors] == [2]
+
+
+def test_routed_items_stay_on_one_worker():
+    workers = {}
+    lock = threading.Lock()
+
+    def func(item):
+        with lock:
+            workers.setdefault(item % 3, set()).add(threading.current_thread().name)
+        time.sleep(0.01)
+
+    pipeline = StagedPipeline(
+        stages=[Stage(name="checkout", func=func, num_workers=3, route=lambda item: item % 3)]
+    )
+    pipeline.run(range(12))
+
+    assert pipeline.completed == 12
+    assert all(len(names) == 1 for names in workers.values())
+
+
+def test_pipeline_needs_stages():
+    with pytest.raises(ValueError):
+        StagedPipeline(stages=[])
@@ -0,0 +1,133 @@
+from unittest.mock import Mock
+
+import pandas as pd
+import pytest
+
+from poly_bench_evaluation.history import DurationEstimates
+from poly_bench_evaluation.planner import IMAGES_HELD_PER_THREAD, plan_evaluation
+from poly_bench_evaluation.run_evaluation import EVALUATION_STAGES, evaluate_predictions
+
+
+def _image(tag, size_gb):
+    image = Mock()
+    image.tags = [f"{tag}:latest"]
+    image.attrs = {"Size": size_gb * 1024**3}
+    return image
+
+
+@pytest.fixture
+def dataset():
+    return pd.DataFrame(
+        {
+            "instance_id": ["gson-1", "gson-2", "gson-3", "svelte-1"],
+            "repo": ["google/gson", "google/gson", "google/gson", "sveltejs/svelte"],
+            "language": ["Java", "Java", "Java", "JavaScript"],
+            "model_patch": ["fix", "fix", "", "fix"],
+            "patch": ["gold"] * 4,
+        }
+    )
+
+
+def test_plan_evaluation(dataset):
+    client = Mock()
+    client.images.list.return_value = [
+        _image("polybench_java_gson-1", 4.0),
+        _image("polybench_java_base", 1.0),
+    ]
+    client.info.return_value = {"DockerRootDir": "/"}
+    estimates = DurationEstimates(
+        instance_durations={("gson-1", "run"): [100.0], ("gson-2", "build"): [500.0]},
+        repo_durations={("google/gson", "run"): [200.0]},
+    )
+
+    plan = plan_evaluation(
+        dataset,
+        estimates=estimates,
+        client=client,
+        done_instances={"gson-2"},
+        skipped=["gson-0"],
+        build_threads=1,
+        run_threads=1,
+        delete_image=True,
+    )
+
+    by_id = {instance.instance_id: instance for instance in plan.instances}
+    assert [instance.instance_id for instance in plan.to_build] == ["gson-2", "svelte-1"]
+    assert [instance.instance_id for instance in plan.existing_images] == ["gson-1"]
+    assert not by_id["gson-3"].needs_run
+    assert by_id["gson-2"].done
+    # Images of a repo without a local image are as large as the existing images of the repo
+    assert by_id["gson-2"].image_gb == 4.0
+    assert by_id["gson-1"].build_seconds == 0.0
+    assert plan.missing_base_images == ["JavaScript"]
+    assert plan.disk_peak_gb(delete_image=False) == 2.0 + 4.0 + 2.0
+    # Runs: gson-1 0-100, gson-2 built at 500 and run until 700, svelte-1 built at 1100
+    assert plan.wall_seconds == 1100.0 + 200.0
+    assert plan.free_disk_gb is not None
+
+    report = plan.render()
+    assert "Already done: 2 (1 skipped with --skip-existing)" in report
+    assert "Images to build: 2, existing images: 1" in report
+
+
+def test_plan_disk_peak_with_delete_image_is_bounded_by_threads():
+    dataset = pd.DataFrame(
+        {
+            "instance_id": [f"gson-{i}" for i in range(20)],
+            "repo": ["google/gson"] * 20,
+            "language": ["Java"] * 20,
+            "model_patch": ["fix"] * 20,
+            "patch": ["gold"] * 20,
+        }
+    )
+
+    plan = plan_evaluation(
+        dataset,
+        estimates=DurationEstimates(),
+        client=None,
+        done_instances=set(),
+        skipped=[],
+        build_threads=2,
+        run_threads=2,
+        delete_image=True,
+    )
+
+    assert len(plan.to_build) == 20
+    assert plan.disk_peak_gb(delete_image=True) == pytest.approx(
+        2.5 + IMAGES_HELD_PER_THREAD * 2 * 2.5
+    )
+    assert plan.disk_peak_gb(delete_image=False) == pytest.approx(2.5 + 20 * 2.5)
+
+
+def test_plan_of_evaluate_predictions_writes_nothing(dataset, tmp_path):
+    dataset_path = tmp_path / "dataset.csv"
+    dataset.to_csv(dataset_path, index=False)
+    predictions_path = tmp_path / "predictions.jsonl"
+    dataset[["instance_id", "model_patch"]].to_json(predictions_path, orient="records", lines=True)
+    client = Mock()
+    client.images.list.return_value = []
+    client.info.return_value = {"DockerRootDir": "/"}
+    result_path = tmp_path / "results"
+
+    plan = evaluate_predictions(
+        dataset_path=str(dataset_path),
+        predictions_path=str(predictions_path),
+        result_path=str(result_path),
+        num_threads=2,
+        evaluate_gold=False,
+        repo_path=str(tmp_path / "repos"),
+        delete_image=True,
+        skip_existing=False,
+        # The stage threads as the command line passes them without any --<stage>-threads
+        stage_threads={stage_name: None for stage_name, _ in EVALUATION_STAGES},
+        history_path=str(tmp_path / "history.sqlite"),
+        result_cache_path=None,
+        client=client,
+        plan=True,
+        num_shards=2,
+    )
+
+    assert (plan.build_threads, plan.run_threads) == (2, 2)
+    assert plan.disk_peak_gb(delete_image=True) > 0
+    assert plan.wall_seconds > 0
+    assert not result_path.exists()
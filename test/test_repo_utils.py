@@ -1,5 +1,12 @@
+import os
+import subprocess
+import tarfile
 from pathlib import Path
+from typing import Tuple
 
+import pytest
+
+from poly_bench_evaluation.docker_utils import dockerfile_context_paths
 from poly_bench_evaluation.repo_utils import RepoManager
 
 
@@ -13,3 +20,81 @@ def test_init():
 
     # Clean up
     repo_manager._cleanup()
+
+
+def _git(repo, *args) -> str:
+    return subprocess.run(
+        ["git", "-C", str(repo), "-c", "user.name=t", "-c", "user.email=t@t", *args],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout.strip()
+
+
+def _base_repo(tmp_path) -> Tuple[Path, str]:
+    repo = tmp_path / "repos" / "repo"
+    (repo / "sub").mkdir(parents=True)
+    (repo / "a.txt").write_text("base\n")
+    (repo / "run.sh").write_text("echo run\n")
+    (repo / "run.sh").chmod(0o755)
+    (repo / "sub" / "b.txt").write_text("b\n")
+    (repo / "link").symlink_to("a.txt")
+    (repo / ".dockerignore").write_text("*\n")
+    (repo / "Dockerfile").write_text("FROM scratch\n")
+    _git(repo, "init", "-q")
+    _git(repo, "add", "-A")
+    _git(repo, "commit", "-qm", "base")
+    commit = _git(repo, "rev-parse", "HEAD")
+    (repo / "a.txt").write_text("later\n")
+    _git(repo, "commit", "-qam", "later")
+    return repo, commit
+
+
+def test_build_context_is_streamed_from_the_commit(tmp_path):
+    _, commit = _base_repo(tmp_path)
+    repo_manager = RepoManager("org/repo", str(tmp_path / "repos"))
+    repo_manager.clone_repo(working_tree=False)
+    repo_manager.prepare_commit(commit[:10])
+    assert repo_manager.commit == commit
+    assert repo_manager.tmp_repo_dir is None
+
+    with repo_manager.open_build_context("FROM polybench_java_base\nCOPY . .\n") as context:
+        with tarfile.open(fileobj=context, mode="r|") as tar:
+            tar.extractall(tmp_path / "context")
+    context_dir = tmp_path / "context"
+
+    assert (context_dir / "a.txt").read_text() == "base\n"
+    assert os.access(context_dir / "run.sh", os.X_OK)
+    assert os.readlink(context_dir / "link") == "a.txt"
+    assert (context_dir / "Dockerfile").read_text() == "FROM polybench_java_base\nCOPY . .\n"
+    assert not (context_dir / ".dockerignore").exists()
+    # The .git of the context is checked out at the commit, with a matching index
+    assert _git(context_dir, "rev-parse", "HEAD") == commit
+    assert _git(context_dir, "status", "--porcelain", "--", ":!Dockerfile", ":!.dockerignore") == ""
+
+
+def test_build_context_with_paths(tmp_path):
+    _, commit = _base_repo(tmp_path)
+    repo_manager = RepoManager("org/repo", str(tmp_path / "repos"))
+    repo_manager.clone_repo(working_tree=False)
+    repo_manager.prepare_commit(commit)
+
+    with repo_manager.open_build_context("FROM scratch\n", paths=["sub"]) as context:
+        with tarfile.open(fileobj=context, mode="r|") as tar:
+            names = [member.name for member in tar]
+    assert names == ["sub/b.txt", "Dockerfile"]
+
+    with pytest.raises(ValueError, match="not found"):
+        repo_manager.prepare_commit("0" * 40)
+
+
+def test_dockerfile_context_paths():
+    assert dockerfile_context_paths("FROM x\nRUN make\n") == []
+    assert dockerfile_context_paths(
+        "FROM x\nCOPY --chown=1 package.json ./src/ /app/\n"
+        'ADD ["setup.py", "/app/"]\nADD https://example.com/a.tgz /tmp/\n'
+        "COPY --from=build /out /out\nCOPY \\\n    .git /app/.git\n"
+    ) == [".git", "package.json", "setup.py", "src"]
+    assert dockerfile_context_paths("FROM x\nCOPY . /app\n") is None
+    assert dockerfile_context_paths("FROM x\nCOPY *.json /app/\n") is None
+    assert dockerfile_context_paths("FROM x\nCOPY ../secret /app/\n") is None
@@ -0,0 +1,89 @@
+import threading
+import time
+
+from poly_bench_evaluation.resources import (
+    ResourceAdmission,
+    ResourceWeight,
+    declared_weight,
+    read_host_capacity,
+)
+
+
+def test_read_host_capacity_cgroup_v2(tmp_path):
+    cgroup_root = tmp_path / "cgroup"
+    cgroup_root.mkdir()
+    (cgroup_root / "cpu.max").write_text("200000 100000\n")
+    (cgroup_root / "memory.max").write_text(f"{4 * 1024**3}\n")
+    proc_root = tmp_path / "proc"
+    proc_root.mkdir()
+    (proc_root / "meminfo").write_text(f"MemTotal:       {16 * 1024**2} kB\n")
+
+    capacity = read_host_capacity(
+        disk_path=str(tmp_path), cgroup_root=str(cgroup_root), proc_root=str(proc_root)
+    )
+
+    assert capacity.cpus <= 2.0
+    assert capacity.memory_gb == 4.0
+    assert capacity.disk_gb > 0
+
+
+def test_read_host_capacity_unlimited_cgroup(tmp_path):
+    cgroup_root = tmp_path / "cgroup"
+    cgroup_root.mkdir()
+    (cgroup_root / "cpu.max").write_text("max 100000\n")
+    (cgroup_root / "memory.max").write_text("max\n")
+    proc_root = tmp_path / "proc"
+    proc_root.mkdir()
+    (proc_root / "meminfo").write_text(f"MemTotal:       {16 * 1024**2} kB\n")
+
+    capacity = read_host_capacity(
+        disk_path=str(tmp_path), cgroup_root=str(cgroup_root), proc_root=str(proc_root)
+    )
+
+    assert capacity.cpus >= 1
+    assert capacity.memory_gb == 16.0
+
+
+def test_declared_weight():
+    assert (
+        declared_weight("trinodb/trino", "Java").memory_gb
+        > declared_weight("google/gson", "Java").memory_gb
+    )
+    assert declared_weight("unknown/repo", "Python") == declared_weight("other/repo", "Python")
+
+
+def test_observed_weight_replaces_declared():
+    admission = ResourceAdmission(ResourceWeight(cpus=8, memory_gb=32, disk_gb=100))
+    admission.record_observation("google/gson", cpus=0.5, memory_gb=1.0)
+
+    weight = admission.weight_for("google/gson", "Java")
+
+    assert weight.memory_gb < declared_weight("google/gson", "Java").memory_gb
+    assert weight.disk_gb == declared_weight("google/gson", "Java").disk_gb
+
+
+def test_admission_waits_for_capacity():
+    admission = ResourceAdmission(ResourceWeight(cpus=4, memory_gb=8, disk_gb=100), headroom=1.0)
+    heavy = ResourceWeight(cpus=3, memory_gb=6, disk_gb=1)
+    second_admitted = threading.Event()
+
+    def run_second():
+        with admission.admit(heavy):
+            second_admitted.set()
+
+    with admission.admit(heavy):
+        thread = threading.Thread(target=run_second)
+        thread.start()
+        time.sleep(0.1)
+        assert not second_admitted.is_set()
+
+    thread.join(timeout=5)
+    assert second_admitted.is_set()
+    assert admission.running == 0
+
+
+def test_oversized_run_is_admitted_alone():
+    admission = ResourceAdmission(ResourceWeight(cpus=2, memory_gb=4, disk_gb=10), headroom=1.0)
+
+    with admission.admit(ResourceWeight(cpus=16, memory_gb=64, disk_gb=100)):
+        assert admission.running == 1
@@ -0,0 +1,62 @@
+import pytest
+
+from poly_bench_evaluation.polybench_data import PolyBenchInstance, PolyBenchOutput
+from poly_bench_evaluation.result_cache import ResultCache, metrics_key, output_key
+
+
+@pytest.fixture
+def instance():
+    return PolyBenchInstance(
+        instance_id="gson-1",
+        model_patch="diff --git a/x b/x",
+        patch="gold",
+        test_patch="test",
+        repo="google/gson",
+        base_commit="abc123",
+        language="Java",
+        dockerfile="FROM openjdk",
+        f2p=["t1"],
+        p2p=["t2"],
+        test_command="mvn test",
+        modified_nodes=[],
+    )
+
+
+def test_keys_ignore_instance_id(instance):
+    other = instance.model_copy(update={"instance_id": "gson-1-other-model"})
+    assert output_key(instance, instance.model_patch, "Parser") == output_key(
+        other, other.model_patch, "Parser"
+    )
+    assert metrics_key(instance, False) == metrics_key(other, False)
+
+
+def test_keys_change_with_content(instance):
+    key = output_key(instance, instance.model_patch, "Parser")
+    assert key != output_key(instance, "another patch", "Parser")
+    assert key != output_key(instance, instance.model_patch, "OtherParser")
+    changed = instance.model_copy(update={"test_command": "gradle test"})
+    assert key != output_key(changed, changed.model_patch, "Parser")
+    assert metrics_key(instance, False) != metrics_key(instance, True)
+
+
+def test_keys_change_with_schema_version(instance, monkeypatch):
+    key = output_key(instance, instance.model_patch, "Parser")
+    metrics = metrics_key(instance, False)
+    monkeypatch.setattr("poly_bench_evaluation.result_cache.RESULT_SCHEMA_VERSION", 2)
+    assert key != output_key(instance, instance.model_patch, "Parser")
+    assert metrics != metrics_key(instance, False)
+
+
+def test_output_roundtrip(tmp_path, instance):
+    cache = ResultCache(str(tmp_path / "cache.sqlite"))
+    key = output_key(instance, instance.model_patch, "Parser")
+    assert cache.get_output(key, "gson-1") is None
+
+    cache.put_output(
+        key, PolyBenchOutput("gson-1", True, True, True, True, True, True, ["t1", "t2"], [])
+    )
+    output = cache.get_output(key, "gson-1-other-model")
+    assert output is not None
+    assert output.instance_id == "gson-1-other-model"
+    assert output.resolved
+    assert output.passed_tests == ["t1", "t2"]
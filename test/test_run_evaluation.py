@@ -1,10 +1,25 @@
+import json
 from pathlib import Path
 from unittest.mock import Mock, patch
 
 import pytest
 
-from poly_bench_evaluation.polybench_data import PolyBenchInstance
-from poly_bench_evaluation.run_evaluation import evaluate_instance
+from poly_bench_evaluation.docker_utils import BundleStep
+from poly_bench_evaluation.history import GoldBaseline, RunHistory
+from poly_bench_evaluation.polybench_data import (
+    PolyBenchInstance,
+    PolyBenchOutput,
+    PolyBenchRetrievalMetrics,
+)
+from poly_bench_evaluation.result_cache import ResultCache, metrics_key, output_key
+from poly_bench_evaluation.tracing import Tracer
+from poly_bench_evaluation.run_evaluation import (
+    EVALUATION_STAGES,
+    Candidate,
+    EvaluationOptions,
+    InstanceState,
+    evaluate_instance,
+)
 
 
 @pytest.fixture
@@ -162,3 +177,195 @@ def mock_docker_manager():
 #            patch_content=mock_instance.patch,
 #            patch_type="code"
 #        )
+
+
+def test_cached_result_skips_docker(
+    mock_instance, mock_docker_client, mock_docker_manager, tmp_path
+):
+    """Test that a cached result is used without any docker work"""
+    cache = ResultCache(str(tmp_path / "cache.sqlite"))
+    cache.put_output(
+        output_key(mock_instance, mock_instance.model_patch, "JavaGenericParser"),
+        PolyBenchOutput("other", True, True, True, True, True, True, ["test1"], []),
+    )
+    cache.put_metrics(
+        metrics_key(mock_instance, node_retrieval_metrics=False),
+        PolyBenchRetrievalMetrics("other", {"recall": 1.0}, None, None, None),
+    )
+    result_path = tmp_path / "results"
+
+    evaluate_instance(
+        instance=mock_instance,
+        result_path=str(result_path),
+        evaluate_gold=False,
+        repo_path=str(tmp_path),
+        delete_image=True,
+        client=mock_docker_client,
+        result_cache=cache,
+    )
+
+    assert not mock_docker_manager.create_container.called
+    result = json.loads((result_path / "test_instance_result.json").read_text())
+    assert result["instance_id"] == "test_instance"
+    assert result["resolved"]
+    metrics = json.loads((result_path / "test_instance_metrics.json").read_text())
+    assert metrics["file_retrieval_metrics"] == {"recall": 1.0}
+
+
+def test_equivalent_patches_fan_out_to_submitters(mock_instance, mock_docker_client, tmp_path):
+    """Test that one evaluated candidate stores its results for all submitters"""
+    cache = ResultCache(str(tmp_path / "cache.sqlite"))
+    cache.put_output(
+        output_key(mock_instance, mock_instance.model_patch, "JavaGenericParser"),
+        PolyBenchOutput("other", True, True, True, True, True, True, ["test1"], []),
+    )
+    cache.put_metrics(
+        metrics_key(mock_instance, node_retrieval_metrics=False),
+        PolyBenchRetrievalMetrics("other", {"recall": 1.0}, None, None, None),
+    )
+    model_a, model_b, model_c = (str(tmp_path / name) for name in ("a", "b", "c"))
+    options = EvaluationOptions(
+        result_path=str(tmp_path),
+        evaluate_gold=False,
+        repo_path=str(tmp_path),
+        delete_image=True,
+        client=mock_docker_client,
+        result_cache=cache,
+    )
+    state = InstanceState(
+        instance=mock_instance,
+        candidates=[
+            Candidate(model_patch=mock_instance.model_patch, result_paths=[model_a, model_b]),
+            Candidate(model_patch="", result_paths=[model_c]),
+        ],
+    )
+
+    for _, stage_func in EVALUATION_STAGES:
+        stage_func(state, options)
+
+    for result_dir in (model_a, model_b):
+        result = json.loads((Path(result_dir) / "test_instance_result.json").read_text())
+        assert result["resolved"]
+    result = json.loads((Path(model_c) / "test_instance_result.json").read_text())
+    assert not result["generation"]
+
+
+def test_gold_equivalent_patch_uses_gold_baseline(
+    mock_instance, mock_docker_client, mock_docker_manager, tmp_path
+):
+    """Test that a patch equal to the gold patch reuses the gold baseline"""
+    mock_instance.model_patch = mock_instance.patch + "  \n"
+    history = RunHistory(str(tmp_path / "history.sqlite"))
+    history.record_gold_baseline(
+        GoldBaseline(
+            instance_id=mock_instance.instance_id,
+            environment_key=output_key(mock_instance, mock_instance.patch, "JavaGenericParser"),
+            resolved=True,
+            passed_tests=["test1", "test2", "test3", "test4"],
+            failed_tests=[],
+        )
+    )
+    result_path = tmp_path / "results"
+
+    with patch("poly_bench_evaluation.run_evaluation.instance_level_metric_scoring") as metrics:
+        metrics.return_value = PolyBenchRetrievalMetrics("test_instance", {}, None, None, None)
+        evaluate_instance(
+            instance=mock_instance,
+            result_path=str(result_path),
+            evaluate_gold=False,
+            repo_path=str(tmp_path),
+            delete_image=True,
+            client=mock_docker_client,
+            history=history,
+        )
+
+    assert not mock_docker_manager.create_container.called
+    result = json.loads((result_path / "test_instance_result.json").read_text())
+    assert result["resolved"]
+
+
+def test_operations_are_traced(mock_instance, mock_docker_client, tmp_path):
+    """Test that every operation gets a span and a duration in the result"""
+
+    class DockerManagerMock(Mock):
+        def __del__(self):
+            pass
+
+    docker_manager = DockerManagerMock()
+    docker_manager.check_image_local.return_value = True
+    docker_manager.run_evaluation_bundle.return_value = {
+        "apply_code_patch": BundleStep(exit_code=0, seconds=0.1),
+        "reset_files": BundleStep(exit_code=0, seconds=0.1),
+        "apply_test_patch": BundleStep(exit_code=0, seconds=0.1),
+        "run_tests": BundleStep(exit_code=0, seconds=1.0),
+    }
+    docker_manager.timed_out = False
+    run_log = tmp_path / "test_instance_run.log"
+    run_log.write_text("Container exited with status code: 0")
+    docker_manager.run_log.path = str(run_log)
+    tracer = Tracer()
+
+    with (
+        patch("poly_bench_evaluation.run_evaluation.DockerManager", return_value=docker_manager),
+        patch("poly_bench_evaluation.run_evaluation.instance_level_metric_scoring") as metrics,
+    ):
+        metrics.return_value = PolyBenchRetrievalMetrics("test_instance", {}, None, None, None)
+        evaluate_instance(
+            instance=mock_instance,
+            result_path=str(tmp_path),
+            evaluate_gold=False,
+            repo_path=str(tmp_path),
+            delete_image=True,
+            client=mock_docker_client,
+            tracer=tracer,
+        )
+
+    assert [span.name for span in tracer.spans] == [
+        "create_container",
+        "docker_run",
+        "parse",
+        "instance_level_metric_scoring",
+    ]
+    assert all(span.attributes["instance_id"] == "test_instance" for span in tracer.spans)
+    result = json.loads((tmp_path / "test_instance_result.json").read_text())
+    assert set(result["durations"]) == {
+        "create_container",
+        "evaluation_bundle",
+        "apply_code_patch",
+        "reset_files",
+        "apply_test_patch",
+        "docker_run",
+        "parse",
+    }
+
+
+def test_run_without_result_is_not_stored(mock_instance, mock_docker_client, tmp_path):
+    """Test that a test run that reported no result fails instead of being scored"""
+
+    class DockerManagerMock(Mock):
+        def __del__(self):
+            pass
+
+    docker_manager = DockerManagerMock()
+    docker_manager.check_image_local.return_value = True
+    docker_manager.run_evaluation_bundle.return_value = {
+        "apply_code_patch": BundleStep(exit_code=0, seconds=0.1),
+    }
+    docker_manager.timed_out = False
+    cache = ResultCache(str(tmp_path / "cache.sqlite"))
+
+    with patch("poly_bench_evaluation.run_evaluation.DockerManager", return_value=docker_manager):
+        with pytest.raises(ValueError, match="reported no result"):
+            evaluate_instance(
+                instance=mock_instance,
+                result_path=str(tmp_path),
+                evaluate_gold=False,
+                repo_path=str(tmp_path),
+                delete_image=True,
+                client=mock_docker_client,
+                result_cache=cache,
+            )
+
+    assert not (tmp_path / "test_instance_result.json").exists()
+    key = output_key(mock_instance, mock_instance.model_patch, "JavaGenericParser")
+    assert cache.get_output(key, "test_instance") is None
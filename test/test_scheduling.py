@@ -0,0 +1,94 @@
+import pandas as pd
+import pytest
+
+from poly_bench_evaluation.history import DurationEstimates, GoldBaseline
+from poly_bench_evaluation.scheduling import (
+    AFFINITY_GROUP_COLUMN,
+    ORDER_AFFINITY,
+    ORDER_DATASET,
+    ORDER_LONGEST_FIRST,
+    ORDER_REPO_GROUPED,
+    expected_costs,
+    order_dataset,
+)
+
+
+@pytest.fixture
+def dataset():
+    return pd.DataFrame(
+        {
+            "instance_id": ["py-1", "java-1", "py-2", "java-2", "empty"],
+            "repo": ["yt-dlp/yt-dlp", "google/gson", "yt-dlp/yt-dlp", "trinodb/trino", "x/y"],
+            "language": ["Python", "Java", "Python", "Java", "Java"],
+            "model_patch": ["diff", "diff", "diff", "diff", ""],
+        }
+    )
+
+
+@pytest.fixture
+def estimates():
+    return DurationEstimates(
+        instance_durations={
+            ("py-1", "build"): [10.0],
+            ("py-2", "build"): [50.0],
+            ("java-1", "build"): [100.0],
+            ("java-2", "build"): [1000.0],
+        }
+    )
+
+
+def test_dataset_order_is_kept(dataset, estimates):
+    ordered = order_dataset(dataset, ORDER_DATASET, estimates)
+    assert list(ordered.instance_id) == list(dataset.instance_id)
+
+
+def test_longest_first(dataset, estimates):
+    ordered = order_dataset(dataset, ORDER_LONGEST_FIRST, estimates)
+    assert list(ordered.instance_id) == ["java-2", "java-1", "py-2", "py-1", "empty"]
+    assert list(ordered.columns) == list(dataset.columns)
+
+
+def test_repo_grouped(dataset, estimates):
+    ordered = order_dataset(dataset, ORDER_REPO_GROUPED, estimates)
+    assert list(ordered.instance_id) == ["java-2", "java-1", "py-2", "py-1", "empty"]
+
+    # Instances of the same repo are next to each other
+    dataset.loc[1, "repo"] = "yt-dlp/yt-dlp"
+    ordered = order_dataset(dataset, ORDER_REPO_GROUPED, estimates)
+    assert list(ordered.instance_id) == ["java-2", "java-1", "py-2", "py-1", "empty"]
+    assert list(ordered.repo[1:4]) == ["yt-dlp/yt-dlp"] * 3
+
+
+def test_affinity_groups(estimates):
+    dataset = pd.DataFrame(
+        {
+            "instance_id": ["a-3", "b-1", "a-1", "a-2"],
+            "repo": ["x/a", "x/b", "x/a", "x/a"],
+            "language": ["Python"] * 4,
+            "model_patch": ["diff"] * 4,
+            "created_at": ["2024-03", "2024-01", "2024-01", "2024-02"],
+        }
+    )
+    ordered = order_dataset(dataset, ORDER_AFFINITY, estimates, group_size=2)
+
+    groups = dict(zip(ordered.instance_id, ordered[AFFINITY_GROUP_COLUMN]))
+    # Groups follow the commit order within a repo
+    assert groups == {"a-1": "x/a#0", "a-2": "x/a#0", "a-3": "x/a#1", "b-1": "x/b#0"}
+    # Groups are interleaved so the first items of all groups come first
+    assert set(ordered.instance_id[:3]) == {"a-1", "a-3", "b-1"}
+    assert list(ordered.instance_id[3:]) == ["a-2"]
+
+
+def test_gold_equivalent_patches_cost_nothing(dataset, estimates):
+    dataset["patch"] = ["gold", "gold", "gold", "gold", "gold"]
+    dataset.loc[dataset.instance_id == "java-2", "model_patch"] = "gold\n"
+    estimates.gold_baselines["java-2"] = GoldBaseline("java-2", "key", True, [], [])
+
+    costs = expected_costs(dataset, estimates)
+    assert costs[dataset.instance_id == "java-2"].item() == 0.0
+    assert costs[dataset.instance_id == "java-1"].item() > 0.0
+
+
+def test_unknown_policy(dataset, estimates):
+    with pytest.raises(ValueError):
+        order_dataset(dataset, "random", estimates)
@@ -8,7 +8,9 @@ from poly_bench_evaluation.polybench_data import PolyBenchOutput, PolyBenchRetri
 from poly_bench_evaluation.scoring import (
     _get_all_instance_results,
     aggregate_logs,
+    aggregate_pass_at_k,
     instance_level_scoring,
+    pass_at_k,
     store_instance_level_output,
 )
 
@@ -219,3 +221,29 @@ def test_store_instance_level_output_type_error():
     with tempfile.TemporaryDirectory() as temp_dir:
         with pytest.raises(TypeError):
             store_instance_level_output({"invalid": "type"}, temp_dir)
+
+
+def test_pass_at_k():
+    assert pass_at_k(n=5, c=0, k=3) == 0.0
+    assert pass_at_k(n=5, c=3, k=3) == 1.0
+    assert pass_at_k(n=4, c=1, k=1) == 0.25
+    assert pass_at_k(n=4, c=1, k=2) == pytest.approx(0.5)
+
+
+def test_aggregate_pass_at_k(tmp_path, mock_resolved_instance, mock_unresolved_instance):
+    sample_dirs = [tmp_path / f"agent__sample_{i}" for i in range(3)]
+    for sample_dir in sample_dirs:
+        sample_dir.mkdir()
+    # Every candidate of the unresolved instance fails, the resolved instance stopped early
+    for sample_dir in sample_dirs:
+        store_instance_level_output(mock_unresolved_instance, str(sample_dir))
+    store_instance_level_output(mock_resolved_instance, str(sample_dirs[0]))
+
+    report = aggregate_pass_at_k(str(tmp_path))["agent"]
+
+    assert report["candidates"] == 3
+    assert report["early_exit_instances"] == ["resolved_test_instance"]
+    assert report["pass@1"] is None
+    assert report["undecided@1"] == ["resolved_test_instance"]
+    assert report["pass@3"] == 0.5
+    assert json.load(open(tmp_path / "pass_at_k.json")) == {"agent": report}
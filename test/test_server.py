@@ -0,0 +1,118 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import pandas as pd
+import pytest
+
+from poly_bench_evaluation.benchmark import (
+    SimulatedDockerClient,
+    prepare_repos,
+    synthetic_profiles,
+    write_dataset,
+)
+from poly_bench_evaluation.polybench_data import load_dataset_file
+from poly_bench_evaluation.server import EvaluationService
+
+
+def _request(url, body=None):
+    data = json.dumps(body).encode() if body is not None else None
+    with urllib.request.urlopen(urllib.request.Request(url, data=data)) as response:
+        return response.status, json.loads(response.read())
+
+
+def test_service_evaluates_submitted_patches(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    profiles = [p for p in synthetic_profiles(12, seed=3) if p.build_failures == 0][:2]
+    commits = prepare_repos(tmp_path / "repos", [p.repo for p in profiles])
+    write_dataset(profiles, commits, tmp_path / "dataset.csv")
+    dataset = pd.read_csv(tmp_path / "dataset.csv")
+    client = SimulatedDockerClient(profiles, time_scale=0)
+
+    service = EvaluationService(
+        dataset=dataset,
+        repo_path=str(tmp_path / "repos"),
+        client=client,
+        num_threads=2,
+        result_cache_path=None,
+        history_path=str(tmp_path / "history.sqlite"),
+    )
+    service.serve(port=0)
+    url = f"http://127.0.0.1:{service._server.server_port}"
+    try:
+        job_ids = []
+        for profile, row in zip(profiles, dataset.itertuples()):
+            status, job = _request(
+                f"{url}/jobs", {"instance_id": profile.instance_id, "model_patch": row.patch}
+            )
+            assert status == 202
+            job_ids.append(job["job_id"])
+
+        for profile, job_id in zip(profiles, job_ids):
+            status, job = _request(f"{url}/jobs/{job_id}?wait=60")
+            assert job["status"] == "done", job["error"]
+            assert job["result"]["resolved"] == (profile.resolved and not profile.run_error)
+            assert job["metrics"]["instance_id"] == profile.instance_id
+
+        with pytest.raises(urllib.error.HTTPError) as error:
+            _request(f"{url}/jobs", {"instance_id": "unknown", "model_patch": ""})
+        assert error.value.code == 404
+        with pytest.raises(urllib.error.HTTPError) as error:
+            _request(f"{url}/jobs", {"instance_id": profiles[0].instance_id})
+        assert error.value.code == 400
+        # A further job of an instance runs in its warm container
+        _, job = _request(
+            f"{url}/jobs", {"instance_id": profiles[0].instance_id, "model_patch": dataset.patch[0]}
+        )
+        assert _request(f"{url}/jobs/{job['job_id']}?wait=60")[1]["status"] == "done"
+        assert client.operations["container_create"] == 2
+        health = _request(f"{url}/health")[1]
+        assert health["jobs"] == {"done": 3}
+        assert health["containers"]["hits"] == 1
+        assert health["containers"]["warm_containers"] == 2
+    finally:
+        service.shutdown()
+    assert client.operations["container_remove"] == 2
+
+
+def test_jobs_of_an_instance_wait_without_a_thread(tmp_path):
+    profiles = synthetic_profiles(2, seed=3)
+    commits = prepare_repos(tmp_path / "repos", [p.repo for p in profiles])
+    write_dataset(profiles, commits, tmp_path / "dataset.csv")
+    # The service loads json datasets like evaluate_predictions does
+    pd.read_csv(tmp_path / "dataset.csv").to_json(tmp_path / "dataset.json")
+    service = EvaluationService(
+        dataset=load_dataset_file(str(tmp_path / "dataset.json")),
+        repo_path=str(tmp_path / "repos"),
+        client=SimulatedDockerClient(profiles, time_scale=0),
+        num_threads=2,
+        warm_containers=0,
+    )
+    assert set(service.instances) == {p.instance_id for p in profiles}
+
+    release = threading.Event()
+    evaluated = []
+
+    def evaluate(job):
+        evaluated.append(job.job_id)
+        if len(evaluated) == 1:
+            release.wait(60)
+        job.status = "done"
+        job.done.set()
+
+    service._evaluate = evaluate
+    try:
+        first, second = (p.instance_id for p in profiles)
+        blocked = service.submit(first, "")
+        queued = service.submit(first, "")
+        # The queued job of the busy instance leaves the other thread to another instance
+        other = service.submit(second, "")
+        assert other.done.wait(60)
+        assert queued.status == "queued"
+        release.set()
+        assert queued.done.wait(60)
+        assert evaluated == [blocked.job_id, other.job_id, queued.job_id]
+    finally:
+        release.set()
+        service.shutdown()
@@ -0,0 +1,129 @@
+import json
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from poly_bench_evaluation.polybench_data import PolyBenchOutput, PolyBenchRetrievalMetrics
+from poly_bench_evaluation.scoring import store_instance_level_output
+from poly_bench_evaluation.sharding import merge_shards, shard_dataset, write_shard_manifest
+
+
+@pytest.fixture
+def dataset():
+    languages = ["Java", "Python", "TypeScript", "JavaScript"]
+    return pd.DataFrame(
+        {
+            "instance_id": [f"instance_{i}" for i in range(40)],
+            "repo": ["some/repo"] * 40,
+            "language": [languages[i % 4] for i in range(40)],
+            "task_category": ["Bug Fix"] * 40,
+        }
+    )
+
+
+def test_shards_partition_the_dataset_deterministically(dataset):
+    shards = [shard_dataset(dataset, index, 3) for index in range(3)]
+
+    ids = [instance_id for shard in shards for instance_id in shard["instance_id"]]
+    assert sorted(ids) == sorted(dataset["instance_id"])
+    # The partition doesn't depend on the row order
+    shuffled = dataset.sample(frac=1, random_state=0)
+    assert set(shard_dataset(shuffled, 1, 3)["instance_id"]) == set(shards[1]["instance_id"])
+
+    durations = {"Java": 1500, "Python": 550, "TypeScript": 1500, "JavaScript": 800}
+    loads = [sum(durations[language] for language in shard["language"]) for shard in shards]
+    assert max(loads) - min(loads) <= max(durations.values())
+
+
+def test_shards_without_predictions_cost_nothing(dataset):
+    predicted = {"instance_0", "instance_1"}
+    shards = [shard_dataset(dataset, index, 2, predicted=predicted) for index in range(2)]
+
+    assert [len(set(shard["instance_id"]) & predicted) for shard in shards] == [1, 1]
+    with pytest.raises(ValueError):
+        shard_dataset(dataset, 2, 2)
+
+
+def _store_result(result_path, instance_id, resolved):
+    store_instance_level_output(
+        PolyBenchOutput(instance_id, True, True, True, resolved, resolved, resolved, [], []),
+        result_path=str(result_path),
+    )
+    store_instance_level_output(
+        PolyBenchRetrievalMetrics(
+            instance_id, {"recall": 1.0, "precision": 1.0, "f1": 1.0}, None, None, None
+        ),
+        result_path=str(result_path),
+        suffix="_metrics",
+    )
+
+
+def test_merge_shards(dataset, tmp_path):
+    dataset_path = tmp_path / "dataset.csv"
+    dataset.head(3).to_csv(dataset_path, index=False)
+    shard_0, shard_1 = tmp_path / "shard_0", tmp_path / "shard_1"
+    write_shard_manifest(str(shard_0), 0, 2, ["instance_0", "instance_1"])
+    write_shard_manifest(str(shard_1), 1, 2, ["instance_2"])
+    _store_result(shard_0, "instance_0", resolved=True)
+    _store_result(shard_1, "instance_2", resolved=False)
+    output = tmp_path / "merged"
+
+    with pytest.raises(ValueError, match="instance_1"):
+        merge_shards([str(shard_0), str(shard_1)], str(output), str(dataset_path))
+
+    _store_result(shard_0, "instance_1", resolved=True)
+    gaps = merge_shards([str(shard_0), str(shard_1)], str(output), str(dataset_path))
+
+    assert gaps == []
+    with open(output / "result.json") as f:
+        aggregate = json.load(f)
+    assert sorted(aggregate["resolved"]) == ["instance_0", "instance_1"]
+    assert aggregate["not_resolved"] == ["instance_2"]
+
+    # A result stored by two shards is a duplicate
+    _store_result(shard_1, "instance_1", resolved=False)
+    with pytest.raises(ValueError, match="several shards"):
+        merge_shards([str(shard_0), str(shard_1)], str(tmp_path / "again"), str(dataset_path))
+
+
+def test_merge_shards_with_missing_shard(dataset, tmp_path):
+    dataset_path = tmp_path / "dataset.csv"
+    dataset.head(1).to_csv(dataset_path, index=False)
+    shard_0 = tmp_path / "shard_0"
+    write_shard_manifest(str(shard_0), 0, 2, ["instance_0"])
+    _store_result(shard_0, "instance_0", resolved=True)
+
+    with pytest.raises(ValueError, match="shards \\[1\\]"):
+        merge_shards([str(shard_0)], str(tmp_path / "merged"), str(dataset_path))
+    assert (
+        merge_shards([str(shard_0)], str(tmp_path / "merged"), str(dataset_path), allow_gaps=True)
+        == []
+    )
+    assert Path(tmp_path / "merged" / "result.json").exists()
+
+
+def test_merge_shards_with_early_exit(dataset, tmp_path):
+    dataset_path = tmp_path / "dataset.csv"
+    dataset.head(2).to_csv(dataset_path, index=False)
+    shard_0, shard_1 = tmp_path / "shard_0", tmp_path / "shard_1"
+    write_shard_manifest(str(shard_0), 0, 2, ["instance_0"])
+    write_shard_manifest(str(shard_1), 1, 2, ["instance_1"])
+    for shard, instance_id in ((shard_0, "instance_0"), (shard_1, "instance_1")):
+        _store_result(shard / "agent__sample_0", instance_id, resolved=True)
+    _store_result(shard_1 / "agent__sample_1", "instance_1", resolved=False)
+    # The second candidate of instance_0 was skipped, its pass@2 is decided
+    (shard_0 / "agent__sample_1").mkdir()
+    (shard_0 / "agent__sample_1" / "instance_0_skipped.json").write_text(
+        json.dumps({"instance_id": "instance_0", "early_exit": True})
+    )
+    output = tmp_path / "merged"
+
+    assert merge_shards([str(shard_0), str(shard_1)], str(output), str(dataset_path)) == []
+
+    assert (output / "agent__sample_1" / "instance_0_skipped.json").exists()
+    with open(output / "pass_at_k.json") as f:
+        report = json.load(f)["agent"]
+    assert report["early_exit_instances"] == ["instance_0"]
+    assert report["undecided@1"] == ["instance_0"]
+    assert report["pass@2"] == 1.0
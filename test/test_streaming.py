@@ -0,0 +1,87 @@
+import json
+import threading
+import time
+
+import pandas as pd
+
+from poly_bench_evaluation.run_evaluation import _followed_states
+from poly_bench_evaluation.streaming import END_MARKER, follow_predictions
+
+
+def _write_slowly(path, pieces):
+    time.sleep(0.05)
+    with open(path, "a") as f:
+        for piece in pieces:
+            f.write(piece)
+            f.flush()
+            time.sleep(0.05)
+
+
+def test_follow_predictions_until_end_marker(tmp_path):
+    path = tmp_path / "predictions.jsonl"
+    first = json.dumps({"instance_id": "a", "model_patch": "patch a"})
+    pieces = [
+        first[:10],
+        first[10:] + "\n",
+        "not json\n",
+        json.dumps({"instance_id": "b"}) + "\n",
+        json.dumps({"instance_id": "a", "model_patch": "again"}) + "\n",
+        json.dumps({"instance_id": "c", "model_patch": None}) + "\n",
+        json.dumps({END_MARKER: True}) + "\n",
+        json.dumps({"instance_id": "d", "model_patch": "after the end"}) + "\n",
+    ]
+    writer = threading.Thread(target=_write_slowly, args=(path, pieces))
+    writer.start()
+
+    predictions = list(follow_predictions(str(path), poll_interval=0.01, idle_timeout=5))
+    writer.join()
+
+    assert predictions == [
+        {"instance_id": "a", "model_patch": "patch a"},
+        {"instance_id": "c", "model_patch": ""},
+    ]
+
+
+def test_follow_predictions_finalizes_when_the_file_stops_growing(tmp_path):
+    path = tmp_path / "predictions.jsonl"
+    path.write_text(json.dumps({"instance_id": "a", "model_patch": "patch a"}))
+
+    started_at = time.monotonic()
+    predictions = list(follow_predictions(str(path), poll_interval=0.01, idle_timeout=0.2))
+
+    assert predictions == [{"instance_id": "a", "model_patch": "patch a"}]
+    assert time.monotonic() - started_at < 5
+
+
+def test_followed_states_skip_unknown_instances(tmp_path):
+    path = tmp_path / "predictions.jsonl"
+    path.write_text(
+        "\n".join(
+            json.dumps(prediction)
+            for prediction in [
+                {"instance_id": "unknown", "model_patch": "patch"},
+                {"instance_id": "a", "model_patch": "patch a"},
+                {END_MARKER: True},
+            ]
+        )
+        + "\n"
+    )
+    dataset = pd.DataFrame(
+        {
+            "instance_id": ["a", "b"],
+            "patch": ["gold"] * 2,
+            "test_patch": ["test"] * 2,
+            "repo": ["google/gson"] * 2,
+            "base_commit": ["abc"] * 2,
+            "language": ["Java"] * 2,
+            "Dockerfile": ["FROM java"] * 2,
+            "F2P": ["['t1']"] * 2,
+            "P2P": ["[]"] * 2,
+            "test_command": ["mvn test"] * 2,
+            "modified_nodes": ["[]"] * 2,
+        }
+    )
+
+    states = list(_followed_states(str(path), dataset, idle_timeout=5))
+
+    assert [(s.instance.instance_id, s.instance.model_patch) for s in states] == [("a", "patch a")]
@@ -0,0 +1,32 @@
+import json
+
+import pytest
+
+from poly_bench_evaluation.tracing import Tracer
+
+
+def test_spans_are_logged_and_exported(tmp_path):
+    tracer = Tracer(jsonl_path=str(tmp_path / "events.jsonl"))
+    seen = []
+    tracer.add_listener(seen.append)
+
+    with tracer.span("docker_build", instance_id="gson-1", language="Java"):
+        pass
+    with pytest.raises(ValueError):
+        with tracer.span("docker_run", instance_id="gson-1"):
+            raise ValueError("boom")
+
+    assert [span.name for span in seen] == ["docker_build", "docker_run"]
+    assert seen[1].error == "ValueError: boom"
+
+    events = [json.loads(line) for line in (tmp_path / "events.jsonl").read_text().splitlines()]
+    assert [event["name"] for event in events] == ["docker_build", "docker_run"]
+    assert events[0]["attributes"] == {"instance_id": "gson-1", "language": "Java"}
+    assert events[0]["duration"] >= 0
+
+    tracer.export_chrome_trace(str(tmp_path / "trace.json"))
+    trace = json.loads((tmp_path / "trace.json").read_text())
+    complete = [event for event in trace["traceEvents"] if event["ph"] == "X"]
+    assert [event["name"] for event in complete] == ["docker_build", "docker_run"]
+    assert complete[0]["cat"] == "Java"
+    assert complete[1]["args"]["error"] == "ValueError: boom"